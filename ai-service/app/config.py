@@ -5,7 +5,61 @@ class Settings(BaseSettings):
     redis_url: str = os.getenv("REDIS_URL", "redis://redis:6379")
     redis_stream: str = "metrics:raw"
     redis_group: str = "ai_service_group"
-    
+    # Max entries fetched per XREADGROUP call
+    stream_read_count: int = 500
+
+    # Metric micro-batching: score all metrics of a read (or of a time/size
+    # window when metric_batch_window_ms > 0) in one vectorized pass
+    metric_batch_enabled: bool = True
+    metric_batch_size: int = 500
+    metric_batch_window_ms: int = 0
+
+    # Consumer worker lanes: metrics (fast) and alerts (slow, LLM bound).
+    # max_in_flight counts queued + running items (batches for metrics);
+    # alerts beyond it stay pending in the consumer group until there is room.
+    # The alert lane hands alerts out by priority and runs at least
+    # llm_concurrency_max + llm_queue_max_waiting workers.
+    metric_lane_workers: int = 4
+    metric_lane_max_in_flight: int = 16
+    alert_lane_workers: int = 2
+    alert_lane_max_in_flight: int = 500
+
+    # Write-behind buffer for ai_analysis_results: rows are COPYed in bulk
+    # every analysis_flush_rows rows or analysis_flush_interval_ms, and
+    # stream messages are ACKed after their rows are committed
+    analysis_flush_rows: int = 500
+    analysis_flush_interval_ms: int = 200
+    analysis_buffer_max_rows: int = 20000
+
+    # Dedup state cache: last analysis per (alertname, instance) in process
+    # memory (trusted for dedup_cache_local_ttl seconds) and a Redis hash
+    dedup_cache_hash: str = "dedup:state"
+    dedup_cache_max_entries: int = 50000
+    dedup_cache_local_ttl: float = 5.0
+    # Firing alert ids kept per alert_state row for recovery resolution
+    alert_state_max_firing: int = 1000
+    # Deduplicate the alerts of each stream read together (one state lookup
+    # and one transaction per batch instead of per alert)
+    alert_batch_dedup_enabled: bool = True
+
+    # Near-duplicate alerts: MinHash signatures of the masked description and
+    # labels, LSH indexed in memory and Redis; a first occurrence at least
+    # similarity_threshold similar to a recent analysis reuses it
+    similarity_enabled: bool = True
+    similarity_threshold: float = 0.8
+    similarity_num_perm: int = 64
+    similarity_bands: int = 16
+    similarity_ttl_seconds: int = 3600
+    similarity_max_entries: int = 10000
+    similarity_prefix: str = "dedup:lsh"
+
+    # LLM result cache keyed by the normalized prompt inputs (alertname,
+    # technology hint, severity, reason, masked description)
+    llm_cache_enabled: bool = True
+    llm_cache_ttl_seconds: int = 3600
+    llm_cache_max_entries: int = 1000
+    llm_cache_prefix: str = "llm:cache"
+
     postgres_host: str = os.getenv("DB_HOST", "postgresql")
     postgres_port: str = os.getenv("DB_PORT", "5432")
     postgres_user: str = os.getenv("DB_USER", "enod_user")
@@ -14,8 +68,129 @@ class Settings(BaseSettings):
     
     ollama_host: str = os.getenv("OLLAMA_HOST", "ollama")
     ollama_port: str = os.getenv("OLLAMA_PORT", "11434")
+    # Pooled keep-alive HTTP client for Ollama (seconds)
+    ollama_connect_timeout: float = 10.0
+    ollama_read_timeout: float = 480.0
+    ollama_pool_size: int = 4
+    ollama_keepalive_timeout: float = 60.0
+    # Stream tokens and stop at the end of the JSON answer
+    ollama_stream: bool = True
+    # Adaptive (AIMD) limit of parallel generations: cut by
+    # llm_concurrency_backoff on errors or when smoothed latency exceeds
+    # llm_latency_tolerance x baseline, otherwise grown by +1 per limit calls
+    llm_concurrency_initial: int = 2
+    llm_concurrency_min: int = 1
+    llm_concurrency_max: int = 4
+    llm_concurrency_backoff: float = 0.75
+    llm_latency_tolerance: float = 2.0
+    # Seconds an analysis may wait for a slot before it gets a templated
+    # result, and the waiting jobs kept before the lowest priority is shed
+    llm_deadline_critical_seconds: float = 600.0
+    llm_deadline_warning_seconds: float = 300.0
+    llm_deadline_info_seconds: float = 120.0
+    llm_queue_max_waiting: int = 50
     
     model_path: str = "/app/models/isolation_forest.joblib"
+    # Versioned models published through model_versions (shared storage)
+    model_dir: str = "/app/models"
+    model_updates_channel: str = "models:updates"
+    # Load models from their memory-mapped .npy artifact (one page-cached
+    # copy shared by every process on the host) instead of unpickling them
+    model_mmap: bool = True
+
+    # Per-series models: one forest per metric_name (+ optional labels,
+    # comma-separated), lazily loaded into a memory-bounded LRU cache
+    series_model_dir: str = "/app/models/series"
+    model_series_labels: str = ""
+    model_cache_max_mb: int = 512
+    min_series_points: int = 50
+
+    # Model fitting in worker processes; training data is handed over as a
+    # temporary .npy file (default: /dev/shm when available)
+    training_workers: int = 2
+    training_tmp_dir: str = ""
+
+    # Training data is streamed from Postgres ("copy" or "cursor") into
+    # bounded arrays; larger windows are reservoir-sampled down to the budget
+    training_load_method: str = "copy"
+    training_window_hours: float = 168.0
+    # Per-metric windows, e.g. "cpu_usage=24,disk_free_bytes=720"
+    training_series_windows: str = ""
+    training_row_budget: int = 1000000
+    series_row_budget: int = 50000
+    # TABLESAMPLE SYSTEM percentage for the global model (0 = off)
+    training_sample_percent: float = 0.0
+    training_query_timeout: float = 600.0
+
+    # Streaming per-series features (value, delta, rate, z-score over the
+    # last feature_window points). When enabled, new models are trained on
+    # feature vectors; models trained on raw values keep scoring raw values.
+    model_features_enabled: bool = False
+    feature_window: int = 60
+    feature_max_series: int = 50000
+
+    # Streaming statistical detectors (ewma, holt, mad, cusum) per metric,
+    # e.g. "cpu_usage=ewma,http_errors=cusum"; other metrics use the forest
+    detector_backends: str = ""
+
+    # Sliding-window incremental updates between full retrains: every
+    # interval, fit a few new trees on the newest window and retire the
+    # oldest ones, keeping at most incremental_max_trees
+    incremental_training_enabled: bool = True
+    incremental_interval_minutes: int = 15
+    incremental_window_minutes: int = 60
+    incremental_trees: int = 10
+    incremental_max_trees: int = 100
+    # Inactive model versions kept on disk (older ones are pruned)
+    model_keep_versions: int = 24
+
+    # Evaluation replays the newest window through the active model and the
+    # newest candidates; full retrains leave that window out (holdout)
+    evaluation_window_hours: float = 6.0
+    evaluation_holdout: bool = True
+    evaluation_row_budget: int = 200000
+    evaluation_batch_size: int = 500
+    evaluation_candidates: int = 3
+    # Log a regression when a candidate's p99 exceeds the active one's by this factor
+    evaluation_latency_regression: float = 1.5
+
+    # Shadow mode: retrained (and incrementally updated) models become
+    # candidates that score a sample of live batches in the background, and
+    # are promoted only if they agree with the active model and are not
+    # slower than the allowed ratio; incremental updates wait for the verdict
+    shadow_enabled: bool = True
+    shadow_sample_rate: float = 0.1
+    shadow_min_points: int = 10000
+    shadow_min_agreement: float = 0.98
+    shadow_max_latency_ratio: float = 1.2
+    shadow_max_hours: float = 24.0
+    shadow_review_minutes: int = 5
+
+    # Backfill of metrics.model_anomaly with the active model: every interval,
+    # score up to backfill_max_rows new rows in id ranges of backfill_batch_size,
+    # after rescanning the last backfill_batch_size ids for rows committed late
+    backfill_enabled: bool = True
+    backfill_interval_minutes: int = 10
+    backfill_batch_size: int = 50000
+    backfill_max_rows: int = 2000000
+
+    @property
+    def detector_backend_map(self) -> dict:
+        backends = {}
+        for item in self.detector_backends.split(','):
+            if '=' in item:
+                name, backend = item.split('=', 1)
+                backends[name.strip()] = backend.strip().lower()
+        return backends
+
+    @property
+    def training_series_window_map(self) -> dict:
+        windows = {}
+        for item in self.training_series_windows.split(','):
+            if '=' in item:
+                name, hours = item.split('=', 1)
+                windows[name.strip()] = float(hours)
+        return windows
 
     @property
     def database_url(self) -> str:
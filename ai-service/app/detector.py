@@ -1,17 +1,93 @@
-import asyncio
-import json
+import os
+import time
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from loguru import logger
 from app.models.isolation_forest import IsolationForestWrapper
+from app.models.registry import ModelRegistry
+from app.models.shadow import ShadowScorer
+from app.models.streaming import build_backends
+from app.models.training import TrainingEngine
+from app.models.training_data import TrainingDataLoader
 from app.config import get_settings
-from app.database import get_db_pool
+from app.features import FEATURE_NAMES, FeatureEngine
 
 class AnomalyDetector:
     def __init__(self):
         self.settings = get_settings()
-        self.model = IsolationForestWrapper(self.settings.model_path)
+        # Global model, used for series without a model of their own.
+        # model/model_version are only ever replaced as a whole (see swap_model),
+        # never retrained in place, so scoring never sees a half-trained model.
+        self.model = IsolationForestWrapper(self.settings.model_path, mmap=self.settings.model_mmap)
         self.model.load()
+        self.model_version = "if_v1"
+        # Per-series models (metric_name + optional label subset)
+        self.registry = ModelRegistry(
+            self.settings.series_model_dir,
+            self.settings.model_cache_max_mb * 1024 * 1024,
+            self.settings.model_series_labels.split(','),
+            mmap=self.settings.model_mmap
+        )
+        # Training data is streamed with bounded memory; fitting runs in
+        # worker processes, off the event loop
+        self.training_loader = TrainingDataLoader(
+            method=self.settings.training_load_method,
+            query_timeout=self.settings.training_query_timeout
+        )
+        self.training_engine = TrainingEngine(self.settings.training_workers, self.settings.training_tmp_dir)
+        # Rolling per-series features (delta, rate, z-score) for models
+        # trained on feature vectors instead of the raw value
+        self.features = FeatureEngine(self.settings.feature_window, self.settings.feature_max_series)
+        # Streaming statistical backends selected per metric_name
+        self.backends = build_backends(self.settings.detector_backend_map, self.settings.feature_max_series)
+        # Candidate global model scoring sampled batches in the background
+        self.shadow = ShadowScorer(
+            sample_rate=self.settings.shadow_sample_rate,
+            min_points=self.settings.shadow_min_points,
+            min_agreement=self.settings.shadow_min_agreement,
+            max_latency_ratio=self.settings.shadow_max_latency_ratio,
+            max_hours=self.settings.shadow_max_hours
+        )
+
+    def swap_model(self, model: IsolationForestWrapper, version: str):
+        """
+        Atomically replace the global model. Runs on the event loop thread,
+        and detection never awaits mid-scoring, so no call sees a mix of
+        the old and the new model.
+        """
+        self.model_version = version
+        self.model = model
+
+    def _series_key(self, metric_data: Dict[str, Any]):
+        return self.registry.series_key(metric_data.get('metric_name'), metric_data.get('labels'))
+
+    def _model_for(self, key):
+        """Per-series model if one was trained, global model otherwise"""
+        return self.registry.get(key) or self.model
+
+    def _version_for(self, key, model) -> str:
+        """model_version of the model that scored a point"""
+        return self.model_version if model is self.model else self.registry.version_for(key)
+
+    def _feature_window(self) -> Optional[int]:
+        """Feature window new models are trained with (None = raw values)"""
+        return self.settings.feature_window if self.settings.model_features_enabled else None
+
+    def _point_features(self, metric_data: Dict[str, Any], value: float, model) -> np.ndarray:
+        """
+        Input row for one point: its feature vector whenever features are
+        in use (so series windows stay warm for a model switch, and feature
+        candidates can be shadowed), [value] otherwise. The value is always
+        column 0; see _inputs_for.
+        """
+        if model.n_features == len(FEATURE_NAMES) or self.settings.model_features_enabled:
+            return self.features.update_point(metric_data, value)
+        return np.array([value])
+
+    @staticmethod
+    def _inputs_for(model, X: np.ndarray) -> np.ndarray:
+        """Columns of X a model scores: all features, or just the raw value"""
+        return X if model.n_features == X.shape[1] else X[:, :1]
 
     async def detect(self, metric_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -29,21 +105,31 @@ class AnomalyDetector:
                 logger.warning(f"Non-finite metric value detected: {value}")
                 return {"is_anomaly": False, "error": "Non-finite value"}
 
-            # Simple feature: [value]
-            features = np.array([[value]])
+            backend = self.backends.get(metric_data.get('metric_name'))
+            if backend is not None:
+                score, is_anomaly = backend.update(FeatureEngine.series_key(metric_data), value)
+                return {
+                    "is_anomaly": bool(is_anomaly),
+                    "anomaly_score": float(score),
+                    "model_version": backend.name
+                }
+
+            key = self._series_key(metric_data)
+            model = self._model_for(key)
+            features = self._inputs_for(model, self._point_features(metric_data, value, model).reshape(1, -1))
             
             # Handle NaN in numpy array just in case
             features = np.nan_to_num(features)
             
-            prediction = self.model.predict(features)[0]
-            score = self.model.score_samples(features)[0]
+            prediction = model.predict(features)[0]
+            score = model.score_samples(features)[0]
             
             is_anomaly = prediction == -1
             
             return {
                 "is_anomaly": bool(is_anomaly),
                 "anomaly_score": float(score),
-                "model_version": "if_v1"
+                "model_version": self._version_for(key, model)
             }
         except ValueError as e:
             logger.error(f"Value error in detection: {e}")
@@ -52,34 +138,193 @@ class AnomalyDetector:
             logger.error(f"Detection error: {e}")
             return {"is_anomaly": False, "error": str(e)}
 
-    async def train_model(self):
+    async def detect_batch(self, metrics: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Fetch historical data from DB and retrain the model.
+        Detect anomalies for a batch of metric points in one vectorized pass.
+        Returns one result per input, in the same order, using the same
+        result format as detect().
+        """
+        results: List[Dict[str, Any]] = [None] * len(metrics)
+        # id(model) -> (model, version, positions, values); series without
+        # their own model share a single pass through the global model
+        groups: Dict[int, tuple] = {}
+        models: Dict[Any, Any] = {}
+        # id(backend) -> (backend, positions, (series key, value) pairs)
+        streamed: Dict[int, tuple] = {}
+
+        for i, metric_data in enumerate(metrics):
+            raw_value = metric_data.get('metric_value')
+            if raw_value is None:
+                results[i] = {"is_anomaly": False, "error": "Missing metric_value"}
+                continue
+            try:
+                value = float(raw_value)
+            except (TypeError, ValueError):
+                results[i] = {"is_anomaly": False, "error": "Invalid value"}
+                continue
+            if not np.isfinite(value):
+                results[i] = {"is_anomaly": False, "error": "Non-finite value"}
+                continue
+            backend = self.backends.get(metric_data.get('metric_name'))
+            if backend is not None:
+                _, positions, items = streamed.setdefault(id(backend), (backend, [], []))
+                positions.append(i)
+                items.append((FeatureEngine.series_key(metric_data), value))
+                continue
+            key = self._series_key(metric_data)
+            if key not in models:
+                models[key] = self._model_for(key)
+            model = models[key]
+            _, _, positions, values = groups.setdefault(
+                id(model), (model, self._version_for(key, model), [], [])
+            )
+            positions.append(i)
+            values.append(self._point_features(metric_data, value, model))
+
+        # One vectorized pass per model
+        for model, version, positions, values in groups.values():
+            try:
+                features = np.array(values, dtype=np.float64)
+                start = time.perf_counter()
+                scores, predictions = model.score_and_predict(self._inputs_for(model, features))
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                logger.error(f"Batch detection error: {e}")
+                for i in positions:
+                    results[i] = {"is_anomaly": False, "error": str(e)}
+                continue
+
+            for i, score, prediction in zip(positions, scores, predictions):
+                results[i] = {
+                    "is_anomaly": bool(prediction == -1),
+                    "anomaly_score": float(score),
+                    "model_version": version
+                }
+
+            if model is self.model and self.shadow.active:
+                self.shadow.observe(features, scores, predictions, elapsed)
+
+        # Streaming backends score point by point, in stream order
+        for backend, positions, items in streamed.values():
+            scores, predictions = backend.score_batch(items)
+            for i, score, prediction in zip(positions, scores, predictions):
+                results[i] = {
+                    "is_anomaly": bool(prediction == -1),
+                    "anomaly_score": float(score),
+                    "model_version": backend.name
+                }
+        return results
+
+    async def train_model(self, model_path: Optional[str] = None, series: bool = True) -> Optional[IsolationForestWrapper]:
+        """
+        Fetch historical data from DB and train a new global model.
+
+        The new model is saved at model_path and returned. Without a
+        model_path it is saved over settings.model_path and swapped in
+        immediately; otherwise publishing it is up to the caller.
+
+        Args:
+            series: Also retrain the per-series models. They go live at
+                once, so shadow candidates are trained without them.
         """
         logger.info("Starting model retraining task...")
         try:
-            pool = await get_db_pool()
-            async with pool.acquire() as conn:
-                # Fetch last 10000 points
-                # Use timeout to prevent long running queries
-                rows = await conn.fetch("""
-                    SELECT metric_value FROM metrics 
-                    ORDER BY timestamp DESC LIMIT 10000
-                """)
-                
-                if not rows:
-                    logger.warning("No data found for training")
-                    return
+            # Stream a bounded (reservoir-sampled) set of points across all metrics
+            data = await self.training_loader.load(
+                window_hours=self.settings.training_window_hours,
+                row_budget=self.settings.training_row_budget,
+                sample_percent=self.settings.training_sample_percent or None,
+                feature_window=self._feature_window(),
+                holdout_hours=self.settings.evaluation_window_hours if self.settings.evaluation_holdout else None
+            )
 
-                # Convert to numpy array and handle potential NULLs
-                data = np.array([[r['metric_value'] if r['metric_value'] is not None else 0.0] for r in rows])
-                
-                # Check for NaNs
-                data = np.nan_to_num(data)
-                
-                # Run training in executor to avoid blocking event loop
-                loop = asyncio.get_running_loop()
-                await loop.run_in_executor(None, self.model.train, data)
+            if len(data) == 0:
+                logger.warning("No data found for training")
+                return None
+
+            if data.ndim == 1:
+                data = data.reshape(-1, 1)
+
+            # Fit in a worker process so the event loop keeps consuming.
+            # Train a fresh model; the live one keeps scoring meanwhile.
+            model = await self.training_engine.train(data, model_path or self.settings.model_path)
+            if model_path is None:
+                self.swap_model(model, self.model_version)
+
+            if series:
+                await self.train_series_models()
+
+            return model
                 
         except Exception as e:
-            logger.error(f"Training failed: {e}")
\ No newline at end of file
+            logger.error(f"Training failed: {e}")
+            return None
+
+    async def update_model(self, model_path: str) -> Optional[IsolationForestWrapper]:
+        """
+        Incrementally update the global model with the newest window of
+        data (new trees in, oldest trees out) and save it at model_path.
+        Publishing the result is up to the caller.
+        """
+        try:
+            # New trees must take the same input as the trees they join
+            uses_features = self.model.n_features == len(FEATURE_NAMES)
+            data = await self.training_loader.load(
+                window_hours=self.settings.incremental_window_minutes / 60,
+                row_budget=self.settings.training_row_budget,
+                feature_window=self.settings.feature_window if uses_features else None
+            )
+
+            if len(data) < self.settings.min_series_points:
+                logger.info(f"Skipping incremental update: only {len(data)} new points")
+                return None
+
+            if data.ndim == 1:
+                data = data.reshape(-1, 1)
+
+            return await self.training_engine.update(
+                data,
+                self.model.model_path,
+                model_path,
+                self.settings.incremental_trees,
+                self.settings.incremental_max_trees
+            )
+
+        except Exception as e:
+            logger.error(f"Incremental update failed: {e}")
+            return None
+
+    async def train_series_models(self):
+        """
+        Train per-series models, for series with enough history.
+        Series are loaded and fitted in waves, so only a few datasets are
+        in memory at a time.
+        """
+        series = await self.training_loader.list_series(
+            self.settings.training_window_hours,
+            self.registry.series_labels
+        )
+        if not series:
+            return
+
+        os.makedirs(self.registry.model_dir, exist_ok=True)
+        wave_size = self.training_engine.max_workers * 4
+
+        for start in range(0, len(series), wave_size):
+            loaded = await self.training_loader.load_series(
+                series[start:start + wave_size],
+                self.settings.training_series_window_map,
+                self.settings.training_window_hours,
+                self.settings.series_row_budget,
+                self._feature_window()
+            )
+
+            datasets = {}
+            for metric_name, labels, values in loaded:
+                key = self.registry.series_key(metric_name, labels)
+                if len(values) >= self.settings.min_series_points:
+                    datasets[key] = (values, self.registry.path_for(key))
+
+            # Each wave is fitted in parallel across the worker processes
+            for key, series_model in (await self.training_engine.train_many(datasets)).items():
+                self.registry.put(key, series_model)
@@ -0,0 +1,212 @@
+"""
+Streaming per-series feature engine
+===================================
+
+Scoring a point on its raw value alone misses spikes that are normal in
+absolute terms but extreme for their own series. The feature engine keeps
+a small, preallocated ring buffer of recent values per series (metric_name
+plus labels) and turns every new point into a feature vector in O(1):
+
+- value
+- delta: change since the previous point
+- rate: delta per second
+- zscore: distance from the mean of the previous `window` points, in
+  standard deviations (sliding-window Welford)
+
+compute_features() derives the same features from historical data in one
+vectorized pass, so models are trained on exactly what they score.
+"""
+import json
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+FEATURE_NAMES = ("value", "delta", "rate", "zscore")
+
+# Standard deviations this small (relative to the mean) are treated as a
+# flat series, so float noise never turns into a huge z-score
+STD_EPSILON = 1e-9
+
+
+def _zscore(value: float, mean: float, std: float) -> float:
+    if std <= STD_EPSILON * (abs(mean) + 1.0):
+        return 0.0
+    return (value - mean) / std
+
+
+class SeriesWindow:
+    """
+    Fixed-size ring buffer of one series' recent values, with running
+    mean and sum of squared deviations (sliding-window Welford)
+    """
+
+    __slots__ = ("values", "size", "head", "count", "mean", "m2", "last_value", "last_timestamp")
+
+    def __init__(self, size: int):
+        self.values = np.empty(size, dtype=np.float64)
+        self.size = size
+        self.head = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last_value = None
+        self.last_timestamp = None
+
+    def features(self, value: float, timestamp: float) -> Tuple[float, float, float, float]:
+        """Features of a new point relative to the window (before it is pushed)"""
+        if self.last_value is None:
+            return value, 0.0, 0.0, 0.0
+
+        delta = value - self.last_value
+        elapsed = timestamp - self.last_timestamp
+        rate = delta / elapsed if elapsed > 0 else 0.0
+        zscore = 0.0
+        if self.count >= 2:
+            zscore = _zscore(value, self.mean, math.sqrt(max(self.m2, 0.0) / self.count))
+        return value, delta, rate, zscore
+
+    def push(self, value: float, timestamp: float):
+        if self.count < self.size:
+            self.count += 1
+            diff = value - self.mean
+            self.mean += diff / self.count
+            self.m2 += diff * (value - self.mean)
+        else:
+            oldest = self.values[self.head]
+            old_mean = self.mean
+            self.mean += (value - oldest) / self.size
+            self.m2 += (value - oldest) * (value - self.mean + oldest - old_mean)
+
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.size
+        self.last_value = value
+        self.last_timestamp = timestamp
+
+        # Recompute exactly once per lap, so rounding errors never accumulate
+        if self.head == 0 and self.count == self.size:
+            self.mean = float(self.values.mean())
+            self.m2 = float(((self.values - self.mean) ** 2).sum())
+
+
+class FeatureEngine:
+    """
+    Per-series ring buffers, bounded in size and in number of series
+    (least recently updated series are dropped first)
+    """
+
+    def __init__(self, window: int = 60, max_series: int = 50000):
+        self.window = max(2, window)
+        self.max_series = max_series
+        self._series: "OrderedDict[str, SeriesWindow]" = OrderedDict()
+
+    @staticmethod
+    def series_key(metric_data: Dict[str, Any]) -> str:
+        labels = metric_data.get('labels') or {}
+        return f"{metric_data.get('metric_name')}{json.dumps(labels, sort_keys=True)}"
+
+    @staticmethod
+    def timestamp_of(metric_data: Dict[str, Any]) -> float:
+        """Point timestamp in epoch seconds (arrival time if missing or unparseable)"""
+        raw = metric_data.get('timestamp')
+        if isinstance(raw, (int, float)):
+            return float(raw)
+        if isinstance(raw, str):
+            try:
+                return float(raw)
+            except ValueError:
+                pass
+            try:
+                return datetime.fromisoformat(raw.replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                pass
+        return time.time()
+
+    def update(self, key: str, value: float, timestamp: float) -> np.ndarray:
+        """Feature vector of a new point, then add it to its series window"""
+        window = self._series.get(key)
+        if window is None:
+            window = SeriesWindow(self.window)
+            self._series[key] = window
+            if len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+        else:
+            self._series.move_to_end(key)
+
+        features = window.features(value, timestamp)
+        window.push(value, timestamp)
+        return np.array(features, dtype=np.float64)
+
+    def update_point(self, metric_data: Dict[str, Any], value: float) -> np.ndarray:
+        return self.update(self.series_key(metric_data), value, self.timestamp_of(metric_data))
+
+    def stats(self) -> dict:
+        return {
+            "series": len(self._series),
+            "window": self.window,
+            "resident_bytes": len(self._series) * self.window * 8
+        }
+
+
+def compute_features(
+    values: np.ndarray,
+    timestamps: np.ndarray,
+    window: int,
+    history: Optional[np.ndarray] = None,
+    last_timestamp: Optional[float] = None
+) -> np.ndarray:
+    """
+    Features for a time-ordered run of one series, vectorized.
+
+    Args:
+        values: Metric values, oldest first
+        timestamps: Epoch seconds of the values
+        window: Rolling window size (same as FeatureEngine.window)
+        history: Up to `window` values that precede the run, if any
+        last_timestamp: Timestamp of the last history value
+
+    Returns:
+        (n, len(FEATURE_NAMES)) array, matching what FeatureEngine.update
+        returns point by point
+    """
+    window = max(2, window)
+    values = np.asarray(values, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    history = np.asarray(history if history is not None else [], dtype=np.float64)[-window:]
+    n = len(values)
+    features = np.zeros((n, len(FEATURE_NAMES)))
+    if n == 0:
+        return features
+    features[:, 0] = values
+
+    # delta / rate against the previous point (none for the very first one)
+    series = np.concatenate([history, values])
+    times = np.concatenate([[last_timestamp if last_timestamp is not None else timestamps[0]], timestamps])
+    offset = len(history)
+    previous = series[offset - 1:-1] if offset else np.concatenate([[values[0]], values[:-1]])
+    delta = values - previous
+    elapsed = np.diff(times)
+    features[:, 1] = delta
+    features[:, 2] = np.divide(delta, elapsed, out=np.zeros(n), where=elapsed > 0)
+
+    # Rolling mean/std of the `window` points before each point, from
+    # cumulative sums of values shifted by a reference (for precision)
+    reference = series[0]
+    shifted = series - reference
+    csum = np.concatenate([[0.0], np.cumsum(shifted)])
+    csum2 = np.concatenate([[0.0], np.cumsum(shifted ** 2)])
+    end = np.arange(offset, offset + n)
+    start = np.maximum(end - window, 0)
+    count = end - start
+    total = csum[end] - csum[start]
+    total2 = csum2[end] - csum2[start]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        var = np.maximum(total2 / count - mean ** 2, 0.0)
+    mean = mean + reference
+    std = np.sqrt(var)
+    valid = (count >= 2) & (std > STD_EPSILON * (np.abs(mean) + 1.0))
+    features[:, 3] = np.divide(values - mean, std, out=np.zeros(n), where=valid)
+    return features
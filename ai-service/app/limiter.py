@@ -0,0 +1,250 @@
+"""
+Adaptive concurrency limiter
+============================
+
+The right number of parallel Ollama generations depends on the hardware
+(a laptop saturates at 1-2, a large CPU box at many more), so it is
+measured instead of configured. AIMD on latency and errors:
+
+- every call's latency feeds a smoothed estimate, compared with a
+  baseline (the lowest smoothed latency seen, drifting up slowly so it
+  follows model or hardware changes)
+- a failed call, or smoothed latency above baseline * latency_tolerance,
+  cuts the limit multiplicatively (limit * backoff)
+- otherwise, if the call ran while the limit was fully used, the limit
+  grows additively (+1 per limit calls)
+- the limit stays within [min_limit, max_limit]; callers beyond it wait
+
+When more parallelism stops adding throughput, CPU contention shows up as
+latency and the limit settles just below that point.
+
+Waiting callers are admitted by priority (lowest first, then arrival), not
+in arrival order. A caller may pass a deadline: it is rejected at once if
+the expected wait (callers ahead / limit x smoothed latency) already
+exceeds it (or has passed, even with a free slot), or later when it passes.
+With max_waiting set, the waiter with
+the worst priority is rejected when the queue overflows.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Optional
+from app.metrics import LLM_CONCURRENCY_LIMIT, LLM_IN_FLIGHT, LLM_LATENCY
+
+
+class LimiterRejected(Exception):
+    """A call was not admitted (reason: deadline or backlog)"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Call rejected by the concurrency limiter ({reason})")
+        self.reason = reason
+
+
+class _Slot:
+    """One admitted call; times itself and reports on exit"""
+
+    def __init__(self, limiter: "AdaptiveLimiter", priority, deadline: Optional[float]):
+        self.limiter = limiter
+        self.priority = priority
+        self.deadline = deadline
+        self.failed = False
+        self.saturated = False
+        self.started = 0.0
+
+    def fail(self):
+        """Count this call as an error (for calls that report errors as results)"""
+        self.failed = True
+
+    async def __aenter__(self) -> "_Slot":
+        self.saturated = await self.limiter._acquire(self.priority, self.deadline)
+        self.started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        latency = time.perf_counter() - self.started
+        # Cancelled calls say nothing about Ollama's capacity
+        cancelled = exc_type is not None and issubclass(exc_type, asyncio.CancelledError)
+        self.limiter._release(
+            None if cancelled else latency,
+            self.failed or exc_type is not None,
+            self.saturated
+        )
+        return False
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit driven by call latency and errors
+    """
+
+    def __init__(
+        self,
+        initial: int = 2,
+        min_limit: int = 1,
+        max_limit: int = 4,
+        backoff: float = 0.75,
+        latency_tolerance: float = 2.0,
+        smoothing: float = 0.2,
+        baseline_drift: float = 0.01,
+        max_waiting: Optional[int] = None
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline_drift = baseline_drift
+        self.max_waiting = max_waiting
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.smoothed_latency: Optional[float] = None
+        self.baseline_latency: Optional[float] = None
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        # (priority, arrival, future); entries already resolved are skipped
+        self._waiters: list = []
+        self._arrival = itertools.count()
+        LLM_CONCURRENCY_LIMIT.set(self.current_limit)
+
+    @property
+    def current_limit(self) -> int:
+        """Calls admitted at once right now"""
+        return max(self.min_limit, math.floor(self.limit))
+
+    def acquire(self, priority=0, deadline: Optional[float] = None) -> _Slot:
+        """
+        Admission for one call, used as `async with limiter.acquire() as slot:`
+        (waits while the limit is reached)
+
+        Args:
+            priority: Sort key among waiters, lower is admitted first
+            deadline: time.monotonic() by which the call must be admitted
+
+        Raises:
+            LimiterRejected: On entering, if the deadline cannot be met or the
+                call was dropped from a full queue
+        """
+        return _Slot(self, priority, deadline)
+
+    def expected_wait(self, priority=0) -> float:
+        """Estimated seconds until a new call with this priority is admitted"""
+        if self.in_flight < self.current_limit and not self.waiting:
+            return 0.0
+        if self.smoothed_latency is None:
+            return 0.0
+        ahead = sum(
+            1 for entry in self._waiters
+            if not entry[2].done() and entry[0] <= priority
+        )
+        return (ahead + 1) / self.current_limit * self.smoothed_latency
+
+    async def _acquire(self, priority, deadline: Optional[float]) -> bool:
+        # expected_wait() is 0 with a free slot: only a passed deadline fails
+        if deadline is not None and time.monotonic() + self.expected_wait(priority) > deadline:
+            self.rejected += 1
+            raise LimiterRejected("deadline")
+
+        if self.in_flight < self.current_limit and not self.waiting:
+            return self._admit()
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrival), future))
+        self.waiting += 1
+        if self.max_waiting is not None and self.waiting > self.max_waiting:
+            self._reject_worst()
+
+        timer = None
+        if deadline is not None:
+            timer = asyncio.get_running_loop().call_later(
+                max(0.0, deadline - time.monotonic()), self._reject, future, "deadline"
+            )
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self.waiting -= 1
+            elif future.exception() is None:
+                # Admitted just as the caller went away: pass the slot on
+                self._release(None, False, False)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def _admit(self) -> bool:
+        self.in_flight += 1
+        LLM_IN_FLIGHT.set(self.in_flight)
+        # Only calls made at the limit show whether more would help
+        return self.in_flight >= self.current_limit
+
+    def _reject(self, future: asyncio.Future, reason: str):
+        if not future.done():
+            self.waiting -= 1
+            self.rejected += 1
+            future.set_exception(LimiterRejected(reason))
+
+    def _reject_worst(self):
+        pending = [entry for entry in self._waiters if not entry[2].done()]
+        if pending:
+            self._reject(max(pending, key=lambda entry: entry[:2])[2], "backlog")
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.current_limit:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                self.waiting -= 1
+                future.set_result(self._admit())
+        if not self.waiting:
+            self._waiters.clear()
+
+    def _release(self, latency: Optional[float], failed: bool, saturated: bool):
+        self.in_flight -= 1
+        LLM_IN_FLIGHT.set(self.in_flight)
+        if latency is not None:
+            self._update(latency, failed, saturated)
+        self._wake()
+
+    def _update(self, latency: float, failed: bool, saturated: bool):
+        self.calls += 1
+        LLM_LATENCY.observe(latency)
+        if failed:
+            self.errors += 1
+            self._set_limit(self.limit * self.backoff)
+            return
+
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency += self.smoothing * (latency - self.smoothed_latency)
+        if self.baseline_latency is None:
+            self.baseline_latency = self.smoothed_latency
+        else:
+            self.baseline_latency = min(
+                self.baseline_latency * (1 + self.baseline_drift), self.smoothed_latency
+            )
+
+        if self.smoothed_latency > self.baseline_latency * self.latency_tolerance:
+            self._set_limit(self.limit * self.backoff)
+        elif saturated:
+            self._set_limit(self.limit + 1 / self.limit)
+
+    def _set_limit(self, limit: float):
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        LLM_CONCURRENCY_LIMIT.set(self.current_limit)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.current_limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "smoothed_latency": self.smoothed_latency,
+            "baseline_latency": self.baseline_latency,
+            "calls": self.calls,
+            "errors": self.errors,
+            "rejected": self.rejected
+        }
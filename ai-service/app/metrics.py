@@ -0,0 +1,47 @@
+"""
+Prometheus metrics
+==================
+
+Process-wide metrics of the AI service, served in the Prometheus text
+format at GET /metrics (scraped as job "ai-service").
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+LLM_CACHE_REQUESTS = Counter(
+    "enodai_llm_cache_requests_total",
+    "LLM analysis requests by cache outcome (memory, redis, coalesced or miss)",
+    ["result"]
+)
+LLM_CACHE_SAVED_SECONDS = Counter(
+    "enodai_llm_cache_saved_seconds_total",
+    "LLM generation seconds avoided by serving analyses from the cache"
+)
+
+LLM_CONCURRENCY_LIMIT = Gauge(
+    "enodai_llm_concurrency_limit",
+    "Ollama generations currently allowed in parallel (adaptive)"
+)
+LLM_IN_FLIGHT = Gauge(
+    "enodai_llm_in_flight",
+    "Ollama generations running"
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "enodai_llm_queue_depth",
+    "LLM analyses waiting for a slot or running"
+)
+LLM_LATENCY = Histogram(
+    "enodai_llm_latency_seconds",
+    "Ollama generation latency",
+    buckets=(1, 5, 10, 20, 30, 60, 120, 240, 480, 960)
+)
+LLM_JOBS_SHED = Counter(
+    "enodai_llm_jobs_shed_total",
+    "LLM analyses answered with a template under load",
+    ["reason", "severity"]
+)
+LLM_TIME_TO_ANALYSIS = Histogram(
+    "enodai_llm_time_to_analysis_seconds",
+    "Time from queueing an LLM analysis to its result (queue wait + generation)",
+    ["severity"],
+    buckets=(1, 5, 10, 20, 30, 60, 120, 240, 480, 960)
+)
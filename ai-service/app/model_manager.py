@@ -0,0 +1,369 @@
+"""
+Process-wide active model handle
+================================
+
+A single AnomalyDetector is shared by the stream consumer, the scheduler
+and the API. The active global model is tracked in the model_versions
+table:
+
+- retrain() trains a new model into its own versioned file, records it
+  in model_versions, flips is_active and swaps it into the shared
+  detector without pausing scoring
+- in shadow mode, retrain() records the new model as a candidate instead;
+  it scores sampled live batches next to the active model and
+  review_shadow() promotes or rejects it (see app.models.shadow). The
+  per-series models are not retrained with a candidate (they would go
+  live at once), but when it is promoted
+- update() extends the active model with a window of recent data (new
+  trees in, oldest trees out) and publishes it the same way: shadowed
+  first in shadow mode, and skipped while a candidate is shadowed (the
+  candidate's baseline must not move under it)
+- every publish is announced on a Redis pub/sub channel, so other
+  replicas reload the new active version without a restart; a replica
+  that loses the subscription resubscribes and reloads the active
+  version, catching announcements it missed
+
+Model files must live on storage shared by all replicas (settings.model_dir).
+"""
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Optional
+import redis.asyncio as redis
+from loguru import logger
+from app.config import get_settings
+from app.database import get_db_pool
+from app.detector import AnomalyDetector
+from app.models.isolation_forest import IsolationForestWrapper
+from app.models.shadow import PROMOTE, REJECT
+
+
+class ModelManager:
+    """
+    Owns the shared detector and the active model version
+    """
+
+    MODEL_TYPE = "isolation_forest"
+    # Backoff (seconds) between attempts to resubscribe to model updates
+    LISTEN_RETRY_MIN = 1.0
+    LISTEN_RETRY_MAX = 60.0
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._detector: Optional[AnomalyDetector] = None
+        self._publish_lock = asyncio.Lock()
+        self._redis = None
+        self._listener_task = None
+
+    @property
+    def detector(self) -> AnomalyDetector:
+        """The shared detector (created on first use)"""
+        if self._detector is None:
+            self._detector = AnomalyDetector()
+        return self._detector
+
+    @property
+    def active_version(self) -> str:
+        return self.detector.model_version
+
+    def new_version(self) -> str:
+        return "if_" + datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+
+    def path_for(self, version: str) -> str:
+        return os.path.join(self.settings.model_dir, f"{self.MODEL_TYPE}-{version}.joblib")
+
+    async def start(self):
+        """Load the active version and start listening for updates"""
+        await self.load_active()
+
+        try:
+            self._redis = redis.from_url(self.settings.redis_url, decode_responses=True)
+        except Exception as e:
+            logger.error(f"Model update listener unavailable: {e}")
+            return
+        self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener_task:
+            self._listener_task.cancel()
+            await asyncio.gather(self._listener_task, return_exceptions=True)
+            self._listener_task = None
+        if self._redis:
+            await self._redis.close()
+            self._redis = None
+        if self._detector is not None:
+            self._detector.shadow.shutdown()
+            self._detector.training_engine.shutdown()
+
+    async def load_active(self) -> bool:
+        """
+        Swap in the active version from model_versions if it differs from
+        the one currently loaded. Returns True if a new model was loaded.
+        """
+        try:
+            pool = await get_db_pool()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow("""
+                    SELECT version, file_path FROM model_versions
+                    WHERE model_type = $1 AND is_active = TRUE
+                    ORDER BY trained_at DESC
+                    LIMIT 1
+                """, self.MODEL_TYPE)
+        except Exception as e:
+            logger.error(f"Failed to look up active model version: {e}")
+            return False
+
+        if not row or row['version'] == self.active_version:
+            return False
+
+        return await self.load_version(row['version'], row['file_path'])
+
+    async def load_version(self, version: str, file_path: str) -> bool:
+        """Load a model file off the event loop and swap it in"""
+        if not os.path.exists(file_path):
+            logger.error(f"Model file for version {version} not found: {file_path}")
+            return False
+
+        model = IsolationForestWrapper(file_path, mmap=self.settings.model_mmap)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, model.load)
+
+        self.detector.swap_model(model, version)
+        # Series models may have been retrained by the publisher too
+        self.detector.registry.invalidate()
+        logger.info(f"✅ Active model is now {version}")
+        return True
+
+    async def retrain(self, activate: bool = True, shadow: bool = False) -> Optional[str]:
+        """
+        Train a new global model and publish it as a new version.
+        With shadow=True it is published as a candidate and shadow scored
+        instead of being activated. Returns the new version, or None if
+        training produced no model.
+        """
+        version = self.new_version()
+        os.makedirs(self.settings.model_dir, exist_ok=True)
+
+        model = await self.detector.train_model(self.path_for(version), series=not shadow)
+        if model is None:
+            return None
+
+        await self.publish(model, version, activate=activate and not shadow)
+        if shadow:
+            self.detector.shadow.start(model, version)
+        return version
+
+    async def update(self) -> Optional[str]:
+        """
+        Incrementally update the active model and publish the result as a
+        new version (a shadowed candidate in shadow mode). Returns the new
+        version, or None if there was nothing to learn from or a candidate
+        is still being shadowed.
+        """
+        shadow = self.settings.shadow_enabled
+        if shadow and self.detector.shadow.active:
+            logger.info(f"Skipping incremental update: candidate {self.detector.shadow.version} is being shadowed")
+            return None
+
+        version = self.new_version()
+        os.makedirs(self.settings.model_dir, exist_ok=True)
+
+        model = await self.detector.update_model(self.path_for(version))
+        if model is None:
+            return None
+
+        await self.publish(model, version, activate=not shadow)
+        if shadow:
+            self.detector.shadow.start(model, version)
+        await self.prune_versions(self.settings.model_keep_versions)
+        return version
+
+    async def review_shadow(self) -> Optional[str]:
+        """
+        Act on the shadowed candidate's verdict: activate it, or drop it.
+        The shadow stats are recorded in model_versions.metrics either way.
+        Returns the verdict, or None while no decision is due.
+        """
+        shadow = self.detector.shadow
+        version = shadow.version
+        verdict = shadow.verdict()
+        if version is None or verdict not in (PROMOTE, REJECT):
+            return None
+
+        stats = shadow.stop()
+        stats["verdict"] = verdict
+        stats["baseline_version"] = self.active_version
+        await self._record_metrics(version, "shadow", stats)
+
+        if verdict == PROMOTE:
+            logger.info(
+                f"Promoting candidate {version}: agreement {stats['agreement']:.4f}, "
+                f"latency ratio {stats['latency_ratio']:.2f}"
+            )
+            # Retrained before the announcement, which makes other
+            # replicas reload their series models
+            try:
+                await self.detector.train_series_models()
+            except Exception as e:
+                logger.error(f"Series model training failed on promotion of {version}: {e}")
+            await self.activate(version)
+        else:
+            logger.warning(f"Rejected candidate {version}: {stats}")
+        return verdict
+
+    async def _record_metrics(self, version: str, key: str, values: dict):
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE model_versions
+                SET metrics = COALESCE(metrics, '{}'::jsonb) || jsonb_build_object($3::text, $4::jsonb)
+                WHERE model_type = $1 AND version = $2
+            """, self.MODEL_TYPE, version, key, json.dumps(values))
+
+    async def prune_versions(self, keep: int) -> int:
+        """
+        Delete inactive versions beyond the newest `keep`, with their files.
+        The candidate being shadowed is kept whatever its age, since
+        review_shadow() may still activate it. Returns the number of
+        versions removed.
+        """
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                DELETE FROM model_versions
+                WHERE id IN (
+                    SELECT id FROM model_versions
+                    WHERE model_type = $1 AND is_active = FALSE
+                      AND version IS DISTINCT FROM $3
+                    ORDER BY trained_at DESC
+                    OFFSET $2
+                )
+                RETURNING file_path
+            """, self.MODEL_TYPE, keep, self.detector.shadow.version)
+
+        for row in rows:
+            model = IsolationForestWrapper(row['file_path'])
+            try:
+                os.remove(model.model_path)
+            except FileNotFoundError:
+                pass
+            # Processes still mapping the artifact keep their pages
+            shutil.rmtree(model.artifact_path, ignore_errors=True)
+
+        if rows:
+            logger.info(f"Pruned {len(rows)} old model versions")
+        return len(rows)
+
+    async def publish(self, model: IsolationForestWrapper, version: str, activate: bool = True):
+        """
+        Record a trained model in model_versions and (optionally) make it
+        the active version everywhere
+        """
+        params = model.model.get_params()
+        parameters = {k: params.get(k) for k in ("n_estimators", "contamination", "max_samples")}
+
+        async with self._publish_lock:
+            pool = await get_db_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("""
+                        INSERT INTO model_versions
+                        (model_type, version, algorithm, file_path, parameters, metrics, is_active)
+                        VALUES ($1, $2, 'isolation_forest', $3, $4, $5, FALSE)
+                    """,
+                    self.MODEL_TYPE,
+                    version,
+                    model.model_path,
+                    json.dumps(parameters),
+                    json.dumps({})
+                    )
+                    if activate:
+                        await self._set_active(conn, version)
+
+            if activate:
+                self.detector.swap_model(model, version)
+                await self._announce(version)
+                logger.info(f"✅ Published and activated model {version}")
+            else:
+                logger.info(f"Published candidate model {version}")
+
+    async def activate(self, version: str) -> bool:
+        """Make an already published version the active one"""
+        async with self._publish_lock:
+            pool = await get_db_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    file_path = await conn.fetchval("""
+                        SELECT file_path FROM model_versions
+                        WHERE model_type = $1 AND version = $2
+                    """, self.MODEL_TYPE, version)
+                    if file_path is None:
+                        logger.error(f"Unknown model version {version}")
+                        return False
+                    await self._set_active(conn, version)
+
+            loaded = await self.load_version(version, file_path)
+            await self._announce(version)
+            return loaded
+
+    async def _set_active(self, conn, version: str):
+        await conn.execute("""
+            UPDATE model_versions
+            SET is_active = (version = $2)
+            WHERE model_type = $1
+              AND (is_active = TRUE OR version = $2)
+        """, self.MODEL_TYPE, version)
+
+    async def _announce(self, version: str):
+        if not self._redis:
+            return
+        try:
+            await self._redis.publish(self.settings.model_updates_channel, version)
+        except Exception as e:
+            logger.error(f"Failed to announce model {version}: {e}")
+
+    async def _listen(self):
+        """
+        Reload the active model when another replica publishes one.
+        Runs until cancelled: after an error (e.g. Redis restarted) it
+        resubscribes with backoff and reloads the active version, since
+        announcements made meanwhile are lost.
+        """
+        channel = self.settings.model_updates_channel
+        delay = self.LISTEN_RETRY_MIN
+        resubscribed = False
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(channel)
+                logger.info(f"Listening for model updates on '{channel}'")
+                if resubscribed:
+                    await self.load_active()
+                delay = self.LISTEN_RETRY_MIN
+
+                async for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    if message.get('data') == self.active_version:
+                        continue
+                    logger.info(f"Model update announced: {message.get('data')}")
+                    await self.load_active()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Model update listener failed, resubscribing in {delay:.0f}s: {e}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.LISTEN_RETRY_MAX)
+            resubscribed = True
+
+
+# Global model manager instance
+model_manager = ModelManager()
@@ -0,0 +1,204 @@
+"""
+metrics.model_anomaly backfill
+==============================
+
+Scores stored metrics with the active model and writes the verdicts to
+metrics.model_anomaly (with model_version), so the column (and
+idx_metrics_model_anomaly) reflect what the detector thinks of the
+history. metrics.is_anomaly is left alone: it holds the labels the model
+evaluation scores against.
+
+- rows are walked in metrics.id key ranges, after the last checkpointed id
+- each run first rescans the catchup_span ids below the checkpoint for
+  rows still unscored: rows that were uncommitted when an earlier run read
+  max(id) end up there
+- each range is scored in one vectorized pass off the event loop
+- verdicts are bulk-loaded with copy_records_to_table into a temporary
+  table and applied with a single UPDATE ... FROM, in the same
+  transaction that advances the checkpoint (job_checkpoints), so an
+  interrupted run resumes exactly where the last committed range ended
+
+Feature models get per-series features; the last feature_window values of
+each series are carried across ranges (and runs) in a bounded LRU.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from loguru import logger
+from app.database import get_db_pool
+from app.features import FEATURE_NAMES, compute_features
+from app.models.isolation_forest import IsolationForestWrapper
+
+JOB_NAME = "metrics_model_anomaly_backfill"
+
+
+class AnomalyBackfill:
+    """
+    Resumable, range-by-range scoring of metrics into model_anomaly
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 50000,
+        max_rows: int = 2000000,
+        feature_window: int = 60,
+        max_series: int = 50000,
+        query_timeout: float = 600.0,
+        catchup_span: Optional[int] = None
+    ):
+        self.batch_size = batch_size
+        self.catchup_span = batch_size if catchup_span is None else catchup_span
+        self.max_rows = max_rows
+        self.feature_window = max(2, feature_window)
+        self.max_series = max_series
+        self.query_timeout = query_timeout
+        # series -> (last feature_window values, last timestamp)
+        self._history: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def checkpoint(self) -> int:
+        """Last metrics.id whose verdict was committed (0 before the first run)"""
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            position = await conn.fetchval(
+                "SELECT position FROM job_checkpoints WHERE job_name = $1", JOB_NAME
+            )
+        return position or 0
+
+    def _features(self, rows: List, values: np.ndarray) -> np.ndarray:
+        """Per-series feature vectors, continuing each series' history"""
+        series = np.array([r['series'] for r in rows], dtype=object)
+        timestamps = np.fromiter((r['ts'] for r in rows), dtype=np.float64, count=len(rows))
+        X = np.empty((len(rows), len(FEATURE_NAMES)))
+
+        order = np.argsort(series, kind='stable')
+        keys = series[order]
+        bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        for positions in np.split(order, bounds):
+            key = series[positions[0]]
+            history, last_timestamp = self._history.pop(key, (None, None))
+            X[positions] = compute_features(
+                values[positions], timestamps[positions], self.feature_window, history, last_timestamp
+            )
+            tail = values[positions][-self.feature_window:]
+            if history is not None:
+                tail = np.concatenate([history, tail])[-self.feature_window:]
+            self._history[key] = (tail, timestamps[positions[-1]])
+            if len(self._history) > self.max_series:
+                self._history.popitem(last=False)
+        return X
+
+    def score(self, model: IsolationForestWrapper, rows: List) -> np.ndarray:
+        """Anomaly verdicts of one range of rows (blocking)"""
+        values = np.fromiter((r['value'] for r in rows), dtype=np.float64, count=len(rows))
+        if model.n_features == len(FEATURE_NAMES):
+            X = self._features(rows, values)
+        else:
+            X = values.reshape(-1, 1)
+        _, predictions = model.score_and_predict(np.nan_to_num(X))
+        return predictions == -1
+
+    async def _fetch(self, conn, lower: int, upper: int, with_series: bool, unscored: bool = False) -> List:
+        columns = "id, metric_value::float8 AS value"
+        if with_series:
+            columns += ", metric_name || labels::text AS series, EXTRACT(EPOCH FROM timestamp)::float8 AS ts"
+        condition = " AND model_anomaly IS NULL" if unscored else ""
+        return await conn.fetch(f"""
+            SELECT {columns}
+            FROM metrics
+            WHERE id > $1 AND id <= $2{condition}
+            ORDER BY id
+        """, lower, upper, timeout=self.query_timeout)
+
+    async def _commit(self, conn, ids: List[int], verdicts: np.ndarray, position: int, version: str) -> int:
+        """Apply one range's verdicts and advance the checkpoint, atomically"""
+        updated = 0
+        async with conn.transaction():
+            if ids:
+                await conn.execute("""
+                    CREATE TEMP TABLE backfill_verdicts (id INTEGER, is_anomaly BOOLEAN) ON COMMIT DROP
+                """)
+                await conn.copy_records_to_table(
+                    'backfill_verdicts',
+                    records=zip(ids, verdicts.tolist()),
+                    columns=['id', 'is_anomaly'],
+                    timeout=self.query_timeout
+                )
+                status = await conn.execute("""
+                    UPDATE metrics AS m
+                    SET model_anomaly = v.is_anomaly, model_version = $1
+                    FROM backfill_verdicts AS v
+                    WHERE m.id = v.id
+                      AND (m.model_anomaly IS DISTINCT FROM v.is_anomaly OR m.model_version IS DISTINCT FROM $1)
+                """, version, timeout=self.query_timeout)
+                updated = int(status.split()[-1])
+
+            await conn.execute("""
+                INSERT INTO job_checkpoints (job_name, position, state, updated_at)
+                VALUES ($1, $2, $3, NOW())
+                ON CONFLICT (job_name) DO UPDATE
+                SET position = EXCLUDED.position, state = EXCLUDED.state, updated_at = NOW()
+            """, JOB_NAME, position, json.dumps({"model_version": version}))
+        return updated
+
+    async def run(self, model: IsolationForestWrapper, version: str, max_rows: Optional[int] = None) -> dict:
+        """
+        Score the rows added since the checkpoint, up to max_rows ids.
+
+        Args:
+            model: Model to score with (the active global model)
+            version: Its version, stored with the verdicts and the checkpoint
+            max_rows: Id span covered by this run (default: self.max_rows)
+
+        Returns:
+            Run statistics: rows scored, anomalies, rows updated, position
+        """
+        start_time = time.perf_counter()
+        position = await self.checkpoint()
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            # Ids are handed out at insert time, so a row still uncommitted
+            # below max(id) is passed over here; the next run's catch-up
+            # scores it
+            newest = await conn.fetchval("SELECT max(id) FROM metrics") or 0
+        end = min(newest, position + (max_rows or self.max_rows))
+
+        stats = {"rows": 0, "anomalies": 0, "updated": 0, "caught_up": 0, "start": position, "position": position}
+        with_series = model.n_features == len(FEATURE_NAMES)
+        loop = asyncio.get_running_loop()
+
+        if position > 0 and self.catchup_span > 0:
+            async with pool.acquire() as conn:
+                rows = await self._fetch(conn, max(0, position - self.catchup_span), position, with_series, unscored=True)
+                if rows:
+                    verdicts = await loop.run_in_executor(None, self.score, model, rows)
+                    stats["updated"] += await self._commit(conn, [r['id'] for r in rows], verdicts, position, version)
+                    stats["rows"] += len(rows)
+                    stats["caught_up"] = len(rows)
+                    stats["anomalies"] += int(verdicts.sum())
+
+        if position >= end:
+            return stats
+
+        while position < end:
+            upper = min(position + self.batch_size, end)
+            async with pool.acquire() as conn:
+                rows = await self._fetch(conn, position, upper, with_series)
+                verdicts = np.zeros(0, dtype=bool)
+                if rows:
+                    verdicts = await loop.run_in_executor(None, self.score, model, rows)
+                stats["updated"] += await self._commit(conn, [r['id'] for r in rows], verdicts, upper, version)
+
+            stats["rows"] += len(rows)
+            stats["anomalies"] += int(verdicts.sum())
+            position = stats["position"] = upper
+
+        elapsed = time.perf_counter() - start_time
+        logger.info(
+            f"Backfilled model_anomaly for {stats['rows']} metrics (ids {stats['start']}..{position}, "
+            f"{stats['caught_up']} caught up below the checkpoint) in {elapsed:.1f}s: "
+            f"{stats['anomalies']} anomalies, {stats['updated']} rows changed"
+        )
+        return stats
@@ -0,0 +1,282 @@
+"""
+Compiled IsolationForest scorer
+===============================
+
+sklearn scores an IsolationForest with a Python loop over the estimators,
+plus StandardScaler.transform, which costs milliseconds even for a single
+value. CompiledForest flattens a fitted forest into contiguous NumPy arrays
+and scores a whole batch with a vectorized traversal of all trees at once:
+
+- feature / threshold / left / right per node, all trees concatenated
+- leaves point to themselves, so every sample can take max_depth steps
+- each leaf stores its depth plus the average path length correction c(n)
+- the scaler is folded into the thresholds, so raw values are compared
+  directly: (x - mean) / scale <= t  <=>  x <= t * scale + mean
+- each tree keeps its own path length normalization, so trees fitted at
+  different times on different sample sizes can share one ensemble
+
+Scores match IsolationForest.score_samples(scaler.transform(X)).
+
+The flat arrays are also the on-disk artifact: one uncompressed .npy file
+per array plus a small meta.json, opened with np.load(mmap_mode='r'). Every
+process that maps the same artifact shares one page-cached copy, and
+loading takes the same time whatever the size of the forest.
+"""
+import json
+import os
+import shutil
+from typing import Optional
+import numpy as np
+
+ARTIFACT_FORMAT = 1
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "leaf_value", "roots", "tree_norm")
+
+
+def average_path_length(n_samples) -> np.ndarray:
+    """
+    Average path length of an unsuccessful BST search in a tree built on
+    n samples (c(n) in the IsolationForest paper, as in sklearn)
+    """
+    n = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n)
+    result[n == 2] = 1.0
+    big = n > 2
+    result[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return result
+
+
+class CompiledForest:
+    """
+    Flat, vectorized representation of a fitted IsolationForest
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        leaf_value: np.ndarray,
+        roots: np.ndarray,
+        tree_norm: np.ndarray,
+        max_depth: int,
+        offset: float,
+        n_features: int
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.tree_norm = tree_norm
+        self.max_depth = max_depth
+        self.offset = offset
+        self.n_features = n_features
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ARRAY_NAMES)
+
+    def save(self, directory: str, extra: Optional[dict] = None):
+        """
+        Write the forest as an artifact directory of .npy files.
+
+        The directory is written next to the target and renamed into place,
+        so readers never map a half-written artifact. Processes that still
+        map the previous artifact keep their (unlinked) pages.
+
+        Args:
+            directory: Artifact directory to create or replace
+            extra: Additional JSON-serializable metadata stored in meta.json
+        """
+        tmp_dir = f"{directory}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+
+        meta = {
+            "format": ARTIFACT_FORMAT,
+            "max_depth": self.max_depth,
+            "offset": self.offset,
+            "n_features": self.n_features,
+            **(extra or {})
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        old_dir = f"{directory}.old-{os.getpid()}"
+        if os.path.isdir(directory):
+            os.rename(directory, old_dir)
+        os.rename(tmp_dir, directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = "r"):
+        """
+        Open an artifact directory written by save().
+
+        Returns:
+            (CompiledForest, meta dict)
+        """
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format") != ARTIFACT_FORMAT:
+            raise ValueError(f"Unsupported model artifact format: {meta.get('format')}")
+
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        forest = cls(
+            max_depth=meta["max_depth"],
+            offset=meta["offset"],
+            n_features=meta["n_features"],
+            **arrays
+        )
+        return forest, meta
+
+    def tail(self, n_trees: int) -> "CompiledForest":
+        """Forest of the newest n_trees trees (trees are stored oldest first)"""
+        n_trees = max(0, min(n_trees, self.n_trees))
+        if n_trees == 0:
+            start = len(self.feature)
+        else:
+            start = int(self.roots[self.n_trees - n_trees])
+        return CompiledForest(
+            feature=self.feature[start:],
+            threshold=self.threshold[start:],
+            left=self.left[start:] - start,
+            right=self.right[start:] - start,
+            leaf_value=self.leaf_value[start:],
+            roots=self.roots[self.n_trees - n_trees:] - start,
+            tree_norm=self.tree_norm[self.n_trees - n_trees:],
+            max_depth=self.max_depth,
+            offset=self.offset,
+            n_features=self.n_features
+        )
+
+    @classmethod
+    def concat(cls, forests) -> "CompiledForest":
+        """
+        Join forests into one ensemble, in order. The offset of the last
+        forest is kept; re-derive it when the ensemble changes.
+        """
+        forests = [f for f in forests if f.n_trees]
+        shifts = np.cumsum([0] + [len(f.feature) for f in forests[:-1]])
+        return cls(
+            feature=np.concatenate([f.feature for f in forests]),
+            threshold=np.concatenate([f.threshold for f in forests]),
+            left=np.concatenate([f.left + s for f, s in zip(forests, shifts)]),
+            right=np.concatenate([f.right + s for f, s in zip(forests, shifts)]),
+            leaf_value=np.concatenate([f.leaf_value for f in forests]),
+            roots=np.concatenate([f.roots + s for f, s in zip(forests, shifts)]),
+            tree_norm=np.concatenate([f.tree_norm for f in forests]),
+            max_depth=max(f.max_depth for f in forests),
+            offset=forests[-1].offset,
+            n_features=forests[-1].n_features
+        )
+
+    @classmethod
+    def from_sklearn(cls, model, scaler=None) -> "CompiledForest":
+        """Flatten a fitted IsolationForest (and the scaler it was trained behind)"""
+        n_features = model.n_features_in_
+        mean = np.zeros(n_features)
+        scale = np.ones(n_features)
+        if scaler is not None:
+            mean = np.asarray(scaler.mean_, dtype=np.float64)
+            scale = np.asarray(scaler.scale_, dtype=np.float64)
+
+        # sklearn only indexes the per-tree feature subsets when features are subsampled
+        subsample_features = model._max_features != n_features
+        norm = float(average_path_length([model._max_samples])[0])
+
+        features, thresholds, lefts, rights, leaf_values, roots = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+
+        for tree, tree_features in zip(model.estimators_, model.estimators_features_):
+            t = tree.tree_
+            n_nodes = t.node_count
+            is_leaf = t.children_left == -1
+            node_ids = np.arange(n_nodes)
+
+            feature = t.feature.astype(np.intp)
+            if subsample_features:
+                feature = np.where(is_leaf, 0, np.asarray(tree_features)[np.maximum(feature, 0)])
+            feature = np.where(is_leaf, 0, feature)
+
+            threshold = np.where(
+                is_leaf,
+                np.inf,
+                t.threshold * scale[feature] + mean[feature]
+            )
+
+            # Absolute child indices; leaves loop onto themselves
+            left = np.where(is_leaf, node_ids, t.children_left) + offset
+            right = np.where(is_leaf, node_ids, t.children_right) + offset
+
+            # Node depths, level by level (nodes are stored parents-first)
+            depth = np.zeros(n_nodes)
+            frontier = np.array([0])
+            level = 0
+            while frontier.size:
+                depth[frontier] = level
+                children = np.concatenate([t.children_left[frontier], t.children_right[frontier]])
+                frontier = children[children >= 0]
+                level += 1
+            max_depth = max(max_depth, level - 1)
+
+            leaf_value = np.where(is_leaf, depth + average_path_length(t.n_node_samples), 0.0)
+
+            features.append(feature)
+            thresholds.append(threshold)
+            lefts.append(left)
+            rights.append(right)
+            leaf_values.append(leaf_value)
+            roots.append(offset)
+            offset += n_nodes
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.intp),
+            right=np.concatenate(rights).astype(np.intp),
+            leaf_value=np.concatenate(leaf_values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            tree_norm=np.full(len(roots), norm),
+            max_depth=max_depth,
+            offset=float(model.offset_),
+            n_features=n_features
+        )
+
+    def score_samples(self, X) -> np.ndarray:
+        """Same as IsolationForest.score_samples (lower is more abnormal)"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(-1, self.n_features)
+
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        normalized = np.divide(
+            self.leaf_value[node],
+            self.tree_norm,
+            out=np.ones(node.shape),
+            where=self.tree_norm != 0
+        )
+        return -(2 ** -normalized.mean(axis=1))
+
+    def score_and_predict(self, X):
+        """Scores plus predictions (-1 anomaly, 1 normal) from a single traversal"""
+        scores = self.score_samples(X)
+        return scores, np.where(scores - self.offset < 0, -1, 1)
@@ -0,0 +1,264 @@
+"""
+Model evaluation harness
+========================
+
+Replays a held-out window of the metrics table through the active model
+and the newest candidate versions, in vectorized batches, and measures:
+
+- precision / recall / F1 against the metrics.is_anomaly labels (None
+  while the window holds no labeled anomalies) and the anomaly rate;
+  model verdicts (backfill, replay) go to metrics.model_anomaly instead,
+  so no model is scored against its own predictions
+- scoring latency: p50/p99 per batch and per single point
+- throughput in points per second
+
+Results are merged into model_versions.metrics under "evaluation", with
+deltas against the active version, so quality and speed are tracked per
+version and regressions are logged. Full retrains leave the evaluation
+window out of their training data (settings.evaluation_holdout).
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+import numpy as np
+from loguru import logger
+from app.database import get_db_pool
+from app.features import FEATURE_NAMES, compute_features
+from app.models.isolation_forest import IsolationForestWrapper
+
+# Single points timed per model for the per-point latency
+POINT_SAMPLES = 200
+
+
+def classification_metrics(labels: np.ndarray, predictions: np.ndarray) -> dict:
+    """
+    Precision, recall and F1 of anomaly predictions (-1 = anomaly)
+    against boolean labels
+    """
+    predicted = predictions == -1
+    labels = labels.astype(bool)
+    tp = int(np.sum(predicted & labels))
+    fp = int(np.sum(predicted & ~labels))
+    fn = int(np.sum(~predicted & labels))
+
+    precision = tp / (tp + fp) if tp + fp else None
+    recall = tp / (tp + fn) if tp + fn else None
+    f1 = None
+    if precision is not None and recall is not None and precision + recall > 0:
+        f1 = 2 * precision * recall / (precision + recall)
+
+    return {
+        "true_positives": tp,
+        "false_positives": fp,
+        "false_negatives": fn,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "anomaly_rate": float(predicted.mean()) if len(predicted) else 0.0
+    }
+
+
+def benchmark_scoring(model, X: np.ndarray, batch_size: int) -> tuple:
+    """
+    Score X in batches, timing every call.
+
+    Returns:
+        (predictions, latency dict)
+    """
+    predictions = np.empty(len(X), dtype=int)
+    batch_latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(X), batch_size):
+        t0 = time.perf_counter()
+        _, predictions[i:i + batch_size] = model.score_and_predict(X[i:i + batch_size])
+        batch_latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    point_latencies = []
+    for row in X[:POINT_SAMPLES]:
+        t0 = time.perf_counter()
+        model.score_and_predict(row.reshape(1, -1))
+        point_latencies.append(time.perf_counter() - t0)
+
+    latency = {
+        "batch_size": batch_size,
+        "batch_p50_ms": float(np.percentile(batch_latencies, 50) * 1e3),
+        "batch_p99_ms": float(np.percentile(batch_latencies, 99) * 1e3),
+        "point_p50_us": float(np.percentile(point_latencies, 50) * 1e6),
+        "point_p99_us": float(np.percentile(point_latencies, 99) * 1e6),
+        "throughput": float(len(X) / elapsed) if elapsed > 0 else 0.0
+    }
+    return predictions, latency
+
+
+class EvaluationWindow:
+    """Held-out rows, oldest first"""
+
+    def __init__(self, series: np.ndarray, timestamps: np.ndarray, values: np.ndarray, labels: np.ndarray):
+        self.series = series
+        self.timestamps = timestamps
+        self.values = values
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def inputs_for(self, model: IsolationForestWrapper, feature_window: int) -> np.ndarray:
+        """The input matrix a model scores: feature vectors or raw values"""
+        if model.n_features != len(FEATURE_NAMES):
+            return self.values.reshape(-1, 1)
+
+        X = np.empty((len(self), len(FEATURE_NAMES)))
+        order = np.argsort(self.series, kind='stable')
+        keys = self.series[order]
+        bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        for rows in np.split(order, bounds):
+            X[rows] = compute_features(self.values[rows], self.timestamps[rows], feature_window)
+        return X
+
+
+class ModelEvaluator:
+    """
+    Scores model versions on the held-out window and records the results
+    """
+
+    def __init__(
+        self,
+        window_hours: float = 6.0,
+        row_budget: int = 200000,
+        batch_size: int = 500,
+        candidates: int = 3,
+        feature_window: int = 60,
+        latency_regression: float = 1.5,
+        query_timeout: float = 600.0
+    ):
+        self.window_hours = window_hours
+        self.row_budget = row_budget
+        self.batch_size = batch_size
+        self.candidates = candidates
+        self.feature_window = feature_window
+        self.latency_regression = latency_regression
+        self.query_timeout = query_timeout
+
+    async def load_window(self) -> EvaluationWindow:
+        """The newest row_budget rows of the evaluation window"""
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT metric_name || labels::text AS series,
+                       EXTRACT(EPOCH FROM timestamp)::float8 AS ts,
+                       metric_value::float8 AS value,
+                       COALESCE(is_anomaly, FALSE) AS is_anomaly
+                FROM metrics
+                WHERE timestamp >= NOW() - make_interval(secs => $1)
+                ORDER BY timestamp DESC
+                LIMIT $2
+            """, float(self.window_hours) * 3600, self.row_budget, timeout=self.query_timeout)
+
+        rows = rows[::-1]
+        return EvaluationWindow(
+            series=np.array([r['series'] for r in rows], dtype=object),
+            timestamps=np.fromiter((r['ts'] for r in rows), dtype=np.float64, count=len(rows)),
+            values=np.fromiter((r['value'] for r in rows), dtype=np.float64, count=len(rows)),
+            labels=np.fromiter((r['is_anomaly'] for r in rows), dtype=bool, count=len(rows))
+        )
+
+    def evaluate(self, model: IsolationForestWrapper, window: EvaluationWindow) -> dict:
+        """Quality and speed of one model on the window (blocking)"""
+        X = window.inputs_for(model, self.feature_window)
+        predictions, latency = benchmark_scoring(model, X, self.batch_size)
+        return {
+            "evaluated_at": datetime.now(timezone.utc).isoformat(),
+            "window_hours": self.window_hours,
+            "rows": len(window),
+            "labeled_anomalies": int(window.labels.sum()),
+            **classification_metrics(window.labels, predictions),
+            **latency
+        }
+
+    async def _candidates(self, model_type: str, active_version: str) -> List[tuple]:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT version, file_path FROM model_versions
+                WHERE model_type = $1 AND version <> $2 AND is_active = FALSE
+                ORDER BY trained_at DESC
+                LIMIT $3
+            """, model_type, active_version, self.candidates)
+        return [(r['version'], r['file_path']) for r in rows]
+
+    async def _record(self, model_type: str, version: str, evaluation: dict):
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE model_versions
+                SET metrics = COALESCE(metrics, '{}'::jsonb) || jsonb_build_object('evaluation', $3::jsonb)
+                WHERE model_type = $1 AND version = $2
+            """, model_type, version, json.dumps(evaluation))
+
+    def _compare(self, evaluation: dict, baseline: dict, baseline_version: str):
+        """Add deltas against the active version and log regressions"""
+        evaluation["baseline_version"] = baseline_version
+        if evaluation["f1"] is not None and baseline["f1"] is not None:
+            evaluation["f1_delta"] = evaluation["f1"] - baseline["f1"]
+        if baseline["batch_p99_ms"] > 0:
+            evaluation["p99_ratio"] = evaluation["batch_p99_ms"] / baseline["batch_p99_ms"]
+        if baseline["throughput"] > 0:
+            evaluation["throughput_ratio"] = evaluation["throughput"] / baseline["throughput"]
+
+        if evaluation.get("p99_ratio", 0) > self.latency_regression:
+            logger.warning(
+                f"Latency regression: p99 {evaluation['batch_p99_ms']:.2f}ms vs "
+                f"{baseline['batch_p99_ms']:.2f}ms for {baseline_version}"
+            )
+        if evaluation.get("f1_delta", 0) < 0:
+            logger.warning(f"F1 regression: {evaluation['f1_delta']:+.3f} vs {baseline_version}")
+
+    async def run(
+        self,
+        active_model: IsolationForestWrapper,
+        active_version: str,
+        model_type: str = "isolation_forest",
+        mmap: bool = True
+    ) -> Dict[str, dict]:
+        """
+        Evaluate the active model and the newest candidates and write the
+        results to model_versions.metrics.
+
+        Returns:
+            version -> evaluation (empty if the window has no data)
+        """
+        window = await self.load_window()
+        if len(window) == 0:
+            logger.warning("No metrics in the evaluation window")
+            return {}
+
+        loop = asyncio.get_running_loop()
+        results = {}
+
+        baseline = await loop.run_in_executor(None, self.evaluate, active_model, window)
+        results[active_version] = baseline
+        await self._record(model_type, active_version, baseline)
+
+        for version, file_path in await self._candidates(model_type, active_version):
+            if not os.path.exists(file_path):
+                logger.warning(f"Skipping evaluation of {version}: {file_path} not found")
+                continue
+            model = IsolationForestWrapper(file_path, mmap=mmap)
+            await loop.run_in_executor(None, model.load)
+
+            evaluation = await loop.run_in_executor(None, self.evaluate, model, window)
+            self._compare(evaluation, baseline, active_version)
+            results[version] = evaluation
+            await self._record(model_type, version, evaluation)
+
+        for version, evaluation in results.items():
+            logger.info(
+                f"Evaluation {version}: f1={evaluation['f1']} rate={evaluation['anomaly_rate']:.4f} "
+                f"p50={evaluation['batch_p50_ms']:.2f}ms p99={evaluation['batch_p99_ms']:.2f}ms "
+                f"{evaluation['throughput']:.0f} points/s"
+            )
+        return results
@@ -1,40 +1,100 @@
+import io
 import joblib
 import numpy as np
 import os
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
+from app.models.compiled_forest import CompiledForest
 
 class IsolationForestWrapper:
-    def __init__(self, model_path='models/isolation_forest.joblib'):
+    def __init__(self, model_path='models/isolation_forest.joblib', n_jobs=-1, mmap=True):
         self.model = IsolationForest(
             contamination=0.1,
             n_estimators=100,
             random_state=42,
-            n_jobs=-1
+            n_jobs=n_jobs
         )
         self.scaler = StandardScaler()
         self.model_path = model_path
         self.is_fitted = False
+        # Flattened copy of the fitted forest used for scoring
+        self.compiled = None
+        # Load the memory-mapped artifact instead of unpickling the sklearn model
+        self.mmap = mmap
+
+    @property
+    def artifact_path(self) -> str:
+        """Directory holding the memory-mappable .npy artifact"""
+        return os.path.splitext(self.model_path)[0] + ".forest"
+
+    @property
+    def n_features(self) -> int:
+        """Width of the feature vectors the model scores (1 = raw value)"""
+        return self.compiled.n_features if self.compiled is not None else 1
+
+    @staticmethod
+    def _as_matrix(data) -> np.ndarray:
+        data = np.asarray(data, dtype=np.float64)
+        return data if data.ndim == 2 else data.reshape(-1, 1)
 
     def train(self, data: list):
         """
         Train the model with new data.
-        Data should be a list of numerical values.
+        Data should be a list of numerical values, or a 2-D array of
+        feature vectors (one row per point).
         """
-        if not data:
+        if data is None or len(data) == 0:
             # Create dummy data for initialization if empty
             data = np.random.normal(loc=50, scale=10, size=1000).reshape(-1, 1)
         else:
-            data = np.array(data).reshape(-1, 1)
+            data = self._as_matrix(data)
 
         self.scaler.fit(data)
         X_scaled = self.scaler.transform(data)
         
         self.model.fit(X_scaled)
         self.is_fitted = True
+        self._compile()
         self.save()
         print("Model trained and saved.")
 
+    def partial_fit(self, data, n_trees: int = 10, max_trees: int = None):
+        """
+        Incrementally update the model with a window of recent data.
+        Fits n_trees new trees on the window and retires the oldest trees,
+        so the ensemble never exceeds max_trees (default: n_estimators).
+        The scaler statistics are updated online with the window.
+        """
+        data = self._as_matrix(data)
+        if not self.is_fitted or self.compiled is None or self.n_features != data.shape[1]:
+            self.train(data)
+            return
+
+        params = self.model.get_params()
+        max_trees = max_trees or params['n_estimators']
+        n_trees = min(n_trees, max_trees)
+
+        self.scaler.partial_fit(data)
+        forest = IsolationForest(**{**params, 'n_estimators': n_trees, 'random_state': None})
+        forest.fit(self.scaler.transform(data))
+
+        compiled = CompiledForest.concat([
+            self.compiled.tail(max_trees - n_trees),
+            CompiledForest.from_sklearn(forest, self.scaler)
+        ])
+        # Re-derive the decision threshold for the new ensemble on the
+        # window, the same way IsolationForest.fit sets offset_
+        if params['contamination'] == 'auto':
+            compiled.offset = -0.5
+        else:
+            compiled.offset = float(np.percentile(compiled.score_samples(data), 100.0 * params['contamination']))
+
+        self.compiled = compiled
+        # The sklearn estimator no longer describes the ensemble; from
+        # here on the compiled forest is the model
+        self.model = IsolationForest(**params)
+        self.save()
+
     def predict(self, X):
         """
         Predict if values are anomalies.
@@ -44,6 +104,9 @@ class IsolationForestWrapper:
             # If not trained, treat everything as normal
             return np.ones(X.shape[0])
 
+        if self.compiled is not None:
+            return self.compiled.score_and_predict(X)[1]
+
         X_scaled = self.scaler.transform(X)
         return self.model.predict(X_scaled)
 
@@ -55,22 +118,108 @@ class IsolationForestWrapper:
         if not self.is_fitted:
             return np.zeros(X.shape[0])
 
+        if self.compiled is not None:
+            return self.compiled.score_samples(X)
+
         X_scaled = self.scaler.transform(X)
         return self.model.score_samples(X_scaled)
 
-    def save(self):
-        joblib.dump({
+    def score_and_predict(self, X):
+        """
+        Score samples and derive predictions in a single pass.
+        Equivalent to calling score_samples() and predict(), but the
+        forest is only traversed once.
+        Returns (scores, predictions).
+        """
+        if not self.is_fitted:
+            return np.zeros(X.shape[0]), np.ones(X.shape[0])
+
+        if self.compiled is not None:
+            return self.compiled.score_and_predict(X)
+
+        scores = self.score_samples(X)
+        # IsolationForest.predict is decision_function < 0, where
+        # decision_function = score_samples - offset_
+        predictions = np.where(scores - self.model.offset_ < 0, -1, 1)
+        return scores, predictions
+
+    def estimate_nbytes(self) -> int:
+        """
+        Approximate resident size of the fitted model in bytes.
+        Dominated by the tree node arrays (~72 bytes per node in sklearn).
+        """
+        if not self.is_fitted:
+            return 0
+        compiled = self.compiled.nbytes if self.compiled is not None else 0
+        # Loaded from the artifact: the sklearn model was never unpickled
+        if not hasattr(self.model, 'estimators_'):
+            return compiled
+        node_count = sum(est.tree_.node_count for est in self.model.estimators_)
+        return node_count * 72 + len(self.model.estimators_) * 2048 + compiled
+
+    def _compile(self):
+        """Flatten the fitted forest (with the scaler folded in) for fast scoring"""
+        self.compiled = CompiledForest.from_sklearn(self.model, self.scaler) if self.is_fitted else None
+
+    def _state(self) -> dict:
+        return {
             'model': self.model,
             'scaler': self.scaler,
-            'is_fitted': self.is_fitted
-        }, self.model_path)
+            'is_fitted': self.is_fitted,
+            # Only needed once partial_fit has replaced the sklearn estimator
+            'compiled': None if hasattr(self.model, 'estimators_') else self.compiled
+        }
+
+    def _set_state(self, data: dict):
+        self.model = data['model']
+        self.scaler = data['scaler']
+        self.is_fitted = data['is_fitted']
+        if data.get('compiled') is not None:
+            self.compiled = data['compiled']
+        else:
+            self._compile()
+
+    def save(self):
+        joblib.dump(self._state(), self.model_path)
+        if self.compiled is not None:
+            self.compiled.save(self.artifact_path, extra={'scaler': self._scaler_state()})
+
+    def _scaler_state(self) -> dict:
+        return {
+            'mean': self.scaler.mean_.tolist(),
+            'var': self.scaler.var_.tolist(),
+            'scale': self.scaler.scale_.tolist(),
+            'n_samples_seen': int(np.max(self.scaler.n_samples_seen_))
+        }
+
+    def _load_artifact(self):
+        """Map the .npy artifact; the sklearn model itself stays on disk"""
+        self.compiled, meta = CompiledForest.load(self.artifact_path)
+        scaler = meta['scaler']
+        self.scaler = StandardScaler()
+        self.scaler.mean_ = np.array(scaler['mean'])
+        self.scaler.var_ = np.array(scaler['var'])
+        self.scaler.scale_ = np.array(scaler['scale'])
+        self.scaler.n_samples_seen_ = np.int64(scaler['n_samples_seen'])
+        self.scaler.n_features_in_ = len(scaler['mean'])
+        self.is_fitted = True
+
+    def dumps(self) -> bytes:
+        """Serialize the model (same format as the saved file)"""
+        buffer = io.BytesIO()
+        joblib.dump(self._state(), buffer)
+        return buffer.getvalue()
+
+    def loads(self, payload: bytes):
+        """Restore a model serialized with dumps()"""
+        self._set_state(joblib.load(io.BytesIO(payload)))
 
     def load(self):
-        if os.path.exists(self.model_path):
-            data = joblib.load(self.model_path)
-            self.model = data['model']
-            self.scaler = data['scaler']
-            self.is_fitted = data['is_fitted']
+        if self.mmap and os.path.exists(os.path.join(self.artifact_path, 'meta.json')):
+            self._load_artifact()
+            print("Model mapped from disk.")
+        elif os.path.exists(self.model_path):
+            self._set_state(joblib.load(self.model_path))
             print("Model loaded from disk.")
         else:
             print("No existing model found. Initializing new model.")
@@ -0,0 +1,150 @@
+"""
+Per-series model registry
+=========================
+
+One IsolationForest (with its own scaler) per metric series, keyed by
+metric_name and an optional subset of labels. Models are loaded lazily
+from disk on first use and kept in a memory-bounded LRU cache, so only
+the hot series stay resident.
+"""
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+from loguru import logger
+from app.models.isolation_forest import IsolationForestWrapper
+
+
+class ModelRegistry:
+    """
+    Lazily loaded, LRU-evicted per-series models
+    """
+
+    # Remember at most this many series without a model on disk, so cold
+    # series don't hit the filesystem on every point
+    MAX_MISSING_KEYS = 100000
+
+    def __init__(self, model_dir: str, max_bytes: int, series_labels: Iterable[str] = (), mmap: bool = True):
+        self.model_dir = model_dir
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        self.series_labels = sorted(label for label in series_labels if label)
+
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._missing: "OrderedDict[str, None]" = OrderedDict()
+        self.resident_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def series_key(self, metric_name: Optional[str], labels: Optional[dict] = None) -> Optional[str]:
+        """
+        Build the registry key for a series: metric_name, plus the
+        configured label subset as {k=v,...}
+        """
+        if not metric_name:
+            return None
+        if not self.series_labels:
+            return metric_name
+        labels = labels or {}
+        parts = [f"{k}={labels[k]}" for k in self.series_labels if k in labels]
+        return f"{metric_name}{{{','.join(parts)}}}" if parts else metric_name
+
+    def path_for(self, key: str) -> str:
+        """Filesystem-safe, collision-free artifact path for a series key"""
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', key)[:80]
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        return os.path.join(self.model_dir, f"{slug}-{digest}.joblib")
+
+    @staticmethod
+    def version_for(key: str) -> str:
+        """model_version reported for results scored by a series model"""
+        return f"series_{hashlib.sha1(key.encode()).hexdigest()[:12]}"
+
+    def get(self, key: Optional[str]) -> Optional[IsolationForestWrapper]:
+        """
+        Return the model for a series, loading it from disk on first use.
+        Returns None if the series has no trained model.
+        """
+        if key is None:
+            return None
+
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        if key in self._missing:
+            return None
+
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            self._remember_missing(key)
+            return None
+
+        try:
+            model = IsolationForestWrapper(path, mmap=self.mmap)
+            model.load()
+        except Exception as e:
+            logger.error(f"Failed to load model for series {key}: {e}")
+            self._remember_missing(key)
+            return None
+
+        self.loads += 1
+        self._insert(key, model)
+        return model
+
+    def put(self, key: str, model: IsolationForestWrapper):
+        """Register a freshly trained model for a series"""
+        self._missing.pop(key, None)
+        self._evict_key(key)
+        self._insert(key, model)
+
+    def invalidate(self, key: Optional[str] = None):
+        """Drop one series (or everything) from the cache"""
+        if key is None:
+            self._cache.clear()
+            self._missing.clear()
+            self.resident_bytes = 0
+            return
+        self._missing.pop(key, None)
+        self._evict_key(key)
+
+    def _insert(self, key: str, model: IsolationForestWrapper):
+        nbytes = model.estimate_nbytes()
+        self._cache[key] = (model, nbytes)
+        self.resident_bytes += nbytes
+        # Evict least recently used series, but always keep the newest one
+        while self.resident_bytes > self.max_bytes and len(self._cache) > 1:
+            old_key, (_, old_bytes) = self._cache.popitem(last=False)
+            self.resident_bytes -= old_bytes
+            self.evictions += 1
+            logger.debug(f"Evicted model for series {old_key}")
+
+    def _evict_key(self, key: str):
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self.resident_bytes -= entry[1]
+
+    def _remember_missing(self, key: str):
+        self._missing[key] = None
+        if len(self._missing) > self.MAX_MISSING_KEYS:
+            self._missing.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "resident_models": len(self._cache),
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
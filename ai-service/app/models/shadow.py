@@ -0,0 +1,188 @@
+"""
+Shadow scoring of candidate models
+==================================
+
+A retrained model is not trusted blindly. It is published as an inactive
+candidate and scores a sample of the live metric batches alongside the
+active model:
+
+- the active model scores the batch on the hot path as usual
+- a sample of the batches is handed to a single background thread,
+  where the candidate scores it; a full queue drops the sample instead
+  of delaying scoring
+- per batch, prediction agreement, the mean score difference and both
+  scoring latencies are accumulated
+
+Once enough points were shadowed, verdict() promotes the candidate if it
+agrees with the active model often enough and is not slower by more than
+the allowed ratio, and rejects it otherwise (or when it failed to score
+live data, or never saw enough traffic before the deadline).
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import numpy as np
+from loguru import logger
+
+PENDING = "pending"
+PROMOTE = "promote"
+REJECT = "reject"
+
+
+class ShadowStats:
+    """Running totals of one candidate's shadow run"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.batches = 0
+        self.points = 0
+        self.agreed = 0
+        self.score_delta = 0.0
+        self.active_seconds = 0.0
+        self.candidate_seconds = 0.0
+        self.dropped = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "points": self.points,
+            "agreement": self.agreed / self.points if self.points else None,
+            "mean_score_delta": self.score_delta / self.points if self.points else None,
+            "active_us_per_point": self.active_seconds / self.points * 1e6 if self.points else None,
+            "candidate_us_per_point": self.candidate_seconds / self.points * 1e6 if self.points else None,
+            "latency_ratio": self.candidate_seconds / self.active_seconds if self.active_seconds > 0 else None,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "elapsed_seconds": time.monotonic() - self.started
+        }
+
+
+class ShadowScorer:
+    """
+    Scores sampled batches with a candidate model in a background thread
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 0.1,
+        min_points: int = 10000,
+        min_agreement: float = 0.98,
+        max_latency_ratio: float = 1.2,
+        max_hours: float = 24.0,
+        max_pending: int = 4
+    ):
+        self.sample_rate = sample_rate
+        self.min_points = min_points
+        self.min_agreement = min_agreement
+        self.max_latency_ratio = max_latency_ratio
+        self.max_hours = max_hours
+        self.max_pending = max_pending
+
+        self.model = None
+        self.version: Optional[str] = None
+        self.stats = ShadowStats()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+
+    @property
+    def active(self) -> bool:
+        return self.model is not None
+
+    def start(self, model, version: str):
+        """Start shadowing a candidate (replacing any previous one)"""
+        with self._lock:
+            self.model = model
+            self.version = version
+            self.stats = ShadowStats()
+        logger.info(f"Shadow scoring candidate {version} on {self.sample_rate:.0%} of batches")
+
+    def stop(self) -> dict:
+        """Stop shadowing; returns the final stats of the candidate"""
+        with self._lock:
+            stats = self.stats.as_dict()
+            self.model = None
+            self.version = None
+        return stats
+
+    def shutdown(self):
+        self.stop()
+        self._executor.shutdown(wait=False)
+
+    def observe(self, X: np.ndarray, scores: np.ndarray, predictions: np.ndarray, seconds: float):
+        """
+        Offer a batch the active model just scored. Never blocks: the
+        batch is either skipped by sampling, queued, or dropped.
+
+        Args:
+            X: Inputs the active model scored
+            scores: Its anomaly scores
+            predictions: Its predictions (-1 = anomaly)
+            seconds: Time the active model took
+        """
+        model, version = self.model, self.version
+        if model is None or random.random() >= self.sample_rate:
+            return
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.stats.dropped += 1
+                return
+            self._pending += 1
+
+        # The batch arrays are not reused by the caller, so no copy is needed
+        self._executor.submit(self._score, model, version, X, scores, predictions, seconds)
+
+    def _score(self, model, version: str, X: np.ndarray, scores: np.ndarray,
+               predictions: np.ndarray, seconds: float):
+        try:
+            if model.n_features == X.shape[1]:
+                inputs = X
+            elif model.n_features == 1:
+                # Raw-value candidate behind a feature model (value is column 0)
+                inputs = X[:, :1]
+            else:
+                raise ValueError(f"candidate takes {model.n_features} inputs, batch has {X.shape[1]}")
+
+            start = time.perf_counter()
+            candidate_scores, candidate_predictions = model.score_and_predict(inputs)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                if self.version != version:
+                    return
+                self.stats.batches += 1
+                self.stats.points += len(X)
+                self.stats.agreed += int(np.sum(candidate_predictions == predictions))
+                self.stats.score_delta += float(np.sum(np.abs(candidate_scores - scores)))
+                self.stats.active_seconds += seconds
+                self.stats.candidate_seconds += elapsed
+        except Exception as e:
+            with self._lock:
+                if self.version == version:
+                    self.stats.errors += 1
+            logger.error(f"Shadow scoring of {version} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def verdict(self) -> str:
+        """PROMOTE, REJECT or PENDING for the current candidate"""
+        with self._lock:
+            if self.model is None:
+                return PENDING
+            stats = self.stats.as_dict()
+
+        if stats["errors"]:
+            return REJECT
+        if stats["points"] < self.min_points:
+            if stats["elapsed_seconds"] > self.max_hours * 3600:
+                return REJECT
+            return PENDING
+
+        within_agreement = stats["agreement"] >= self.min_agreement
+        within_latency = stats["latency_ratio"] is not None and stats["latency_ratio"] <= self.max_latency_ratio
+        return PROMOTE if within_agreement and within_latency else REJECT
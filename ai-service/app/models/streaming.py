@@ -0,0 +1,296 @@
+"""
+Streaming statistical detectors
+===============================
+
+Lightweight alternatives to IsolationForest for simple gauges. Each
+backend keeps a few numbers of state per series, updates them in constant
+time per point and needs no training round-trip to Postgres:
+
+- ewma: exponentially weighted mean and variance bands
+- holt: EWMA bands around a Holt (level + trend) forecast
+- mad: robust z-score against the median/MAD of a fixed window
+- cusum: two-sided CUSUM change-point detection
+
+Backends are selected per metric_name (settings.detector_backends); all
+other metrics keep using IsolationForest. Scores follow the detector
+convention (lower is more abnormal) and are bounded to (-1, 0]: a point
+exactly at the alarm threshold scores -0.5.
+"""
+import math
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import numpy as np
+from loguru import logger
+
+# Statistic reported for a deviation from a perfectly flat series
+MAX_STATISTIC = 1e6
+# Spreads this small (relative to the level) count as a flat series
+SPREAD_EPSILON = 1e-9
+
+
+def _deviation(residual: float, spread: float, level: float) -> float:
+    """|residual| in units of spread, guarding against flat series"""
+    if spread > SPREAD_EPSILON * (abs(level) + 1.0):
+        return abs(residual) / spread
+    return MAX_STATISTIC if abs(residual) > SPREAD_EPSILON * (abs(level) + 1.0) else 0.0
+
+
+class StreamingDetector:
+    """
+    Base class: bounded per-series state (least recently updated series
+    are dropped first) and an O(1) update per point
+    """
+
+    name = "streaming"
+
+    def __init__(self, threshold: float, warmup: int = 10, max_series: int = 50000):
+        self.threshold = threshold
+        self.warmup = warmup
+        self.max_series = max_series
+        self._states: "OrderedDict[str, object]" = OrderedDict()
+
+    def _new_state(self):
+        raise NotImplementedError
+
+    def _step(self, state, value: float) -> float:
+        """Advance the series state by one point and return its statistic"""
+        raise NotImplementedError
+
+    def update(self, key: str, value: float) -> Tuple[float, bool]:
+        """
+        Score one point of a series.
+
+        Returns:
+            (anomaly_score in (-1, 0], is_anomaly)
+        """
+        state = self._states.get(key)
+        if state is None:
+            state = self._new_state()
+            self._states[key] = state
+            if len(self._states) > self.max_series:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+
+        warmed_up = state.n >= self.warmup
+        statistic = self._step(state, value)
+        state.n += 1
+
+        is_anomaly = warmed_up and statistic > self.threshold
+        return -statistic / (statistic + self.threshold), is_anomaly
+
+    def score_batch(self, items: List[Tuple[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score (key, value) points in stream order.
+
+        Returns:
+            (scores, predictions) with -1 for anomalies and 1 for normal points
+        """
+        scores = np.empty(len(items))
+        predictions = np.ones(len(items), dtype=int)
+        for i, (key, value) in enumerate(items):
+            scores[i], is_anomaly = self.update(key, value)
+            if is_anomaly:
+                predictions[i] = -1
+        return scores, predictions
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "series": len(self._states)}
+
+
+class HoltState:
+    __slots__ = ("n", "level", "trend", "var")
+
+    def __init__(self):
+        self.n = 0
+        self.level = 0.0
+        self.trend = 0.0
+        self.var = 0.0
+
+
+def _smoothing(alpha: float, n: int) -> float:
+    """EW smoothing factor, averaging plainly over the first 1/alpha points"""
+    return max(alpha, 1.0 / n)
+
+
+class HoltDetector(StreamingDetector):
+    """
+    Bands of `threshold` EW standard deviations around a Holt forecast
+    (level + trend). The residual variance is smoothed more slowly than
+    the level, so the bands don't collapse after a few quiet points.
+    """
+
+    name = "holt"
+
+    def __init__(self, alpha: float = 0.3, beta: float = 0.1, threshold: float = 3.0,
+                 variance_alpha: float = 0.05, **kwargs):
+        super().__init__(threshold, **kwargs)
+        self.alpha = alpha
+        self.beta = beta
+        self.variance_alpha = variance_alpha
+
+    def _new_state(self):
+        return HoltState()
+
+    def _step(self, state: HoltState, value: float) -> float:
+        if state.n == 0:
+            state.level = value
+            return 0.0
+
+        forecast = state.level + state.trend
+        residual = value - forecast
+        statistic = _deviation(residual, math.sqrt(state.var), forecast)
+
+        level = self.alpha * value + (1 - self.alpha) * forecast
+        state.trend = self.beta * (level - state.level) + (1 - self.beta) * state.trend
+        state.level = level
+        gamma = _smoothing(self.variance_alpha, state.n)
+        state.var = (1 - gamma) * (state.var + gamma * residual * residual)
+        return statistic
+
+
+class EwmaDetector(HoltDetector):
+    """EWMA bands: Holt without the trend term"""
+
+    name = "ewma"
+
+    def __init__(self, alpha: float = 0.3, threshold: float = 3.0, **kwargs):
+        super().__init__(alpha=alpha, beta=0.0, threshold=threshold, **kwargs)
+
+
+class MadState:
+    __slots__ = ("n", "values", "head")
+
+    def __init__(self, window: int):
+        self.n = 0
+        self.values = np.empty(window, dtype=np.float64)
+        self.head = 0
+
+
+class MadDetector(StreamingDetector):
+    """
+    Robust z-score 0.6745 * |x - median| / MAD against the previous
+    `window` points (Iglewicz and Hoaglin; 3.5 is their outlier cut-off).
+    The window is a fixed-size ring buffer, so the cost per point is
+    bounded by the window, not by the length of the series.
+    """
+
+    name = "mad"
+
+    def __init__(self, window: int = 64, threshold: float = 3.5, **kwargs):
+        super().__init__(threshold, **kwargs)
+        self.window = window
+
+    def _new_state(self):
+        return MadState(self.window)
+
+    def _step(self, state: MadState, value: float) -> float:
+        count = min(state.n, self.window)
+        statistic = 0.0
+        if count >= 3:
+            recent = state.values[:count]
+            median = float(np.median(recent))
+            mad = float(np.median(np.abs(recent - median)))
+            statistic = 0.6745 * _deviation(value - median, mad, median)
+
+        state.values[state.head] = value
+        state.head = (state.head + 1) % self.window
+        return statistic
+
+
+class CusumState:
+    __slots__ = ("n", "since", "mean", "var", "high", "low")
+
+    def __init__(self):
+        self.n = 0
+        # Points since the last change point (the level is relearned after one)
+        self.since = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.high = 0.0
+        self.low = 0.0
+
+
+class CusumDetector(StreamingDetector):
+    """
+    Two-sided CUSUM on values standardized by slow EW mean/variance.
+    `drift` is the allowance k and `threshold` the decision interval h
+    (both in standard deviations). After a change point the new level is
+    relearned over `relearn` points, keeping the in-control variance.
+    """
+
+    name = "cusum"
+
+    def __init__(self, drift: float = 0.5, threshold: float = 5.0, alpha: float = 0.02,
+                 warmup: int = 30, relearn: int = 10, **kwargs):
+        super().__init__(threshold, warmup=warmup, **kwargs)
+        self.drift = drift
+        self.alpha = alpha
+        self.relearn = relearn
+
+    def _new_state(self):
+        return CusumState()
+
+    def _step(self, state: CusumState, value: float) -> float:
+        state.since += 1
+        if state.since == 1:
+            state.mean = value
+            return 0.0
+
+        diff = value - state.mean
+        alpha = _smoothing(self.alpha, state.since - 1)
+        if state.n < self.warmup:
+            # Learn the in-control level and spread before accumulating
+            state.mean += alpha * diff
+            state.var = (1 - alpha) * (state.var + alpha * diff * diff)
+            return 0.0
+        if state.since <= self.relearn:
+            state.mean += alpha * diff
+            return 0.0
+
+        std = math.sqrt(state.var)
+        z = diff / std if std > SPREAD_EPSILON * (abs(state.mean) + 1.0) else 0.0
+        state.high = max(0.0, state.high + z - self.drift)
+        state.low = max(0.0, state.low - z - self.drift)
+        statistic = max(state.high, state.low)
+
+        if statistic > self.threshold:
+            state.high = state.low = 0.0
+            state.since = 0
+        else:
+            state.mean += alpha * diff
+            state.var = (1 - alpha) * (state.var + alpha * diff * diff)
+        return statistic
+
+
+BACKENDS = {
+    "ewma": EwmaDetector,
+    "holt": HoltDetector,
+    "mad": MadDetector,
+    "cusum": CusumDetector,
+}
+
+
+def build_backends(metric_backends: Dict[str, str], max_series: int = 50000) -> Dict[str, StreamingDetector]:
+    """
+    Instantiate the configured streaming backends.
+
+    Args:
+        metric_backends: metric_name -> backend name
+        max_series: Series kept per backend
+
+    Returns:
+        metric_name -> detector (one shared instance per backend)
+    """
+    instances: Dict[str, StreamingDetector] = {}
+    selected = {}
+    for metric_name, backend in metric_backends.items():
+        if backend == "isolation_forest":
+            continue
+        if backend not in BACKENDS:
+            logger.error(f"Unknown detector backend '{backend}' for {metric_name}, using isolation_forest")
+            continue
+        if backend not in instances:
+            instances[backend] = BACKENDS[backend](max_series=max_series)
+        selected[metric_name] = instances[backend]
+    return selected
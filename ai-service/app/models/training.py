@@ -0,0 +1,149 @@
+"""
+Process-pool training engine
+============================
+
+IsolationForest fitting and the joblib save are CPU bound and hold the
+GIL, so running them on the default thread pool slows down the event loop
+that consumes the stream. The engine fits models in separate worker
+processes instead:
+
+- training data is handed over through a temporary .npy file (on tmpfs
+  when available) that the worker memory-maps, instead of pickling the
+  array through the pool's pipe
+- the worker fits and saves the model; the caller then memory-maps the
+  saved .npy artifact, so the fitted trees are never pickled back through
+  the pipe and the page cache holds the only copy
+- many per-series models are fitted in parallel, one per worker process
+- incremental updates (partial_fit on a recent window) run the same way
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+import numpy as np
+from loguru import logger
+from app.models.isolation_forest import IsolationForestWrapper
+
+
+def _fit_worker(data_path: str, model_path: str, n_jobs: int) -> str:
+    """Runs in a worker process: fit a model from a .npy file and save it"""
+    data = np.load(data_path, mmap_mode='r')
+    model = IsolationForestWrapper(model_path, n_jobs=n_jobs)
+    model.train(data)
+    return model_path
+
+
+def _update_worker(data_path: str, base_path: Optional[str], model_path: str, n_jobs: int,
+                   n_trees: int, max_trees: int) -> str:
+    """Runs in a worker process: extend the model at base_path with a window and save it at model_path"""
+    data = np.load(data_path, mmap_mode='r')
+    model = IsolationForestWrapper(base_path or model_path, n_jobs=n_jobs)
+    if base_path and os.path.exists(base_path):
+        model.load()
+    model.model_path = model_path
+    model.partial_fit(data, n_trees=n_trees, max_trees=max_trees)
+    return model_path
+
+
+class TrainingEngine:
+    """
+    Fits IsolationForest models in a pool of worker processes
+    """
+
+    def __init__(self, max_workers: int = 2, tmp_dir: Optional[str] = None):
+        self.max_workers = max(1, max_workers)
+        if not tmp_dir and os.path.isdir('/dev/shm'):
+            tmp_dir = '/dev/shm'
+        self.tmp_dir = tmp_dir or None
+        # Split the cores between the workers so parallel fits don't oversubscribe
+        self.n_jobs = max(1, (os.cpu_count() or 1) // self.max_workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: never fork a process that runs an event loop and threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Training engine started ({self.max_workers} worker processes)")
+        return self._executor
+
+    def _write_data(self, data) -> str:
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        fd, path = tempfile.mkstemp(prefix="enod-train-", suffix=".npy", dir=self.tmp_dir)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, data)
+        return path
+
+    async def train(self, data, model_path: str) -> IsolationForestWrapper:
+        """
+        Fit a model in a worker process. The model is saved at model_path
+        and returned loaded.
+        """
+        loop = asyncio.get_running_loop()
+        data_path = await loop.run_in_executor(None, self._write_data, data)
+        try:
+            await loop.run_in_executor(
+                self._get_executor(), _fit_worker, data_path, model_path, self.n_jobs
+            )
+        finally:
+            os.unlink(data_path)
+
+        model = IsolationForestWrapper(model_path)
+        await loop.run_in_executor(None, model.load)
+        return model
+
+    async def update(self, data, base_path: Optional[str], model_path: str,
+                     n_trees: int, max_trees: int) -> IsolationForestWrapper:
+        """
+        Incrementally update the model saved at base_path with a window of
+        recent data (see IsolationForestWrapper.partial_fit) in a worker
+        process. The result is saved at model_path and returned loaded.
+        """
+        loop = asyncio.get_running_loop()
+        data_path = await loop.run_in_executor(None, self._write_data, data)
+        try:
+            await loop.run_in_executor(
+                self._get_executor(), _update_worker,
+                data_path, base_path, model_path, self.n_jobs, n_trees, max_trees
+            )
+        finally:
+            os.unlink(data_path)
+
+        model = IsolationForestWrapper(model_path)
+        await loop.run_in_executor(None, model.load)
+        return model
+
+    async def train_many(self, datasets: Dict[str, tuple]) -> Dict[str, IsolationForestWrapper]:
+        """
+        Fit several models in parallel across the worker processes.
+
+        Args:
+            datasets: key -> (data, model_path)
+
+        Returns:
+            key -> trained model (keys whose fit failed are left out)
+        """
+        keys = list(datasets)
+        results = await asyncio.gather(
+            *(self.train(*datasets[key]) for key in keys),
+            return_exceptions=True
+        )
+
+        models = {}
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logger.error(f"Training failed for {key}: {result}")
+            else:
+                models[key] = result
+        return models
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,309 @@
+"""
+Streaming training data loader
+==============================
+
+Streams metric values from the metrics table in chunks and decodes them
+straight into preallocated float64 arrays, so memory stays flat no matter
+how many rows match:
+
+- copy: binary COPY ... TO STDOUT, decoded with NumPy (fastest)
+- cursor: server-side asyncpg cursor, fetched chunk by chunk
+
+Rows can be limited to a time window per metric, pre-sampled on the server
+with TABLESAMPLE SYSTEM, and are reduced to a uniform reservoir sample when
+more rows match than the row budget allows.
+
+With a feature window, rows are streamed in time order per series and
+turned into feature vectors (app.features) before they are sampled.
+"""
+import json
+import struct
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from loguru import logger
+from app.database import get_db_pool
+from app.features import FEATURE_NAMES, compute_features
+
+# Binary COPY signature (followed by int32 flags and int32 extension length)
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+# One single-column float8 tuple: int16 field count, int32 length, float8 value
+COPY_ROW_DTYPE = np.dtype([('fields', '>i2'), ('length', '>i4'), ('value', '>f8')])
+
+
+class ReservoirSampler:
+    """
+    Uniform sample of at most `capacity` values (or rows of `width` values)
+    from a stream (Algorithm R), applied a whole chunk at a time into a
+    preallocated buffer
+    """
+
+    def __init__(self, capacity: int, rng: Optional[np.random.Generator] = None, width: Optional[int] = None):
+        self.capacity = capacity
+        self.buffer = np.empty(capacity if width is None else (capacity, width), dtype=np.float64)
+        self.seen = 0
+        self.rng = rng or np.random.default_rng()
+
+    def add(self, values: np.ndarray):
+        n = len(values)
+        if n == 0:
+            return
+
+        # Fill phase
+        fill = min(max(self.capacity - self.seen, 0), n)
+        if fill:
+            self.buffer[self.seen:self.seen + fill] = values[:fill]
+
+        # Replacement phase: item i replaces slot j ~ U[0, i] when j < capacity.
+        # Later items overwrite earlier ones on collisions, as in the sequential algorithm.
+        rest = values[fill:]
+        if len(rest):
+            positions = np.arange(self.seen + fill, self.seen + n)
+            slots = self.rng.integers(0, positions + 1)
+            keep = slots < self.capacity
+            self.buffer[slots[keep]] = rest[keep]
+
+        self.seen += n
+
+    def result(self) -> np.ndarray:
+        return self.buffer[:min(self.seen, self.capacity)]
+
+
+class BinaryCopyDecoder:
+    """
+    Incremental decoder for a binary COPY stream of one NOT NULL float8 column
+    """
+
+    def __init__(self):
+        self._pending = b''
+        self._header_done = False
+        self.finished = False
+
+    def feed(self, data: bytes) -> np.ndarray:
+        buffer = self._pending + data
+
+        if not self._header_done:
+            if len(buffer) < len(COPY_SIGNATURE) + 8:
+                self._pending = buffer
+                return np.empty(0)
+            if not buffer.startswith(COPY_SIGNATURE):
+                raise ValueError("Invalid binary COPY signature")
+            ext_length = struct.unpack_from('>i', buffer, len(COPY_SIGNATURE) + 4)[0]
+            header_length = len(COPY_SIGNATURE) + 8 + ext_length
+            if len(buffer) < header_length:
+                self._pending = buffer
+                return np.empty(0)
+            buffer = buffer[header_length:]
+            self._header_done = True
+
+        count = len(buffer) // COPY_ROW_DTYPE.itemsize
+        rows = np.frombuffer(buffer, dtype=COPY_ROW_DTYPE, count=count)
+
+        # File trailer is a field count of -1
+        ended = np.flatnonzero(rows['fields'] != 1)
+        if len(ended):
+            rows = rows[:ended[0]]
+            self.finished = True
+            self._pending = b''
+        else:
+            self._pending = buffer[count * COPY_ROW_DTYPE.itemsize:]
+            if self._pending[:2] == b'\xff\xff':
+                self.finished = True
+
+        if len(rows) and np.any(rows['length'] != 8):
+            raise ValueError("Unexpected NULL or non-float8 value in COPY stream")
+        return rows['value'].astype(np.float64)
+
+
+class TrainingDataLoader:
+    """
+    Loads training values from the metrics table with bounded memory
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 50000,
+        method: str = "copy",
+        query_timeout: float = 600.0,
+        seed: Optional[int] = None
+    ):
+        self.chunk_size = chunk_size
+        self.method = method
+        self.query_timeout = query_timeout
+        self.seed = seed
+
+    def _build_query(
+        self,
+        metric_name: Optional[str],
+        labels_json: Optional[str],
+        window_hours: Optional[float],
+        sample_percent: Optional[float],
+        ordered: bool = False,
+        holdout_hours: Optional[float] = None
+    ) -> Tuple[str, list]:
+        # Percentage is validated as a float and inlined
+        sample = f" TABLESAMPLE SYSTEM ({float(sample_percent)})" if sample_percent else ""
+        conditions = []
+        args = []
+        if metric_name is not None:
+            args.append(metric_name)
+            conditions.append(f"metric_name = ${len(args)}")
+        if labels_json:
+            args.append(labels_json)
+            conditions.append(f"labels @> ${len(args)}::jsonb")
+        if window_hours:
+            args.append(float(window_hours) * 3600)
+            conditions.append(f"timestamp >= NOW() - make_interval(secs => ${len(args)})")
+        if holdout_hours:
+            # Most recent rows are held out for evaluation
+            args.append(float(holdout_hours) * 3600)
+            conditions.append(f"timestamp < NOW() - make_interval(secs => ${len(args)})")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        if ordered:
+            # Series identity, epoch and value, in time order per series
+            return (
+                "SELECT metric_name || labels::text AS series,"
+                " EXTRACT(EPOCH FROM timestamp)::float8, metric_value::float8"
+                f" FROM metrics{sample}{where} ORDER BY series, timestamp"
+            ), args
+        return f"SELECT metric_value::float8 FROM metrics{sample}{where}", args
+
+    async def load(
+        self,
+        metric_name: Optional[str] = None,
+        labels: Optional[dict] = None,
+        window_hours: Optional[float] = None,
+        row_budget: int = 100000,
+        sample_percent: Optional[float] = None,
+        feature_window: Optional[int] = None,
+        holdout_hours: Optional[float] = None
+    ) -> np.ndarray:
+        """
+        Stream matching metric values into a float64 array of at most
+        row_budget values (a uniform sample if more rows match).
+
+        With a feature_window, returns (n, len(FEATURE_NAMES)) feature
+        vectors instead. Server-side sampling is skipped then, since the
+        features need consecutive points. Rows from the last holdout_hours
+        are left out.
+        """
+        query, args = self._build_query(
+            metric_name,
+            json.dumps(labels) if labels else None,
+            window_hours,
+            None if feature_window else sample_percent,
+            ordered=bool(feature_window),
+            holdout_hours=holdout_hours
+        )
+        sampler = ReservoirSampler(
+            row_budget,
+            np.random.default_rng(self.seed),
+            width=len(FEATURE_NAMES) if feature_window else None
+        )
+
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            if feature_window:
+                await self._load_features(conn, query, args, sampler, feature_window)
+            elif self.method == "copy":
+                await self._load_copy(conn, query, args, sampler)
+            else:
+                await self._load_cursor(conn, query, args, sampler)
+
+        if sampler.seen > row_budget:
+            logger.info(f"Sampled {row_budget} of {sampler.seen} rows for {metric_name or 'all metrics'}")
+        return sampler.result()
+
+    async def _load_copy(self, conn, query: str, args: list, sampler: ReservoirSampler):
+        decoder = BinaryCopyDecoder()
+
+        async def on_data(data: bytes):
+            sampler.add(decoder.feed(bytes(data)))
+
+        await conn.copy_from_query(query, *args, output=on_data, format='binary', timeout=self.query_timeout)
+
+    async def _load_cursor(self, conn, query: str, args: list, sampler: ReservoirSampler):
+        # Server-side cursors only live inside a transaction
+        async with conn.transaction():
+            cursor = await conn.cursor(query, *args, timeout=self.query_timeout)
+            while True:
+                records = await cursor.fetch(self.chunk_size, timeout=self.query_timeout)
+                if not records:
+                    break
+                sampler.add(np.fromiter((r[0] for r in records), dtype=np.float64, count=len(records)))
+
+    async def _load_features(self, conn, query: str, args: list, sampler: ReservoirSampler, window: int):
+        # Feature history is carried across chunks and reset at series boundaries
+        series = None
+        history = np.empty(0)
+        last_timestamp = None
+
+        async with conn.transaction():
+            cursor = await conn.cursor(query, *args, timeout=self.query_timeout)
+            while True:
+                records = await cursor.fetch(self.chunk_size, timeout=self.query_timeout)
+                if not records:
+                    break
+                keys = [r[0] for r in records]
+                timestamps = np.fromiter((r[1] for r in records), dtype=np.float64, count=len(records))
+                values = np.fromiter((r[2] for r in records), dtype=np.float64, count=len(records))
+
+                # Runs of consecutive rows of the same series
+                bounds = [0] + [i for i in range(1, len(keys)) if keys[i] != keys[i - 1]] + [len(keys)]
+                for start, end in zip(bounds, bounds[1:]):
+                    if keys[start] != series:
+                        series = keys[start]
+                        history = np.empty(0)
+                        last_timestamp = None
+                    sampler.add(compute_features(
+                        values[start:end], timestamps[start:end], window, history, last_timestamp
+                    ))
+                    history = np.concatenate([history, values[start:end]])[-window:]
+                    last_timestamp = timestamps[end - 1]
+
+    async def list_series(self, window_hours: Optional[float], label_keys: List[str]) -> List[Tuple[str, dict]]:
+        """
+        Distinct (metric_name, label subset) pairs with data in the window
+        """
+        args: list = [list(label_keys)]
+        where = ""
+        if window_hours:
+            args.append(float(window_hours) * 3600)
+            where = "WHERE timestamp >= NOW() - make_interval(secs => $2)"
+
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT DISTINCT
+                    metric_name,
+                    (SELECT COALESCE(jsonb_object_agg(key, value), '{{}}'::jsonb)
+                     FROM jsonb_each_text(labels)
+                     WHERE key = ANY($1::text[]))::text AS labels
+                FROM metrics
+                {where}
+            """, *args, timeout=self.query_timeout)
+
+        return [(r['metric_name'], json.loads(r['labels'])) for r in rows]
+
+    async def load_series(
+        self,
+        series: List[Tuple[str, dict]],
+        window_hours: Dict[str, float],
+        default_window_hours: Optional[float],
+        row_budget: int,
+        feature_window: Optional[int] = None
+    ) -> List[Tuple[str, dict, np.ndarray]]:
+        """
+        Load every series with its own time window, one stream at a time.
+        Returns (metric_name, labels, values) per series.
+        """
+        data = []
+        for metric_name, labels in series:
+            values = await self.load(
+                metric_name=metric_name,
+                labels=labels or None,
+                window_hours=window_hours.get(metric_name, default_window_hours),
+                row_budget=row_budget,
+                feature_window=feature_window
+            )
+            data.append((metric_name, labels, values))
+        return data
@@ -0,0 +1,121 @@
+"""
+Bounded worker lanes for the stream consumer
+============================================
+
+The consumer reads the stream once and dispatches work into separate lanes:
+- fast lane: metric micro-batches (anomaly detection, milliseconds)
+- slow lane: alerts (deduplication + LLM analysis, minutes)
+
+Each lane has its own worker count and in-flight cap. submit() waits while
+a lane is at its cap, so a saturated lane pushes back on the stream reader
+instead of buffering without bound. A caller that must not wait (the reader
+in front of the alert lane) checks free_slots() and submits only that many.
+
+A prioritized lane hands queued items to its workers by priority (lowest
+first, then submission order) instead of first in, first out.
+"""
+import asyncio
+import itertools
+from typing import Any, Awaitable, Callable
+from loguru import logger
+
+
+class WorkerLane:
+    """
+    Bounded worker pool consuming work items with a single async handler
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[None]],
+        workers: int,
+        max_in_flight: int,
+        prioritized: bool = False
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_in_flight = max(self.workers, max_in_flight)
+        self.prioritized = prioritized
+
+        # Prioritized lanes queue (priority, submission, item)
+        self._queue: asyncio.Queue = asyncio.PriorityQueue() if prioritized else asyncio.Queue()
+        self._submitted = itertools.count()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._tasks = []
+
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        """Spawn the lane workers (must run inside the event loop)"""
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}"))
+        logger.info(f"Lane '{self.name}' started ({self.workers} workers, max {self.max_in_flight} in flight)")
+
+    async def submit(self, item: Any, priority: Any = 0):
+        """
+        Enqueue an item, waiting while the lane is at its in-flight cap
+
+        Args:
+            priority: Sort key in a prioritized lane, lower is handled first
+                (ignored otherwise)
+        """
+        await self._slots.acquire()
+        self.in_flight += 1
+        if self.prioritized:
+            self._queue.put_nowait((priority, next(self._submitted), item))
+        else:
+            self._queue.put_nowait(item)
+
+    def free_slots(self) -> int:
+        """Items that can be submitted right now without waiting"""
+        return self.max_in_flight - self.in_flight
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            if self.prioritized:
+                item = item[2]
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Lane '{self.name}' handler error: {e}")
+            finally:
+                self.in_flight -= 1
+                self._slots.release()
+                self._queue.task_done()
+
+    async def stop(self, drain: bool = True, timeout: float = 30.0):
+        """
+        Stop the lane workers
+
+        Args:
+            drain: Wait for queued items to finish before stopping
+            timeout: Max seconds to wait for the drain
+        """
+        if drain and self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Lane '{self.name}' drain timed out with {self.in_flight} items in flight")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Lane '{self.name}' stopped")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queued": self._queue.qsize(),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -1,9 +1,18 @@
 import json
+import time
 import asyncio
+from collections import deque
 import redis.asyncio as redis
 from loguru import logger
 from app.config import get_settings
 from app.database import get_db_pool
+from app.pipeline import WorkerLane
+from app.services.analysis_writer import AnalysisWriter, analysis_record
+from app.services.dedup_cache import DedupStateCache
+from app.services.llm_cache import LLMResultCache
+from app.services.deduplication import ResourceAwareDeduplicator
+from app.services.llm_queue import job_priority
+from app.services.similarity import SimilarityIndex
 
 class RedisClient:
     def __init__(self):
@@ -36,7 +45,7 @@ class RedisClient:
             logger.error(f"Redis connection error: {e}")
             # Don't raise here, allow retry in main loop or handle gracefully
 
-    async def consume(self):
+    async def consume(self, block_ms: int = 1000):
         if not self.redis:
             return []
 
@@ -45,8 +54,8 @@ class RedisClient:
                 groupname=self.settings.redis_group,
                 consumername=self.consumer_name,
                 streams={self.settings.redis_stream: '>'},
-                count=10,
-                block=1000
+                count=self.settings.stream_read_count,
+                block=block_ms
             )
             return messages
         except redis.ConnectionError:
@@ -56,17 +65,46 @@ class RedisClient:
             logger.error(f"Error consuming stream: {e}")
             return []
 
-    async def ack(self, message_id):
-        if self.redis:
+    async def ack(self, *message_ids):
+        """Acknowledge one or more messages with a single XACK"""
+        if self.redis and message_ids:
             try:
-                await self.redis.xack(self.settings.redis_stream, self.settings.redis_group, message_id)
+                await self.redis.xack(self.settings.redis_stream, self.settings.redis_group, *message_ids)
             except Exception as e:
-                logger.error(f"Failed to ACK message {message_id}: {e}")
+                logger.error(f"Failed to ACK messages {', '.join(message_ids)}: {e}")
+
+    async def claim(self, *message_ids):
+        """
+        Take over pending messages (XCLAIM, which also resets their idle time)
+        and return their (message_id, data) entries; None if Redis failed.
+        Entries trimmed from the stream meanwhile are left out.
+        """
+        if not self.redis:
+            return None
+        if not message_ids:
+            return []
+
+        try:
+            claimed = await self.redis.xclaim(
+                self.settings.redis_stream,
+                self.settings.redis_group,
+                self.consumer_name,
+                min_idle_time=0,
+                message_ids=list(message_ids)
+            )
+            return [(message_id, data) for message_id, data in claimed if data]
+        except Exception as e:
+            logger.error(f"Failed to claim {len(message_ids)} pending messages: {e}")
+            return None
 
-    async def cleanup_old_pending(self, max_idle_ms=300000):
+    async def cleanup_old_pending(self, max_idle_ms=300000, keep=()):
         """
         Clean up old pending messages (older than 5 minutes by default)
         These are messages that failed to process and are blocking the queue
+
+        Args:
+            keep: Message ids still held by the consumer (queued, running,
+                deferred or waiting for the writer), never ACKed here
         """
         if not self.redis:
             return 0
@@ -96,7 +134,7 @@ class RedisClient:
                 idle_time = msg['time_since_delivered']
 
                 # If message is stuck (idle > 5 minutes), acknowledge it
-                if idle_time > max_idle_ms:
+                if idle_time > max_idle_ms and message_id not in keep:
                     logger.warning(f"Cleaning up stuck message {message_id} (idle: {idle_time}ms)")
                     await self.redis.xack(self.settings.redis_stream, self.settings.redis_group, message_id)
                     cleaned += 1
@@ -124,56 +162,139 @@ class RedisConsumer:
         self.client = RedisClient()
         self.running = False
         self.settings = get_settings()
+        self.metric_lane = None
+        self.alert_lane = None
+        # Alerts the alert lane had no room for: left unACKed in the consumer
+        # group's pending list and claimed back once the lane has room
+        self.deferred_alerts = deque()
+        # Every message read and not ACKed yet (queued in a lane, running,
+        # deferred or waiting for the writer): the stuck-message cleanup
+        # must not ACK them, however long an LLM analysis takes
+        self.held_messages = set()
+        # (alertname, instance) -> (severity, followers) of the alert whose
+        # analysis is queued or running: later alerts of the pair follow it
+        # instead of being analyzed again, until the analysis is stored
+        self.pending_analyses = {}
+        # ai_analysis_results rows are written in bulk; messages are ACKed
+        # once their rows are committed
+        self.writer = AnalysisWriter(
+            ack=self._ack,
+            max_rows=self.settings.analysis_flush_rows,
+            flush_interval_ms=self.settings.analysis_flush_interval_ms,
+            max_buffered=self.settings.analysis_buffer_max_rows
+        )
+        # Last analysis per (alertname, instance): memory + shared Redis hash
+        self.dedup_cache = DedupStateCache(
+            hash_key=self.settings.dedup_cache_hash,
+            max_entries=self.settings.dedup_cache_max_entries,
+            local_ttl=self.settings.dedup_cache_local_ttl
+        )
+        # Recent analyses by MinHash signature, for near-duplicate alerts
+        self.similarity = None
+        if self.settings.similarity_enabled:
+            self.similarity = SimilarityIndex(
+                prefix=self.settings.similarity_prefix,
+                num_perm=self.settings.similarity_num_perm,
+                bands=self.settings.similarity_bands,
+                threshold=self.settings.similarity_threshold,
+                ttl_seconds=self.settings.similarity_ttl_seconds,
+                max_entries=self.settings.similarity_max_entries
+            )
+        # LLM analyses by normalized prompt inputs: memory + Redis, single flight
+        self.llm_cache = None
+        if self.settings.llm_cache_enabled:
+            self.llm_cache = LLMResultCache(
+                prefix=self.settings.llm_cache_prefix,
+                max_entries=self.settings.llm_cache_max_entries,
+                ttl_seconds=self.settings.llm_cache_ttl_seconds
+            )
+        self.deduplicator = ResourceAwareDeduplicator(
+            writer=self.writer,
+            cache=self.dedup_cache,
+            max_firing=self.settings.alert_state_max_firing,
+            similarity=self.similarity
+        )
 
     async def start_consuming(self):
         """Start consuming messages from Redis Stream"""
-        from app.detector import AnomalyDetector
+        from app.model_manager import model_manager
         from app.services.hybrid_analyzer import LLMAnalyzer
 
         logger.info("Starting Redis consumer...")
         self.running = True
 
-        # Initialize components
-        detector = AnomalyDetector()
-        llm_analyzer = LLMAnalyzer(f"http://{self.settings.ollama_host}:{self.settings.ollama_port}")
+        # Initialize components (the detector is shared, so retrained models
+        # are picked up without a restart)
+        detector = model_manager.detector
+        llm_analyzer = LLMAnalyzer(
+            f"http://{self.settings.ollama_host}:{self.settings.ollama_port}",
+            cache=self.llm_cache
+        )
+
+        self._start_lanes(detector, llm_analyzer)
+        self.writer.start()
 
         # Connect to Redis
         await self.client.connect()
+        self.dedup_cache.redis = self.client.redis
+        if self.similarity is not None:
+            self.similarity.redis = self.client.redis
+        if self.llm_cache is not None:
+            self.llm_cache.redis = self.client.redis
+        loop = asyncio.get_running_loop()
 
         # Cleanup counter for periodic pending message cleanup
         cleanup_counter = 0
         cleanup_interval = 50  # Clean up every 50 iterations (~5 seconds)
 
+        # Metric micro-batch: (message_id, message_data) pairs waiting to be scored
+        metric_batch = []
+        batch_started = 0.0
+        batch_window = self.settings.metric_batch_window_ms / 1000
+        batch_size = self.settings.metric_batch_size if self.settings.metric_batch_enabled else 1
+
         while self.running:
             try:
                 # Periodic cleanup of stuck pending messages
                 cleanup_counter += 1
                 if cleanup_counter >= cleanup_interval:
-                    await self.client.cleanup_old_pending()
+                    await self.client.cleanup_old_pending(keep=self.held_messages)
                     cleanup_counter = 0
 
-                messages = await self.client.consume()
+                # Don't block on the stream past the end of an open batch window
+                block_ms = 1000
+                if metric_batch:
+                    remaining = batch_started + batch_window - loop.time()
+                    block_ms = max(1, min(block_ms, int(remaining * 1000)))
+
+                messages = await self.client.consume(block_ms=block_ms)
 
-                if not messages:
+                if not messages and not metric_batch and not self.deferred_alerts:
                     await asyncio.sleep(0.1)
                     continue
 
-                # Process each message
-                for stream_name, message_list in messages:
+                # Metrics go to the fast lane (submit waits when it is full),
+                # everything else to the alert lane (never waited on)
+                alert_entries = []
+                for stream_name, message_list in messages or []:
                     for message_id, message_data in message_list:
-                        try:
-                            await self._process_message(
-                                message_id,
-                                message_data,
-                                detector,
-                                llm_analyzer
-                            )
-                            # Acknowledge message ALWAYS (even on error, to avoid blocking)
-                            await self.client.ack(message_id)
-                        except Exception as e:
-                            logger.error(f"Error processing message {message_id}: {e}")
-                            # ACK anyway to prevent blocking the queue
-                            await self.client.ack(message_id)
+                        self.held_messages.add(message_id)
+                        if message_data.get('type') == 'metric':
+                            if not metric_batch:
+                                batch_started = loop.time()
+                            metric_batch.append((message_id, message_data))
+                            if len(metric_batch) >= batch_size:
+                                await self.metric_lane.submit(metric_batch)
+                                metric_batch = []
+                        else:
+                            alert_entries.append((message_id, message_data))
+
+                await self._submit_alerts(alert_entries)
+
+                # Flush the batch once the read (or the batch window) is complete
+                if metric_batch and loop.time() - batch_started >= batch_window:
+                    await self.metric_lane.submit(metric_batch)
+                    metric_batch = []
 
             except asyncio.CancelledError:
                 logger.info("Consumer task cancelled")
@@ -182,10 +303,227 @@ class RedisConsumer:
                 logger.error(f"Consumer loop error: {e}")
                 await asyncio.sleep(5)  # Wait before retry
 
+        if metric_batch:
+            await self.metric_lane.submit(metric_batch)
+        if self.deferred_alerts:
+            logger.info(f"{len(self.deferred_alerts)} deferred alerts left pending in the consumer group")
+
+        # Metric batches finish quickly; in-flight LLM calls are abandoned and
+        # their messages stay pending in the consumer group
+        await self.metric_lane.stop(drain=True)
+        await self.alert_lane.stop(drain=False)
+        # Write out buffered results and ACK their messages
+        await self.writer.stop()
+
+        await llm_analyzer.close()
         await self.client.close()
         logger.info("Redis consumer stopped")
 
-    async def _process_message(self, message_id: str, data: dict, detector, llm_analyzer):
+    def _start_lanes(self, detector, llm_analyzer):
+        """
+        Fast lane for metric batches, slow lane for alerts (LLM analysis).
+        Each lane has its own concurrency and in-flight cap, so metric
+        detection never waits behind an LLM call. Alerts are taken by
+        job_priority, most urgent first.
+        """
+        self.metric_lane = WorkerLane(
+            "metrics",
+            lambda batch: self._process_metric_batch(batch, detector),
+            workers=self.settings.metric_lane_workers,
+            max_in_flight=self.settings.metric_lane_max_in_flight
+        )
+        self.alert_lane = WorkerLane(
+            "alerts",
+            lambda entry: self._handle_entry(entry, detector, llm_analyzer),
+            workers=self.alert_lane_workers(),
+            max_in_flight=self.settings.alert_lane_max_in_flight,
+            prioritized=True
+        )
+        self.metric_lane.start()
+        self.alert_lane.start()
+
+    def alert_lane_workers(self) -> int:
+        """
+        Alert workers: enough for every LLM slot the limiter may open plus
+        its full wait queue, so the limit is measured rather than capped by
+        the lane, and waiting jobs are ordered and shed by the limiter
+        """
+        return max(
+            self.settings.alert_lane_workers,
+            self.settings.llm_concurrency_max + self.settings.llm_queue_max_waiting
+        )
+
+    async def _ack(self, *message_ids):
+        """ACK messages and stop holding them"""
+        self.held_messages.difference_update(message_ids)
+        await self.client.ack(*message_ids)
+
+    async def _handle_entry(self, entry: tuple, detector, llm_analyzer):
+        """
+        Process an alert lane entry (see _enqueue_alert) and acknowledge it
+        """
+        message_id, message_data, queued_at, decision = entry
+        try:
+            await self._process_message(message_id, message_data, detector, llm_analyzer, decision, queued_at)
+        except Exception as e:
+            logger.error(f"Error processing message {message_id}: {e}")
+        finally:
+            if decision:
+                # Normally released by _process_alert already
+                self._release_pending(json.loads(message_data.get('data', '{}')).get('payload', {}), decision[1])
+            # Acknowledge message ALWAYS (even on error, to avoid blocking),
+            # once the results it buffered are written; batch duplicates of
+            # this alert are acknowledged with it
+            followers = decision[1] if decision else []
+            await self.writer.submit(message_ids=(message_id, *(f[0] for f in followers)))
+
+    async def _submit_alerts(self, entries: list):
+        """
+        Hand stream entries to the alert lane without waiting on it
+
+        Deferred alerts are claimed back first, as far as the lane has free
+        slots; entries beyond them stay unACKed in the pending list and are
+        deferred in turn. A backlog of LLM-bound alerts therefore never
+        stalls the stream reader (and with it the metric lane).
+        """
+        room = self.alert_lane.free_slots()
+        if self.deferred_alerts and room > 0:
+            message_ids = [self.deferred_alerts.popleft() for _ in range(min(room, len(self.deferred_alerts)))]
+            claimed = await self.client.claim(*message_ids)
+            if claimed is None:
+                self.deferred_alerts.extendleft(reversed(message_ids))
+            else:
+                # Entries trimmed from the stream meanwhile are gone; the
+                # cleanup may ACK their pending ids
+                self.held_messages.difference_update(set(message_ids) - {m for m, _ in claimed})
+                entries = claimed + entries
+        if len(entries) > room:
+            deferred, entries = entries[room:], entries[:room]
+            self.deferred_alerts.extend(message_id for message_id, _ in deferred)
+            logger.info(f"Alert lane full, deferred {len(deferred)} alerts ({len(self.deferred_alerts)} pending)")
+
+        # Alerts of one read are deduplicated together (one webhook fans out
+        # into many stream entries)
+        alert_batch = []
+        for message_id, message_data in entries:
+            if message_data.get('type') == 'alert' and self.settings.alert_batch_dedup_enabled:
+                alert_batch.append((message_id, message_data))
+            else:
+                await self._enqueue_alert(message_id, message_data)
+        if alert_batch:
+            await self._dispatch_alerts(alert_batch)
+
+    async def _enqueue_alert(self, message_id: str, message_data: dict, alert=None, decision=None):
+        """
+        Submit a stream entry to the alert lane, ordered by the job_priority
+        of its analysis; its LLM deadline counts from now
+
+        Args:
+            alert: The parsed message data, when already at hand
+            decision: (reason, followers) when the alert was already
+                deduplicated in a batch
+        """
+        if alert is None:
+            try:
+                alert = json.loads(message_data.get('data', '{}'))
+            except json.JSONDecodeError:
+                alert = {}
+        payload = alert.get('payload', {}) if isinstance(alert, dict) else {}
+        await self.alert_lane.submit(
+            (message_id, message_data, time.monotonic(), decision),
+            priority=job_priority(payload, decision[0] if decision else None)
+        )
+
+    async def _dispatch_alerts(self, entries: list):
+        """
+        Deduplicate the alerts of one stream read together and send the
+        ones that need an LLM analysis to the alert lane
+
+        Duplicates of an earlier analysis are marked (and acknowledged)
+        here; duplicates of an alert analyzed in this batch, or of one still
+        queued or being analyzed, follow that alert through the lane and are
+        marked once its analysis is stored.
+        """
+        parsed = []
+        for message_id, message_data in entries:
+            try:
+                parsed.append((message_id, message_data, json.loads(message_data.get('data', '{}'))))
+            except json.JSONDecodeError:
+                # Logged and acknowledged by the single-entry path
+                await self._enqueue_alert(message_id, message_data)
+
+        try:
+            pool = await get_db_pool()
+            payloads = [alert.get('payload', {}) for _, _, alert in parsed]
+            decisions = await self.deduplicator.should_analyze_batch(pool, payloads, self.pending_analyses)
+
+            duplicates, duplicate_ids, adopted, followers, late = [], [], [], {}, []
+            for entry, payload, (analyze, reason, reference) in zip(parsed, payloads, decisions):
+                message_id, _, alert = entry
+                if analyze:
+                    continue
+                if isinstance(reference, int):
+                    followers.setdefault(reference, []).append((message_id, alert.get('alert_id'), reason, payload))
+                    continue
+                if isinstance(reference, list):
+                    # Followers of an analysis still queued or running
+                    late.append((entry, reference, (message_id, alert.get('alert_id'), reason, payload)))
+                    continue
+                duplicates.append((alert.get('alert_id'), reference['alert_id'], reference['analysis_id'], reason))
+                duplicate_ids.append(message_id)
+                if reason == "near_duplicate":
+                    adopted.append(self._adopted_state(payload, reference['alert_id'], reference['analysis_id']))
+
+            firing = [
+                (*self.deduplicator.state_key(payload), alert.get('alert_id'))
+                for payload, (_, _, alert) in zip(payloads, parsed)
+            ]
+            await self.deduplicator.mark_duplicates(pool, duplicates, firing=firing, adopted=adopted)
+        except Exception as e:
+            logger.error(f"Batch deduplication failed, deciding {len(parsed)} alerts one by one: {e}")
+            for message_id, message_data, alert in parsed:
+                await self._enqueue_alert(message_id, message_data, alert)
+            return
+
+        if duplicate_ids:
+            logger.info(f"{len(duplicate_ids)} duplicate alerts skipped LLM analysis")
+            await self.writer.submit(message_ids=duplicate_ids)
+        for (message_id, message_data, alert), group, follower in late:
+            payload = alert.get('payload', {})
+            if self.pending_analyses.get(self.deduplicator.state_key(payload), (None, None))[1] is group:
+                group.append(follower)
+            else:
+                # Stored meanwhile: decided again against the stored state
+                await self._enqueue_alert(message_id, message_data, alert)
+        if late:
+            logger.info(f"{len(late)} alerts follow an analysis already in progress")
+        for i, ((message_id, message_data, alert), (analyze, reason, _)) in enumerate(zip(parsed, decisions)):
+            if analyze:
+                payload = alert.get('payload', {})
+                group = followers.setdefault(i, [])
+                self.pending_analyses[self.deduplicator.state_key(payload)] = (
+                    payload.get('labels', {}).get('severity', 'warning'), group
+                )
+                await self._enqueue_alert(message_id, message_data, alert, (reason, group))
+
+    def _release_pending(self, payload: dict, followers: list):
+        """Stop attaching alerts to this analysis (a newer one may have taken its pair)"""
+        key = self.deduplicator.state_key(payload)
+        if self.pending_analyses.get(key, (None, None))[1] is followers:
+            del self.pending_analyses[key]
+
+    def lane_stats(self) -> dict:
+        """Current worker lane statistics"""
+        stats = {
+            lane.name: lane.stats()
+            for lane in (self.metric_lane, self.alert_lane)
+            if lane is not None
+        }
+        if self.alert_lane is not None:
+            stats[self.alert_lane.name]["deferred"] = len(self.deferred_alerts)
+        return stats
+
+    async def _process_message(self, message_id: str, data: dict, detector, llm_analyzer, decision=None, queued_at=None):
         """Process individual message from stream"""
         try:
             msg_type = data.get('type', '')
@@ -199,7 +537,7 @@ class RedisConsumer:
 
             elif msg_type == 'alert':
                 # Process alert with LLM analysis
-                await self._process_alert(msg_data, llm_analyzer, pool)
+                await self._process_alert(msg_data, llm_analyzer, pool, decision, queued_at)
 
             else:
                 logger.warning(f"Unknown message type: {msg_type}")
@@ -218,45 +556,95 @@ class RedisConsumer:
             if result.get('is_anomaly'):
                 logger.warning(f"Anomaly detected: {metric_data.get('metric_name')} = {metric_data.get('metric_value')}")
 
-                # Store anomaly result
-                async with pool.acquire() as conn:
-                    await conn.execute("""
-                        INSERT INTO ai_analysis_results
-                        (alert_id, analysis_type, model_name, analysis_data, confidence_score)
-                        VALUES (NULL, 'anomaly_detection', $1, $2, $3)
-                    """,
-                    result.get('model_version'),
-                    json.dumps({
-                        'metric_name': metric_data.get('metric_name'),
-                        'metric_value': metric_data.get('metric_value'),
-                        'anomaly_score': result.get('anomaly_score')
-                    }),
-                    abs(result.get('anomaly_score', 0.0))
-                    )
+                # Store anomaly result (written behind)
+                await self.writer.submit([self._anomaly_record(metric_data, result)])
 
         except Exception as e:
             logger.error(f"Metric processing error: {e}")
 
-    async def _process_alert(self, alert_data: dict, llm_analyzer, pool):
-        """Process alert with resource-aware deduplication and LLM analysis"""
-        from app.services.deduplication import ResourceAwareDeduplicator
+    @staticmethod
+    def _anomaly_record(metric_data: dict, result: dict) -> tuple:
+        return analysis_record(
+            'anomaly_detection',
+            result.get('model_version'),
+            {
+                'metric_name': metric_data.get('metric_name'),
+                'metric_value': metric_data.get('metric_value'),
+                'anomaly_score': result.get('anomaly_score')
+            },
+            abs(result.get('anomaly_score', 0.0))
+        )
 
+    async def _process_metric_batch(self, entries: list, detector):
+        """
+        Score a micro-batch of metric messages in one vectorized pass and
+        buffer all anomalies for the bulk writer.
+        Every message in the batch is acknowledged, even on error: after
+        its anomalies are committed, or right away if it failed.
+        """
+        message_ids = [message_id for message_id, _ in entries]
+        try:
+            metrics = []
+            for message_id, data in entries:
+                try:
+                    metrics.append(json.loads(data.get('data', '{}')))
+                except json.JSONDecodeError as e:
+                    logger.error(f"Failed to parse message data for {message_id}: {e}")
+
+            results = await detector.detect_batch(metrics)
+
+            anomalies = [
+                (metric_data, result)
+                for metric_data, result in zip(metrics, results)
+                if result.get('is_anomaly')
+            ]
+            if anomalies:
+                logger.warning(f"{len(anomalies)} anomalies detected in batch of {len(metrics)} metrics")
+
+            await self.writer.submit(
+                [self._anomaly_record(metric_data, result) for metric_data, result in anomalies],
+                message_ids
+            )
+
+        except Exception as e:
+            logger.error(f"Metric batch processing error: {e}")
+            # Acknowledge the whole batch (even on error, to avoid blocking)
+            await self._ack(*message_ids)
+
+    async def _process_alert(self, alert_data: dict, llm_analyzer, pool, decision=None, queued_at=None):
+        """
+        Process alert with resource-aware deduplication and LLM analysis
+
+        Args:
+            decision: (reason, followers) when the alert was already
+                deduplicated in a batch; followers are the (message_id,
+                alert_id) of later batch alerts duplicating this one
+            queued_at: time.monotonic() when the alert entered the alert
+                lane; the LLM deadline counts from here
+        """
         alert_id = alert_data.get('alert_id')
         payload = alert_data.get('payload', {})
+        labels = payload.get('labels', {})
 
         # 1. Should we analyze this alert?
-        deduplicator = ResourceAwareDeduplicator()
-        should_analyze, reason = await deduplicator.should_analyze(pool, payload)
+        deduplicator = self.deduplicator
+        followers = []
+        if decision is not None:
+            should_analyze = True
+            reason, followers = decision
+        else:
+            await deduplicator.track_firing(pool, labels.get('alertname'), labels.get('instance'), alert_id)
+            should_analyze, reason = await deduplicator.should_analyze(pool, payload)
 
         if not should_analyze:
             # DUPLICATE - Skip LLM, mark as duplicate
             logger.info(f"Alert {alert_id} is duplicate ({reason}), skipping LLM analysis")
 
-            # Find the original analysis to reference
-            last_analysis = await deduplicator._find_last_analysis(
+            # Find the original analysis to reference (cached by should_analyze)
+            last_analysis = await deduplicator.last_analysis(
                 pool,
-                payload.get('labels', {}).get('alertname'),
-                payload.get('labels', {}).get('instance')
+                labels.get('alertname'),
+                labels.get('instance')
             )
 
             if last_analysis:
@@ -275,13 +663,15 @@ class RedisConsumer:
         # Retry logic for LLM analysis with context
         max_retries = 2
         retry_delay = 5
+        record = None
+        templated = False
 
         for attempt in range(max_retries):
             try:
                 logger.info(f"LLM analysis attempt {attempt + 1}/{max_retries} for alert {alert_id} (reason: {reason})")
 
                 # Perform LLM analysis with context-aware prompt
-                analysis = await llm_analyzer.analyze(payload, analysis_reason=reason)
+                analysis = await llm_analyzer.analyze(payload, analysis_reason=reason, queued_at=queued_at)
 
                 # Check if analysis has error
                 if analysis.get('error'):
@@ -289,43 +679,38 @@ class RedisConsumer:
 
                 logger.info(f"LLM analysis completed for alert {alert_id} (reason: {reason})")
 
-                # Store analysis result with metadata
-                async with pool.acquire() as conn:
-                    await conn.execute("""
-                        INSERT INTO ai_analysis_results
-                        (alert_id, analysis_type, model_name, analysis_data, confidence_score, metadata)
-                        VALUES ($1, 'llm_analysis', 'llama2', $2, $3, $4)
-                    """,
-                    alert_id,
-                    json.dumps(analysis),
-                    0.85,
-                    json.dumps({"analysis_reason": reason})
+                # Store analysis result with metadata (written behind); jobs
+                # shed under load carry a templated analysis instead
+                templated = analysis.get('templated', False)
+                metadata = {"analysis_reason": reason}
+                if templated:
+                    metadata["shed_reason"] = analysis.get('shed_reason')
+                record = analysis_record(
+                    'llm_analysis', 'template' if templated else 'llama2', analysis,
+                    0.3 if templated else 0.85,
+                    alert_id=alert_id,
+                    metadata=metadata
+                )
+                await self.writer.submit([record])
+                if not templated:
+                    # A shed job is not an analysis: the next occurrence is
+                    # analyzed again, and near duplicates never reuse it
+                    await deduplicator.record_analysis(
+                        pool, labels.get('alertname'), labels.get('instance'),
+                        alert_id, record[0], labels.get('severity', 'warning')
                     )
+                    await deduplicator.remember_analysis(payload, alert_id, record[0])
 
                 # AUTO-RESOLUTION: If recovery detected, mark previous higher-severity alerts as resolved
                 if reason == 'recovery':
                     logger.info(f"Recovery analysis complete, marking previous alerts as resolved...")
-                    async with pool.acquire() as conn:
-                        resolved_count = await conn.fetchval("""
-                            UPDATE alerts
-                            SET status = 'resolved',
-                                ends_at = NOW(),
-                                updated_at = NOW()
-                            WHERE alert_name = $1
-                              AND labels->>'instance' = $2
-                              AND status = 'firing'
-                              AND id != $3
-                              AND created_at < (SELECT created_at FROM alerts WHERE id = $3)
-                            RETURNING id
-                        """,
-                        labels.get('alertname'),
-                        labels.get('instance'),
-                        alert_id
-                        )
-                        if resolved_count:
-                            logger.info(f"✅ Marked previous alert as resolved due to recovery")
+                    resolved_count = await deduplicator.resolve_firing(
+                        pool, labels.get('alertname'), labels.get('instance'), alert_id
+                    )
+                    if resolved_count:
+                        logger.info(f"✅ Marked {resolved_count} previous alert(s) as resolved due to recovery")
 
-                return  # Success, exit retry loop
+                break  # Success, exit retry loop
 
             except Exception as e:
                 logger.error(f"Alert processing error (attempt {attempt + 1}): {e}")
@@ -335,20 +720,47 @@ class RedisConsumer:
                     # Final failure - store error result
                     logger.error(f"Failed to analyze alert {alert_id} after {max_retries} attempts")
                     try:
-                        async with pool.acquire() as conn:
-                            await conn.execute("""
-                                INSERT INTO ai_analysis_results
-                                (alert_id, analysis_type, model_name, analysis_data, confidence_score, metadata)
-                                VALUES ($1, 'llm_analysis', 'llama2', $2, $3, $4)
-                            """,
-                            alert_id,
-                            json.dumps({"error": f"Analysis failed after {max_retries} attempts: {str(e)}"}),
+                        record = analysis_record(
+                            'llm_analysis', 'llama2',
+                            {"error": f"Analysis failed after {max_retries} attempts: {str(e)}"},
                             0.0,
-                            json.dumps({"analysis_reason": reason, "failure": True})
-                            )
+                            alert_id=alert_id,
+                            metadata={"analysis_reason": reason, "failure": True}
+                        )
+                        await self.writer.submit([record])
+                        # The failure row counts as the last analysis, as in the database
+                        await deduplicator.record_analysis(
+                            pool, labels.get('alertname'), labels.get('instance'),
+                            alert_id, record[0], labels.get('severity', 'warning')
+                        )
                     except Exception as store_error:
                         logger.error(f"Failed to store error result: {store_error}")
 
+        # 3. Batch alerts duplicating this one reference the stored analysis.
+        # Later alerts of the pair see that analysis from here on, so no
+        # more followers join
+        if decision is not None:
+            self._release_pending(payload, followers)
+        if followers and record is not None:
+            await deduplicator.mark_duplicates(
+                pool,
+                [(follower_id, alert_id, record[0], follower_reason) for _, follower_id, follower_reason, _ in followers],
+                adopted=[
+                    self._adopted_state(follower_payload, alert_id, record[0])
+                    for _, _, follower_reason, follower_payload in followers
+                    if follower_reason == "near_duplicate" and not templated
+                ]
+            )
+
+    @staticmethod
+    def _adopted_state(payload: dict, alert_id, analysis_id) -> tuple:
+        """alert_state row of a near duplicate, taking over another alert's analysis"""
+        labels = payload.get('labels', {})
+        return (
+            labels.get('alertname'), labels.get('instance'),
+            alert_id, analysis_id, labels.get('severity', 'warning')
+        )
+
     async def stop(self):
         """Stop consuming messages"""
         logger.info("Stopping Redis consumer...")
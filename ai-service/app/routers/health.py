@@ -1,4 +1,5 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from app.database import Database
 
 router = APIRouter()
@@ -10,4 +11,9 @@ async def health_check():
         await Database.execute("SELECT 1")
         return {"status": "ok", "service": "ai-service"}
     except Exception as e:
-        return {"status": "error", "detail": str(e)}
\ No newline at end of file
+        return {"status": "error", "detail": str(e)}
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -3,8 +3,11 @@ Scheduler for periodic model retraining
 """
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from loguru import logger
-from app.detector import AnomalyDetector
+from app.model_manager import model_manager
+from app.models.backfill import AnomalyBackfill
+from app.models.evaluation import ModelEvaluator
 from app.config import get_settings
 
 
@@ -17,13 +20,29 @@ class ModelScheduler:
         self.scheduler = AsyncIOScheduler()
         self.settings = get_settings()
         self.detector = None
+        self.evaluator = ModelEvaluator(
+            window_hours=self.settings.evaluation_window_hours,
+            row_budget=self.settings.evaluation_row_budget,
+            batch_size=self.settings.evaluation_batch_size,
+            candidates=self.settings.evaluation_candidates,
+            feature_window=self.settings.feature_window,
+            latency_regression=self.settings.evaluation_latency_regression,
+            query_timeout=self.settings.training_query_timeout
+        )
+        self.backfill = AnomalyBackfill(
+            batch_size=self.settings.backfill_batch_size,
+            max_rows=self.settings.backfill_max_rows,
+            feature_window=self.settings.feature_window,
+            max_series=self.settings.feature_max_series,
+            query_timeout=self.settings.training_query_timeout
+        )
 
     async def start(self):
         """Start the scheduler"""
         logger.info("Starting model retraining scheduler...")
 
-        # Initialize detector
-        self.detector = AnomalyDetector()
+        # Shared detector (same instance the consumer scores with)
+        self.detector = model_manager.detector
 
         # Schedule model retraining
         # Default: Every day at 2 AM
@@ -35,6 +54,36 @@ class ModelScheduler:
             replace_existing=True
         )
 
+        # Sliding-window incremental updates between full retrains
+        if self.settings.incremental_training_enabled:
+            self.scheduler.add_job(
+                self.update_model,
+                trigger=IntervalTrigger(minutes=self.settings.incremental_interval_minutes),
+                id='model_incremental_update',
+                name='Incremental Model Update',
+                replace_existing=True
+            )
+
+        # Promote or reject shadowed candidates
+        if self.settings.shadow_enabled:
+            self.scheduler.add_job(
+                self.review_shadow,
+                trigger=IntervalTrigger(minutes=self.settings.shadow_review_minutes),
+                id='model_shadow_review',
+                name='Review Shadow Candidate',
+                replace_existing=True
+            )
+
+        # Score new metrics rows into metrics.model_anomaly
+        if self.settings.backfill_enabled:
+            self.scheduler.add_job(
+                self.backfill_anomalies,
+                trigger=IntervalTrigger(minutes=self.settings.backfill_interval_minutes),
+                id='metrics_anomaly_backfill',
+                name='Backfill metrics.model_anomaly',
+                replace_existing=True
+            )
+
         # Schedule model evaluation
         # Every 6 hours
         self.scheduler.add_job(
@@ -62,34 +111,82 @@ class ModelScheduler:
         try:
             logger.info("Starting scheduled model retraining...")
 
-            if not self.detector:
-                self.detector = AnomalyDetector()
+            # Train and publish a new version: swapped in everywhere, or
+            # shadow scored as a candidate first
+            version = await model_manager.retrain(shadow=self.settings.shadow_enabled)
+            if version is None:
+                logger.warning("Model retraining produced no model")
+                return
 
-            # Train model with latest data
-            await self.detector.train_model()
-
-            logger.info("✅ Model retraining completed successfully")
+            logger.info(f"✅ Model retraining completed successfully ({version})")
 
         except Exception as e:
             logger.error(f"❌ Model retraining failed: {e}")
 
+    async def update_model(self):
+        """
+        Incrementally update the model with the newest data window
+        This job runs every incremental_interval_minutes
+        """
+        try:
+            version = await model_manager.update()
+            if version is not None:
+                logger.info(f"✅ Incremental model update completed ({version})")
+
+        except Exception as e:
+            logger.error(f"❌ Incremental model update failed: {e}")
+
+    async def review_shadow(self):
+        """
+        Promote or reject the shadowed candidate once its verdict is in
+        This job runs every shadow_review_minutes
+        """
+        try:
+            verdict = await model_manager.review_shadow()
+            if verdict is not None:
+                logger.info(f"✅ Shadow review completed ({verdict})")
+
+        except Exception as e:
+            logger.error(f"❌ Shadow review failed: {e}")
+
+    async def backfill_anomalies(self):
+        """
+        Score metrics rows added since the last checkpoint with the active
+        model and store the verdicts in metrics.model_anomaly
+        This job runs every backfill_interval_minutes
+        """
+        try:
+            if not self.detector:
+                self.detector = model_manager.detector
+
+            stats = await self.backfill.run(self.detector.model, model_manager.active_version)
+            if stats["rows"]:
+                logger.info(f"✅ model_anomaly backfill completed ({stats['rows']} rows up to id {stats['position']})")
+
+        except Exception as e:
+            logger.error(f"❌ model_anomaly backfill failed: {e}")
+
     async def evaluate_model(self):
         """
         Evaluate model performance
-        Calculate metrics like precision, recall, accuracy
+        Replays the held-out window through the active model and the
+        newest candidates: precision/recall/F1 plus scoring latency and
+        throughput, stored in model_versions.metrics
         """
         try:
             logger.info("Starting scheduled model evaluation...")
 
             if not self.detector:
-                self.detector = AnomalyDetector()
+                self.detector = model_manager.detector
 
-            # TODO: Implement model evaluation logic
-            # - Calculate precision, recall, F1-score
-            # - Compare with baseline
-            # - Store metrics in database
+            results = await self.evaluator.run(
+                self.detector.model,
+                model_manager.active_version,
+                model_manager.MODEL_TYPE,
+                mmap=self.settings.model_mmap
+            )
 
-            logger.info("✅ Model evaluation completed")
+            logger.info(f"✅ Model evaluation completed ({len(results)} versions)")
 
         except Exception as e:
             logger.error(f"❌ Model evaluation failed: {e}")
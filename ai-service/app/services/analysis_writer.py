@@ -0,0 +1,207 @@
+"""
+Write-behind buffer for ai_analysis_results
+===========================================
+
+Anomalies, duplicate references and LLM results used to be inserted one
+statement (and one pool round trip) at a time. During anomaly storms that
+means thousands of round trips per second. Instead, rows are buffered
+and written in bulk:
+
+- a flush runs when max_rows rows are buffered, or flush_interval after
+  the previous one, whichever comes first
+- each flush is a single copy_records_to_table (binary COPY), so it
+  commits as a whole
+- stream message IDs handed in with the rows (or after them) are ACKed
+  only after the flush that holds their rows committed
+- rows that cannot be written (database down) stay buffered, with their
+  message IDs, for the next flush; a full buffer makes submit() wait,
+  pushing back on the worker lanes
+- stop() flushes whatever is left; messages whose rows are still unwritten
+  then stay unACKed in the consumer group
+
+Row IDs are generated client-side, so callers can reference a row (e.g.
+as reference_analysis_id) before it is written.
+"""
+import asyncio
+import json
+import uuid
+from decimal import Decimal
+from typing import Awaitable, Callable, Iterable, List, Optional, Sequence
+import asyncpg
+from loguru import logger
+from app.database import get_db_pool
+
+COLUMNS = (
+    'id', 'alert_id', 'analysis_type', 'reference_analysis_id', 'model_name',
+    'analysis_data', 'confidence_score', 'metadata'
+)
+
+
+def analysis_record(
+    analysis_type: str,
+    model_name: str,
+    analysis_data,
+    confidence_score: float,
+    alert_id=None,
+    reference_analysis_id=None,
+    metadata=None
+) -> tuple:
+    """
+    One ai_analysis_results row, in COLUMNS order (first field: its new id).
+    analysis_data and metadata may be dicts or JSON strings.
+    """
+    return (
+        uuid.uuid4(),
+        alert_id,
+        analysis_type,
+        reference_analysis_id,
+        model_name,
+        analysis_data if isinstance(analysis_data, str) else json.dumps(analysis_data),
+        # DECIMAL(5,4)
+        Decimal(str(round(float(confidence_score), 4))),
+        metadata if isinstance(metadata, str) else json.dumps(metadata or {})
+    )
+
+
+class AnalysisWriter:
+    """
+    Buffers ai_analysis_results rows and writes them with binary COPY
+    """
+
+    def __init__(
+        self,
+        ack: Optional[Callable[..., Awaitable]] = None,
+        max_rows: int = 500,
+        flush_interval_ms: int = 200,
+        max_buffered: int = 20000,
+        max_retries: int = 3
+    ):
+        self.ack = ack
+        self.max_rows = max(1, max_rows)
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_buffered = max(self.max_rows, max_buffered)
+        self.max_retries = max(1, max_retries)
+
+        self._rows: List[tuple] = []
+        self._message_ids: List[str] = []
+        self._full = asyncio.Event()
+        self._space = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start the periodic flusher (must run inside the event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="analysis-writer")
+
+    async def stop(self):
+        """Stop the flusher and write out (and ACK) everything buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._rows:
+            logger.error(
+                f"{len(self._rows)} analysis rows could not be written; "
+                f"{len(self._message_ids)} messages stay pending"
+            )
+
+    async def submit(self, records: Iterable[tuple] = (), message_ids: Sequence[str] = ()):
+        """
+        Buffer rows (see analysis_record). message_ids are ACKed once
+        these rows, and every row submitted before them, are committed.
+        """
+        while len(self._rows) >= self.max_buffered:
+            self._space.clear()
+            await self._space.wait()
+
+        self._rows.extend(records)
+        self._message_ids.extend(message_ids)
+        if len(self._rows) >= self.max_rows:
+            if self._task is not None:
+                self._full.set()
+            else:
+                await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Analysis writer flush error: {e}")
+
+    async def flush(self):
+        """Write the buffered rows now, then ACK their messages"""
+        async with self._flush_lock:
+            rows, message_ids = self._rows, self._message_ids
+            self._rows, self._message_ids = [], []
+
+            if rows:
+                if not await self._write(rows):
+                    # Retried by the next flush, ahead of anything newer
+                    self._rows[:0] = rows
+                    self._message_ids[:0] = message_ids
+                    return
+                self.flushes += 1
+            self._space.set()
+
+            if message_ids and self.ack is not None:
+                await self.ack(*message_ids)
+
+    async def _write(self, rows: List[tuple]) -> bool:
+        """COPY the rows, retrying transient errors; False if they are not written"""
+        for attempt in range(self.max_retries):
+            try:
+                pool = await get_db_pool()
+                async with pool.acquire() as conn:
+                    await conn.copy_records_to_table('ai_analysis_results', records=rows, columns=COLUMNS)
+                self.written += len(rows)
+                return True
+            except (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError) as e:
+                # One bad row (e.g. its alert was deleted) must not sink the batch
+                logger.warning(f"Bulk insert of {len(rows)} analysis rows rejected ({e}), writing row by row")
+                try:
+                    await self._write_each(rows)
+                    return True
+                except Exception as e:
+                    logger.error(f"Row by row insert of analysis rows failed, keeping them buffered: {e}")
+                    return False
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    logger.error(
+                        f"Bulk insert of {len(rows)} analysis rows failed after {self.max_retries} attempts, "
+                        f"keeping them buffered: {e}"
+                    )
+                    return False
+                logger.warning(f"Bulk insert of analysis rows failed (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def _write_each(self, rows: List[tuple]):
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            for row in rows:
+                try:
+                    await conn.copy_records_to_table('ai_analysis_results', records=[row], columns=COLUMNS)
+                    self.written += 1
+                except (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError) as e:
+                    self.dropped += 1
+                    logger.error(f"Dropping analysis row for alert {row[1]}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._rows),
+            "pending_acks": len(self._message_ids),
+            "written": self.written,
+            "flushes": self.flushes,
+            "dropped": self.dropped
+        }
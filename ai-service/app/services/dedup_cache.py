@@ -0,0 +1,147 @@
+"""
+Deduplication state cache
+=========================
+
+Holds the last analyzed alert per (alertname, instance):
+{alert_id, analysis_id, severity}. Lookups go
+
+1. process memory (LRU, entries trusted for local_ttl seconds)
+2. a Redis hash shared by all replicas (settings.dedup_cache_hash)
+3. the alert_state row in the database, only on a miss in both
+
+and the state is written through to both tiers whenever an analysis is
+stored, so a duplicate decision normally costs no SQL at all. Redis
+errors degrade to the database lookup instead of failing the alert.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from loguru import logger
+
+
+class DedupStateCache:
+    """
+    Two-tier (memory + Redis hash) cache of the last analysis per alert
+    """
+
+    def __init__(
+        self,
+        redis=None,
+        hash_key: str = "dedup:state",
+        max_entries: int = 50000,
+        local_ttl: float = 5.0
+    ):
+        self.redis = redis
+        self.hash_key = hash_key
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+        # field -> (expires_at, state)
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def field(alert_name: str, instance: str) -> str:
+        return json.dumps([alert_name, instance])
+
+    def _remember(self, field: str, state: dict):
+        self._local[field] = (time.monotonic() + self.local_ttl, state)
+        self._local.move_to_end(field)
+        if len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def get(self, alert_name: str, instance: str) -> Optional[dict]:
+        """Cached state, or None when the caller has to ask the database"""
+        field = self.field(alert_name, instance)
+        entry = self._local.get(field)
+        if entry is not None and entry[0] > time.monotonic():
+            self._local.move_to_end(field)
+            self.hits += 1
+            return entry[1]
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.hget(self.hash_key, field)
+            except Exception as e:
+                logger.warning(f"Dedup cache read failed, using the database: {e}")
+                raw = None
+            if raw:
+                state = json.loads(raw)
+                self._remember(field, state)
+                self.redis_hits += 1
+                return state
+
+        self.misses += 1
+        return None
+
+    async def get_many(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], dict]:
+        """
+        Cached states of several (alert_name, instance) keys, with a single
+        HMGET for the ones not in memory; keys missing from the result
+        have to be read from the database
+        """
+        found, remote = {}, []
+        now = time.monotonic()
+        for key in keys:
+            field = self.field(*key)
+            entry = self._local.get(field)
+            if entry is not None and entry[0] > now:
+                self._local.move_to_end(field)
+                self.hits += 1
+                found[key] = entry[1]
+            else:
+                remote.append((key, field))
+
+        values = [None] * len(remote)
+        if remote and self.redis is not None:
+            try:
+                values = await self.redis.hmget(self.hash_key, [field for _, field in remote])
+            except Exception as e:
+                logger.warning(f"Dedup cache read failed, using the database: {e}")
+        for (key, field), raw in zip(remote, values):
+            if raw:
+                state = json.loads(raw)
+                self._remember(field, state)
+                self.redis_hits += 1
+                found[key] = state
+            else:
+                self.misses += 1
+        return found
+
+    async def put(self, alert_name: str, instance: str, state: dict):
+        """Write-through: process memory and the shared Redis hash"""
+        field = self.field(alert_name, instance)
+        state = {k: (str(v) if v is not None else None) for k, v in state.items()}
+        self._remember(field, state)
+        if self.redis is not None:
+            try:
+                await self.redis.hset(self.hash_key, field, json.dumps(state))
+            except Exception as e:
+                logger.warning(f"Dedup cache write failed: {e}")
+
+    async def put_many(self, states: Dict[Tuple[str, str], dict]):
+        """put() for several keys, with a single HSET"""
+        mapping = {}
+        for key, state in states.items():
+            field = self.field(*key)
+            state = {k: (str(v) if v is not None else None) for k, v in state.items()}
+            self._remember(field, state)
+            mapping[field] = json.dumps(state)
+        if mapping and self.redis is not None:
+            try:
+                await self.redis.hset(self.hash_key, mapping=mapping)
+            except Exception as e:
+                logger.warning(f"Dedup cache write failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self._local),
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0
+        }
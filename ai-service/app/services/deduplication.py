@@ -8,10 +8,45 @@ CPU-friendly deduplication that tracks alert lifecycle:
 - Severity recovery (CRITICAL → WARNING)
 
 This minimizes LLM calls while capturing important state changes.
+State lives in alert_state, one row per (alertname, instance) with the
+last analysis and the alerts still firing, so lookups and recovery
+resolution never search the alerts history. The last analysis is also
+served from a DedupStateCache when one is configured, so duplicates
+cost no SQL. Bursts (one Alertmanager webhook fans out into many stream
+entries) are decided together with should_analyze_batch and
+mark_duplicates: one state lookup and one transaction per batch.
+
+With a SimilarityIndex, a first occurrence that is nearly the same as a
+recent analysis (same alert on another host, say) reuses that analysis
+as a near_duplicate; the analysis then becomes the state of its pair.
 """
 
-from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
 from loguru import logger
+from app.services.analysis_writer import COLUMNS, analysis_record
+from app.services.similarity import similarity as estimate_similarity
+
+# Appends alert ids to the firing list of their alert_state rows: $1/$2/$3
+# are parallel alert_name / instance / alert id arrays, $4 the list cap.
+# Ids already in the list (redelivered messages) are skipped.
+TRACK_FIRING_SQL = """
+    INSERT INTO alert_state (alert_name, instance, firing_alert_ids, updated_at)
+    SELECT alert_name, instance, array_agg(alert_id ORDER BY ord), NOW()
+    FROM unnest($1::text[], $2::text[], $3::uuid[]) WITH ORDINALITY AS k(alert_name, instance, alert_id, ord)
+    GROUP BY alert_name, instance
+    ON CONFLICT (alert_name, instance) DO UPDATE
+    SET firing_alert_ids = (
+            SELECT (array_agg(id ORDER BY pos))[greatest(count(*) + 1 - $4, 1):]
+            FROM (
+                SELECT id, pos FROM unnest(alert_state.firing_alert_ids) WITH ORDINALITY AS f(id, pos)
+                UNION ALL
+                SELECT id, pos + cardinality(alert_state.firing_alert_ids)
+                FROM unnest(EXCLUDED.firing_alert_ids) WITH ORDINALITY AS n(id, pos)
+                WHERE id <> ALL(alert_state.firing_alert_ids)
+            ) AS merged
+        ),
+        updated_at = NOW()
+"""
 
 
 class ResourceAwareDeduplicator:
@@ -32,6 +67,17 @@ class ResourceAwareDeduplicator:
         'info': 1
     }
 
+    def __init__(self, writer=None, cache=None, max_firing: int = 1000, similarity=None):
+        # Bulk AnalysisWriter for the duplicate reference rows (inserted
+        # directly when None)
+        self.writer = writer
+        # DedupStateCache of the last analysis per alert (always SQL when None)
+        self.cache = cache
+        # Firing alert ids kept per alert_state row (newest win)
+        self.max_firing = max_firing
+        # SimilarityIndex for near duplicates (exact matches only when None)
+        self.similarity = similarity
+
     async def should_analyze(self, pool, alert_data: dict) -> tuple[bool, str]:
         """
         Determine if alert should be analyzed by LLM
@@ -44,15 +90,28 @@ class ResourceAwareDeduplicator:
             - escalation: Severity increased
             - recovery: Severity decreased (situation improving)
             - duplicate_same_severity: Same severity as last analysis
+            - near_duplicate: Never seen, but nearly the same as a recent
+              analysis (which is recorded as this alert's last analysis)
         """
         alert_name = alert_data.get('labels', {}).get('alertname')
         instance = alert_data.get('labels', {}).get('instance')
         new_severity = alert_data.get('labels', {}).get('severity', 'warning')
 
         # Find last analysis for this alert
-        last_analysis = await self._find_last_analysis(pool, alert_name, instance)
+        last_analysis = await self.last_analysis(pool, alert_name, instance)
 
         if not last_analysis:
+            match = await self.find_near_duplicate(alert_data)
+            if match is not None:
+                logger.info(
+                    f"Near duplicate: {alert_name} on {instance} ~ analysis {match['analysis_id']} "
+                    f"(similarity {match['similarity']:.2f})"
+                )
+                await self.record_analysis(
+                    pool, alert_name, instance, match['alert_id'], match['analysis_id'], new_severity
+                )
+                return (False, "near_duplicate")
+
             logger.info(f"First occurrence: {alert_name} on {instance}")
             return (True, "first_occurrence")
 
@@ -72,6 +131,75 @@ class ResourceAwareDeduplicator:
         logger.debug(f"Duplicate detected: {alert_name} (same {new_severity})")
         return (False, "duplicate_same_severity")
 
+    async def last_analysis(self, pool, alert_name: str, instance: str):
+        """
+        Last analysis for this alert+instance: {alert_id, analysis_id,
+        severity}, from the cache when possible, None if never analyzed
+        """
+        instance = instance or ''
+        if self.cache is not None:
+            state = await self.cache.get(alert_name, instance)
+            if state is not None:
+                return state
+
+        row = await self._find_last_analysis(pool, alert_name, instance)
+        if row is None:
+            return None
+        state = {
+            "alert_id": row['alert_id'],
+            "analysis_id": row['analysis_id'],
+            "severity": row['severity']
+        }
+        if self.cache is not None:
+            await self.cache.put(alert_name, instance, state)
+        return state
+
+    async def record_analysis(self, pool, alert_name: str, instance: str, alert_id, analysis_id, severity: str):
+        """Store a new analysis as the alert's state (alert_state and the cache)"""
+        if alert_name is None:
+            return
+        instance = instance or ''
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO alert_state (alert_name, instance, severity, last_alert_id, last_analysis_id, updated_at)
+                VALUES ($1, $2, $3, $4, $5, NOW())
+                ON CONFLICT (alert_name, instance) DO UPDATE
+                SET severity = EXCLUDED.severity,
+                    last_alert_id = EXCLUDED.last_alert_id,
+                    last_analysis_id = EXCLUDED.last_analysis_id,
+                    updated_at = NOW()
+            """, alert_name, instance, severity, alert_id, analysis_id)
+
+        if self.cache is not None:
+            await self.cache.put(alert_name, instance, {
+                "alert_id": alert_id,
+                "analysis_id": analysis_id,
+                "severity": severity
+            })
+
+    async def find_near_duplicate(self, alert_data: dict, signature=None) -> Optional[dict]:
+        """Recent analysis nearly the same as this alert (None without a SimilarityIndex)"""
+        if self.similarity is None:
+            return None
+        if signature is None:
+            signature = self.similarity.signature(alert_data)
+        severity = alert_data.get('labels', {}).get('severity', 'warning')
+        try:
+            return await self.similarity.find(signature, severity)
+        except Exception as e:
+            logger.warning(f"Near-duplicate lookup failed: {e}")
+            return None
+
+    async def remember_analysis(self, alert_data: dict, alert_id, analysis_id):
+        """Index a completed LLM analysis for near-duplicate lookups"""
+        if self.similarity is None:
+            return
+        await self.similarity.add(self.similarity.signature(alert_data), {
+            "alert_id": alert_id,
+            "analysis_id": analysis_id,
+            "severity": alert_data.get('labels', {}).get('severity', 'warning')
+        })
+
     async def _find_last_analysis(self, pool, alert_name: str, instance: str):
         """
         Find last ANALYZED (not duplicate) alert for this alert+instance
@@ -79,20 +207,269 @@ class ResourceAwareDeduplicator:
         async with pool.acquire() as conn:
             return await conn.fetchrow("""
                 SELECT
-                    a.id as alert_id,
-                    a.severity,
-                    a.created_at,
-                    r.id as analysis_id
-                FROM alerts a
-                INNER JOIN ai_analysis_results r
-                    ON a.id = r.alert_id
-                    AND r.analysis_type = 'llm_analysis'
-                WHERE a.alert_name = $1
-                  AND a.labels->>'instance' = $2
-                  AND a.is_duplicate = FALSE
-                ORDER BY a.created_at DESC
-                LIMIT 1
-            """, alert_name, instance)
+                    last_alert_id AS alert_id,
+                    severity,
+                    last_analysis_id AS analysis_id
+                FROM alert_state
+                WHERE alert_name = $1
+                  AND instance = $2
+                  AND last_analysis_id IS NOT NULL
+            """, alert_name, instance or '')
+
+    async def track_firing(self, pool, alert_name: str, instance: str, alert_id):
+        """Add a newly received alert to the firing alerts of its alert_state row"""
+        if alert_name is None:
+            return
+        async with pool.acquire() as conn:
+            await conn.execute(TRACK_FIRING_SQL, [alert_name], [instance or ''], [alert_id], self.max_firing)
+
+    async def resolve_firing(self, pool, alert_name: str, instance: str, alert_id) -> int:
+        """
+        Recovery: resolve the alerts of this alert+instance that fired
+        before alert_id and are still firing
+
+        Returns:
+            Number of alerts resolved
+        """
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                firing = await conn.fetchval("""
+                    SELECT firing_alert_ids FROM alert_state
+                    WHERE alert_name = $1 AND instance = $2
+                    FOR UPDATE
+                """, alert_name, instance or '')
+                if not firing:
+                    return 0
+
+                resolved = await conn.fetch("""
+                    UPDATE alerts
+                    SET status = 'resolved',
+                        ends_at = NOW(),
+                        updated_at = NOW()
+                    WHERE id = ANY($1::uuid[])
+                      AND id != $2
+                      AND status = 'firing'
+                      AND created_at < (SELECT created_at FROM alerts WHERE id = $2)
+                    RETURNING id
+                """, firing, alert_id)
+
+                resolved_ids = {row['id'] for row in resolved}
+                await conn.execute("""
+                    UPDATE alert_state
+                    SET firing_alert_ids = $3::uuid[], updated_at = NOW()
+                    WHERE alert_name = $1 AND instance = $2
+                """, alert_name, instance or '', [i for i in firing if i not in resolved_ids])
+        return len(resolved)
+
+    @staticmethod
+    def state_key(alert_data: dict) -> Tuple[Optional[str], str]:
+        """(alertname, instance) of an alert payload, as keyed in alert_state"""
+        labels = alert_data.get('labels', {})
+        return (labels.get('alertname'), labels.get('instance') or '')
+
+    async def last_analyses(self, pool, keys: Iterable[Tuple[str, str]]) -> dict:
+        """
+        last_analysis for several (alert_name, instance) keys: cache first,
+        then one unnest query for the rest
+
+        Returns:
+            {key: {alert_id, analysis_id, severity}} for the analyzed keys
+        """
+        keys = [key for key in keys if key[0] is not None]
+        states = await self.cache.get_many(keys) if self.cache is not None else {}
+        missing = [key for key in keys if key not in states]
+        if not missing:
+            return states
+
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT
+                    s.alert_name,
+                    s.instance,
+                    s.last_alert_id AS alert_id,
+                    s.severity,
+                    s.last_analysis_id AS analysis_id
+                FROM unnest($1::text[], $2::text[]) AS k(alert_name, instance)
+                INNER JOIN alert_state s
+                    ON s.alert_name = k.alert_name
+                    AND s.instance = k.instance
+                WHERE s.last_analysis_id IS NOT NULL
+            """, [key[0] for key in missing], [key[1] for key in missing])
+
+        loaded = {
+            (row['alert_name'], row['instance']): {
+                "alert_id": row['alert_id'],
+                "analysis_id": row['analysis_id'],
+                "severity": row['severity']
+            }
+            for row in rows
+        }
+        if self.cache is not None:
+            await self.cache.put_many(loaded)
+        states.update(loaded)
+        return states
+
+    async def should_analyze_batch(self, pool, alerts: List[dict], pending: Optional[dict] = None) -> List[tuple]:
+        """
+        should_analyze for a burst of alerts, with at most one query
+
+        Alerts sharing (alertname, instance) are collapsed: the pair's state
+        is looked up once and its alerts are decided in order against it,
+        so an alert that will be analyzed becomes the state for the later
+        ones (which no longer all count as first occurrences).
+
+        First occurrences are then checked for near duplicates, among the
+        alerts analyzed earlier in the batch and in the SimilarityIndex.
+
+        Args:
+            pending: (severity, token) per (alertname, instance) of analyses
+                queued or running and not stored yet; they are newer than
+                the pair's stored state
+
+        Returns:
+            One (should_analyze, reason, reference) per alert. For
+            duplicates, reference is the analysis state they reuse, the
+            index of the earlier alert in the batch they duplicate, or the
+            token of the pending analysis they duplicate
+        """
+        keys = [self.state_key(alert) for alert in alerts]
+        states = await self.last_analyses(pool, dict.fromkeys(keys))
+
+        decisions = []
+        # key -> (severity, reference) of the latest analysis
+        current = {key: (state['severity'], state) for key, state in states.items()}
+        if pending:
+            current.update((key, pending[key]) for key in keys if key in pending)
+        # (signature, severity, index) of the batch alerts to be analyzed
+        analyzed = []
+        for i, (alert, key) in enumerate(zip(alerts, keys)):
+            new_severity = alert.get('labels', {}).get('severity', 'warning')
+            last = current.get(key)
+            signature = None
+            if self.similarity is not None:
+                signature = self.similarity.signature(alert)
+
+            if last is None and signature is not None:
+                reference = self._batch_near_duplicate(signature, new_severity, analyzed)
+                if reference is None:
+                    reference = await self.find_near_duplicate(alert, signature)
+                if reference is not None:
+                    decisions.append((False, "near_duplicate", reference))
+                    current[key] = (new_severity, reference)
+                    continue
+
+            if last is None:
+                reason = "first_occurrence"
+            elif self._is_escalation(last[0], new_severity):
+                reason = "escalation"
+            elif self._is_recovery(last[0], new_severity):
+                reason = "recovery"
+            else:
+                decisions.append((False, "duplicate_same_severity", last[1]))
+                continue
+            decisions.append((True, reason, None))
+            current[key] = (new_severity, i)
+            if signature is not None:
+                analyzed.append((signature, new_severity, i))
+
+        to_analyze = sum(1 for decision in decisions if decision[0])
+        logger.info(f"Batch dedup: {len(alerts)} alerts, {len(current)} alert/instance pairs, {to_analyze} to analyze")
+        return decisions
+
+    def _batch_near_duplicate(self, signature, severity: str, analyzed: List[tuple]) -> Optional[int]:
+        """Index of the most similar alert analyzed earlier in the batch, if any"""
+        best, best_score = None, self.similarity.threshold
+        for other, other_severity, index in analyzed:
+            if other_severity != severity:
+                continue
+            score = estimate_similarity(signature, other)
+            if score >= best_score:
+                best, best_score = index, score
+        return best
+
+    async def mark_duplicates(
+        self,
+        pool,
+        duplicates: List[tuple],
+        firing: List[tuple] = (),
+        adopted: List[tuple] = ()
+    ):
+        """
+        Batch mark_as_duplicate: the firing ids of the alerts received, the
+        states adopted by near duplicates and the duplicate flags are
+        applied in one transaction; the reference rows go to the writer as
+        one submit (a single COPY, after the analysis rows they reference),
+        or into the same transaction without a writer
+
+        Args:
+            duplicates: (alert_id, reference_alert_id, reference_analysis_id, reason) tuples
+            firing: (alert_name, instance, alert_id) of every alert received
+            adopted: (alert_name, instance, alert_id, analysis_id, severity)
+                of pairs taking over a near-duplicate analysis as their state
+        """
+        firing = [f for f in firing if f[0] is not None]
+        # One row per pair (the last wins), as ON CONFLICT requires
+        adopted = list({(a[0], a[1] or ''): a for a in adopted if a[0] is not None}.values())
+        records = [
+            analysis_record(
+                'duplicate_reference', 'deduplication',
+                {
+                    "duplicate": True,
+                    "message": "Similar alert already analyzed" if reason == "near_duplicate"
+                    else "Same alert already analyzed"
+                },
+                1.0,
+                alert_id=alert_id,
+                reference_analysis_id=reference_analysis_id,
+                metadata={"analysis_reason": reason}
+            )
+            for alert_id, _, reference_analysis_id, reason in duplicates
+        ]
+
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if firing:
+                    await conn.execute(
+                        TRACK_FIRING_SQL,
+                        [f[0] for f in firing], [f[1] or '' for f in firing], [f[2] for f in firing],
+                        self.max_firing
+                    )
+                if adopted:
+                    await conn.execute("""
+                        INSERT INTO alert_state (alert_name, instance, severity, last_alert_id, last_analysis_id, updated_at)
+                        SELECT alert_name, instance, severity, alert_id, analysis_id, NOW()
+                        FROM unnest($1::text[], $2::text[], $3::text[], $4::uuid[], $5::uuid[])
+                            AS k(alert_name, instance, severity, alert_id, analysis_id)
+                        ON CONFLICT (alert_name, instance) DO UPDATE
+                        SET severity = EXCLUDED.severity,
+                            last_alert_id = EXCLUDED.last_alert_id,
+                            last_analysis_id = EXCLUDED.last_analysis_id,
+                            updated_at = NOW()
+                    """,
+                        [a[0] for a in adopted], [a[1] or '' for a in adopted], [a[4] for a in adopted],
+                        [a[2] for a in adopted], [a[3] for a in adopted]
+                    )
+                if duplicates:
+                    await conn.execute("""
+                        UPDATE alerts AS a
+                        SET is_duplicate = TRUE,
+                            reference_alert_id = v.reference_alert_id
+                        FROM unnest($1::uuid[], $2::uuid[]) AS v(id, reference_alert_id)
+                        WHERE a.id = v.id
+                    """, [d[0] for d in duplicates], [d[1] for d in duplicates])
+                    if self.writer is None:
+                        await conn.copy_records_to_table('ai_analysis_results', records=records, columns=COLUMNS)
+
+        if self.writer is not None and records:
+            await self.writer.submit(records)
+        if self.cache is not None and adopted:
+            await self.cache.put_many({
+                (name, instance or ''): {"alert_id": alert_id, "analysis_id": analysis_id, "severity": severity}
+                for name, instance, alert_id, analysis_id, severity in adopted
+            })
+
+        if duplicates:
+            logger.debug(f"{len(duplicates)} alerts marked as duplicate")
 
     def _is_escalation(self, old_severity: str, new_severity: str) -> bool:
         """Check if severity is increasing (situation worsening)"""
@@ -117,6 +494,19 @@ class ResourceAwareDeduplicator:
         """
         Mark alert as duplicate and create reference to original analysis
         """
+        record = analysis_record(
+            'duplicate_reference', 'deduplication',
+            {
+                "duplicate": True,
+                "message": "Similar alert already analyzed" if reason == "near_duplicate"
+                else "Same alert already analyzed"
+            },
+            1.0,
+            alert_id=alert_id,
+            reference_analysis_id=reference_analysis_id,
+            metadata={"analysis_reason": reason}
+        )
+
         async with pool.acquire() as conn:
             # Mark alert as duplicate
             await conn.execute("""
@@ -127,15 +517,10 @@ class ResourceAwareDeduplicator:
             """, reference_alert_id, alert_id)
 
             # Create reference record in ai_analysis_results
-            await conn.execute("""
-                INSERT INTO ai_analysis_results
-                (alert_id, analysis_type, reference_analysis_id, model_name, analysis_data, confidence_score, metadata)
-                VALUES ($1, 'duplicate_reference', $2, 'deduplication', $3, 1.0, $4)
-            """,
-            alert_id,
-            reference_analysis_id,
-            '{"duplicate": true, "message": "Same alert already analyzed"}',
-            f'{{"analysis_reason": "{reason}"}}'
-            )
+            if self.writer is None:
+                await conn.copy_records_to_table('ai_analysis_results', records=[record], columns=COLUMNS)
+
+        if self.writer is not None:
+            await self.writer.submit([record])
 
         logger.debug(f"Alert {alert_id} marked as duplicate (reason: {reason})")
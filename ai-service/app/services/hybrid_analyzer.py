@@ -1,70 +1,267 @@
 import json
-import requests
-import asyncio
+import re
+import aiohttp
 import logging
+import time
+from typing import Optional
+from app.config import get_settings
+from app.limiter import AdaptiveLimiter, LimiterRejected
+from app.metrics import LLM_JOBS_SHED, LLM_QUEUE_DEPTH, LLM_TIME_TO_ANALYSIS
+from app.services.llm_cache import prompt_fingerprint
+from app.services.llm_queue import job_deadline, job_priority, templated_analysis
 
 logger = logging.getLogger(__name__)
 
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+
+class JSONObjectExtractor:
+    """
+    Finds the first complete JSON object in text that arrives in pieces
+    (LLM tokens), skipping any prose or code fences around it.
+
+    feed() scans only the new characters, tracking brace depth outside
+    string literals; when the outermost object closes it is parsed (with
+    trailing commas repaired). Brace pairs that are not JSON are skipped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.result: Optional[dict] = None
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> Optional[dict]:
+        """Add text; returns the object once it is complete (None until then)"""
+        if self.result is not None:
+            return self.result
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            if self._start is None:
+                if ch == '{':
+                    self._start, self._depth = self._pos, 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.result = self._parse(text[self._start:self._pos + 1])
+                    if self.result is not None:
+                        return self.result
+                    # Braces in prose, not JSON: rescan after the opening one
+                    self._pos, self._start = self._start, None
+            self._pos += 1
+        return None
+
+    @staticmethod
+    def _parse(candidate: str) -> Optional[dict]:
+        for text in (candidate, _TRAILING_COMMA.sub(r'\1', candidate)):
+            try:
+                value = json.loads(text)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict):
+                return value
+        return None
+
+
+def extract_json(text: str) -> Optional[dict]:
+    """First JSON object in a complete LLM response, or None"""
+    return JSONObjectExtractor().feed(text)
+
 class LLMAnalyzer:
     """
     Throttled LLM Analyzer with CPU protection
 
     Features:
-    - Max 2 concurrent LLM calls (prevents CPU overload)
+    - Adaptive concurrency (AIMD on latency/errors within configured bounds,
+      prevents CPU overload)
+    - Non-blocking pooled keep-alive HTTP client (aiohttp)
     - Context-aware prompts (first_occurrence, escalation, recovery)
+    - Priority queue (severity, reason, age) with per-severity deadlines;
+      jobs shed under load get a templated result
     - Queue depth tracking
+    - Optional LLMResultCache (same normalized prompt inputs → one generation)
+    - Streaming generation, stopped as soon as the JSON answer is complete
     """
 
-    def __init__(self, ollama_url: str, max_concurrent: int = 2):
+    def __init__(
+        self,
+        ollama_url: str,
+        max_concurrent: Optional[int] = None,
+        cache=None,
+        stream: Optional[bool] = None
+    ):
         self.ollama_url = ollama_url
         self.model_name = "llama2"
-        self.semaphore = asyncio.Semaphore(max_concurrent)
         self.queue_depth = 0
-
-    async def analyze(self, alert_data: dict, analysis_reason: str = "first_occurrence") -> dict:
+        self.settings = get_settings()
+        # Starting limit; adjusted between llm_concurrency_min and _max
+        self.limiter = AdaptiveLimiter(
+            initial=max_concurrent or self.settings.llm_concurrency_initial,
+            min_limit=self.settings.llm_concurrency_min,
+            max_limit=self.settings.llm_concurrency_max,
+            backoff=self.settings.llm_concurrency_backoff,
+            latency_tolerance=self.settings.llm_latency_tolerance,
+            max_waiting=self.settings.llm_queue_max_waiting
+        )
+        self.deadlines = {
+            'critical': self.settings.llm_deadline_critical_seconds,
+            'warning': self.settings.llm_deadline_warning_seconds,
+            'info': self.settings.llm_deadline_info_seconds
+        }
+        self.cache = cache
+        self.stream = self.settings.ollama_stream if stream is None else stream
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Lazily create the shared HTTP session (must run inside the event loop).
+        Connections to Ollama are pooled and kept alive between calls.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=max(self.settings.ollama_pool_size, self.limiter.max_limit),
+                keepalive_timeout=self.settings.ollama_keepalive_timeout
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                connect=self.settings.ollama_connect_timeout,
+                sock_read=self.settings.ollama_read_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self):
+        """Close the pooled HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def analyze(
+        self,
+        alert_data: dict,
+        analysis_reason: str = "first_occurrence",
+        queued_at: Optional[float] = None
+    ) -> dict:
         """
         Send alert data to Ollama for Root Cause Analysis
 
         Args:
             alert_data: Alert payload
             analysis_reason: Why we're analyzing (first_occurrence, escalation, recovery)
+            queued_at: time.monotonic() when the job was queued (default: now);
+                its deadline counts from here
         """
+        if self.cache is None:
+            return await self._generate(alert_data, analysis_reason, queued_at)
+
+        labels = alert_data.get("labels", {})
+        description = alert_data.get("annotations", {}).get('description', 'No description')
+        tech_hint = self._get_technology_hint(labels.get('alertname', ''), description)
+        return await self.cache.get_or_generate(
+            prompt_fingerprint(alert_data, analysis_reason, tech_hint),
+            lambda: self._generate(alert_data, analysis_reason, queued_at)
+        )
+
+    async def _generate(self, alert_data: dict, analysis_reason: str, queued_at: Optional[float] = None) -> dict:
+        """Run one Ollama generation for the alert (or shed it under load)"""
+        severity = alert_data.get("labels", {}).get('severity', 'warning')
+        if queued_at is None:
+            queued_at = time.monotonic()
         self.queue_depth += 1
-        logger.info(f"LLM queue depth: {self.queue_depth}, reason: {analysis_reason}")
+        LLM_QUEUE_DEPTH.set(self.queue_depth)
+        logger.info(
+            f"LLM queue depth: {self.queue_depth}, limit: {self.limiter.current_limit}, reason: {analysis_reason}"
+        )
 
         try:
-            async with self.semaphore:  # Throttle: max 2 concurrent
+            slot = self.limiter.acquire(
+                job_priority(alert_data, analysis_reason),
+                deadline=queued_at + job_deadline(alert_data, self.deadlines)
+            )
+            async with slot:  # Throttle: adaptive limit, by priority
                 prompt = self._create_prompt(alert_data, analysis_reason)
 
                 payload = {
                     "model": self.model_name,
                     "prompt": prompt,
-                    "stream": False
+                    "stream": self.stream
                 }
 
-                # Note: In a production async app, use aiohttp or httpx.
-                # Using requests here for simplicity as per requirements.
-                response = requests.post(
-                    f"{self.ollama_url}/api/generate",
-                    json=payload,
-                    timeout=480
-                )
-                response.raise_for_status()
+                session = self._get_session()
+                async with session.post(f"{self.ollama_url}/api/generate", json=payload) as response:
+                    response.raise_for_status()
+                    if self.stream:
+                        result = await self._read_stream(response)
+                        if "raw_analysis" not in result and result.get("error"):
+                            slot.fail()
+                        return result
+                    result = await response.json(content_type=None)
 
-                result = response.json()
                 response_text = result.get("response", "{}")
 
                 try:
                     return json.loads(response_text)
                 except json.JSONDecodeError:
+                    # Salvage JSON wrapped in prose / code fences
+                    salvaged = extract_json(response_text)
+                    if salvaged is not None:
+                        return salvaged
                     return {"raw_analysis": response_text, "error": "Failed to parse JSON"}
 
+        except LimiterRejected as e:
+            logger.warning(f"LLM analysis shed ({e.reason}), severity: {severity}, reason: {analysis_reason}")
+            LLM_JOBS_SHED.labels(reason=e.reason, severity=severity).inc()
+            return templated_analysis(alert_data, analysis_reason, e.reason)
+
         except Exception as e:
             logger.error(f"LLM Analysis failed: {e}")
             return {"error": str(e)}
 
         finally:
             self.queue_depth -= 1
+            LLM_QUEUE_DEPTH.set(self.queue_depth)
+            LLM_TIME_TO_ANALYSIS.labels(severity=severity).observe(time.monotonic() - queued_at)
+
+    async def _read_stream(self, response) -> dict:
+        """
+        Consume Ollama's NDJSON token stream until the first JSON object is
+        complete, then close the connection (which stops the generation)
+        """
+        extractor = JSONObjectExtractor()
+        tokens = 0
+        async for line in response.content:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if message.get("error"):
+                return {"error": message["error"]}
+            tokens += 1
+            result = extractor.feed(message.get("response", ""))
+            if result is not None:
+                if not message.get("done"):
+                    logger.info(f"LLM answer complete after {tokens} tokens, closing the stream")
+                    response.close()
+                return result
+            if message.get("done"):
+                break
+
+        return {"raw_analysis": extractor.text, "error": "Failed to parse JSON"}
 
     def _create_prompt(self, alert: dict, reason: str = "first_occurrence") -> str:
         """
@@ -0,0 +1,184 @@
+"""
+LLM analysis cache
+==================
+
+Ollama generations take minutes on CPU, and the same prompt is often built
+again shortly after (an alert that resolves and fires again, the same
+alert on another host). Results are cached under a fingerprint of the
+prompt template inputs:
+
+    alertname, technology hint, severity, analysis reason and the
+    description with numbers, IPs and hostnames masked
+
+- tier 1: in-process LRU
+- tier 2: Redis string with a TTL, shared by all replicas
+- single flight: concurrent requests for the same fingerprint wait for the
+  one generation in flight instead of starting their own
+
+Error and templated (shed under load) results are never cached. Hits are
+counted per tier together with the generation seconds they saved
+(enodai_llm_cache_* metrics).
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+from loguru import logger
+from app.metrics import LLM_CACHE_REQUESTS, LLM_CACHE_SAVED_SECONDS
+from app.services.similarity import normalize
+
+
+def prompt_fingerprint(alert_data: dict, reason: str, tech_hint: str) -> str:
+    """Hash of the normalized prompt inputs of an alert analysis"""
+    labels = alert_data.get('labels', {})
+    description = (alert_data.get('annotations') or {}).get('description', '')
+    inputs = [
+        labels.get('alertname', ''),
+        tech_hint,
+        labels.get('severity', ''),
+        reason,
+        " ".join(normalize(description).split())
+    ]
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+
+class LLMResultCache:
+    """
+    Two-tier (memory + Redis) cache of LLM analyses with single-flight
+    generation
+    """
+
+    def __init__(
+        self,
+        redis=None,
+        prefix: str = "llm:cache",
+        max_entries: int = 1000,
+        ttl_seconds: int = 3600
+    ):
+        self.redis = redis
+        self.prefix = prefix
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # fingerprint -> (expires_at, result, generation seconds)
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        self.counts = {"memory": 0, "redis": 0, "coalesced": 0, "miss": 0}
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _cacheable(result: dict) -> bool:
+        return not result.get("error") and not result.get("templated")
+
+    def _hit(self, tier: str, seconds: float):
+        self.counts[tier] += 1
+        self.saved_seconds += seconds
+        LLM_CACHE_REQUESTS.labels(result=tier).inc()
+        LLM_CACHE_SAVED_SECONDS.inc(seconds)
+
+    def _remember(self, key: str, result: dict, seconds: float):
+        self._local[key] = (time.monotonic() + self.ttl_seconds, result, seconds)
+        self._local.move_to_end(key)
+        if len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def _lookup(self, key: str) -> Optional[dict]:
+        entry = self._local.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._local.move_to_end(key)
+                self._hit("memory", entry[2])
+                return entry[1]
+            del self._local[key]
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(f"{self.prefix}:{key}")
+            except Exception as e:
+                logger.warning(f"LLM cache read failed: {e}")
+                raw = None
+            if raw:
+                cached = json.loads(raw)
+                self._remember(key, cached["result"], cached["seconds"])
+                self._hit("redis", cached["seconds"])
+                return cached["result"]
+        return None
+
+    async def _store(self, key: str, result: dict, seconds: float):
+        self._remember(key, result, seconds)
+        if self.redis is not None:
+            try:
+                await self.redis.set(
+                    f"{self.prefix}:{key}",
+                    json.dumps({"result": result, "seconds": seconds}),
+                    ex=self.ttl_seconds
+                )
+            except Exception as e:
+                logger.warning(f"LLM cache write failed: {e}")
+
+    async def get_or_generate(self, key: str, generate: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        Cached analysis for this fingerprint, or the result of generate()
+
+        Args:
+            key: prompt_fingerprint() of the request
+            generate: Coroutine function running the LLM call
+
+        Returns:
+            The analysis (a copy, callers may modify it)
+        """
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            try:
+                result, seconds = await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise
+                # The generating request was cancelled; this one carries on
+                return await self.get_or_generate(key, generate)
+            except Exception:
+                return await self.get_or_generate(key, generate)
+            if self._cacheable(result):
+                self._hit("coalesced", seconds)
+            return copy.deepcopy(result)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._lookup(key)
+            seconds = 0.0
+            if result is None:
+                self.counts["miss"] += 1
+                LLM_CACHE_REQUESTS.labels(result="miss").inc()
+                started = time.perf_counter()
+                result = await generate()
+                seconds = time.perf_counter() - started
+                if self._cacheable(result):
+                    await self._store(key, result, seconds)
+            else:
+                seconds = self._local[key][2]
+            future.set_result((result, seconds))
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            # Waiters retry on their own rather than sharing an exception
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+        return copy.deepcopy(result)
+
+    def stats(self) -> dict:
+        requests = sum(self.counts.values())
+        hits = requests - self.counts["miss"]
+        return {
+            **self.counts,
+            "entries": len(self._local),
+            "hit_rate": hits / requests if requests else 0.0,
+            "saved_seconds": self.saved_seconds
+        }
@@ -0,0 +1,85 @@
+"""
+LLM job priorities and load shedding
+====================================
+
+Ollama slots are handed out by the AdaptiveLimiter; this module decides
+the order and what happens to jobs that cannot get one in time:
+
+- priority: severity (ResourceAwareDeduplicator.SEVERITY_LEVELS, highest
+  first), then analysis reason (escalation, first_occurrence, recovery),
+  then age. The consumer's alert lane hands alerts to its workers in this
+  order, and the limiter admits its waiters in it.
+- deadline: seconds a job may wait for a slot, per severity, counted from
+  when the alert entered the alert lane
+- shedding: a job whose deadline passes (or cannot be met given the jobs
+  ahead of it), or that is the lowest priority in an overflowing queue,
+  gets templated_analysis() instead of an LLM call
+
+During a storm the warnings and recoveries are shed first, so critical
+alerts keep a bounded time to analysis.
+"""
+from typing import Dict, Tuple
+from app.services.deduplication import ResourceAwareDeduplicator
+
+REASON_RANKS = {
+    'escalation': 0,
+    'first_occurrence': 1,
+    'recovery': 2
+}
+
+
+def job_priority(alert_data: dict, reason: str) -> Tuple[int, int]:
+    """Limiter priority of an analysis job (lower is served first)"""
+    severity = (alert_data.get('labels') or {}).get('severity', 'warning')
+    return (
+        -ResourceAwareDeduplicator.SEVERITY_LEVELS.get(severity, 1),
+        REASON_RANKS.get(reason, len(REASON_RANKS))
+    )
+
+
+def job_deadline(alert_data: dict, deadlines: Dict[str, float]) -> float:
+    """Seconds the job may wait for a slot (the 'warning' budget by default)"""
+    severity = (alert_data.get('labels') or {}).get('severity', 'warning')
+    return deadlines.get(severity, deadlines['warning'])
+
+
+def templated_analysis(alert_data: dict, reason: str, shed_reason: str) -> dict:
+    """
+    Analysis built from the alert itself, in the LLM's response format, for
+    jobs shed under load (marked templated, never cached or reused)
+    """
+    labels = alert_data.get('labels') or {}
+    annotations = alert_data.get('annotations') or {}
+    alert_name = labels.get('alertname', 'Unknown')
+    instance = labels.get('instance', 'Unknown')
+    description = annotations.get('description') or annotations.get('summary') or 'No description'
+
+    root_cause = {
+        "problem": f"{alert_name}: {description}",
+        "servers": instance
+    }
+    if reason == 'recovery':
+        root_cause["recovery_status"] = "Recovering (not verified)"
+        actions = [f"Monitor {alert_name} on {instance} to confirm recovery"]
+    else:
+        root_cause["impact"] = "Not analyzed: LLM analysis skipped under load"
+        actions = [
+            f"Check {instance} for the condition in the alert description",
+            f"Review recent changes and logs on {instance}"
+        ]
+
+    return {
+        "root_cause": root_cause,
+        "immediate_actions": [
+            {
+                "step": step,
+                "action": action,
+                "command": "",
+                "time": "5-15 min",
+                "critical": labels.get('severity') == 'critical'
+            }
+            for step, action in enumerate(actions, start=1)
+        ],
+        "templated": True,
+        "shed_reason": shed_reason
+    }
@@ -0,0 +1,257 @@
+"""
+Near-duplicate alert detection
+==============================
+
+Exact deduplication needs alertname, instance and severity to match, so a
+storm of the same alert on many hosts (DiskSpaceWarning on db-server-1..50)
+still costs one LLM call per host. This module finds alerts that are
+nearly the same as one analyzed recently:
+
+- the description, summary and labels are normalized, with numbers, IPs,
+  hostnames and hex ids masked, and shingled into tokens
+- a MinHash signature (num_perm 64-bit minimums) estimates the Jaccard
+  similarity of two token sets as the share of equal positions
+- signatures are indexed with LSH banding (bands x rows), so a lookup only
+  compares against entries sharing at least one band, in process memory
+  and in Redis (shared by all replicas, expiring after ttl_seconds)
+
+A match at or above the threshold, with the same severity, lets the alert
+reuse that analysis instead of calling the LLM.
+"""
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+from loguru import logger
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_MASKS = [
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b'), '<id>'),
+    (re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'), '<ip>'),
+    (re.compile(r'\b[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}(?::\d+)?\b'), '<host>'),
+    (re.compile(r'\b[0-9a-f]{12,}\b'), '<hex>'),
+    (re.compile(r'\d+(?:\.\d+)?'), '<num>'),
+]
+_TOKEN = re.compile(r'<\w+>|[a-z_][\w\-<>]*')
+
+# Labels that identify the source rather than the problem
+_IGNORED_LABELS = {'instance', 'job', 'pod', 'container', 'node', 'host', 'hostname'}
+
+
+def normalize(text: str) -> str:
+    """Lowercase text with volatile parts (numbers, IPs, hostnames, ids) masked"""
+    text = str(text).lower()
+    for pattern, mask in _MASKS:
+        text = pattern.sub(mask, text)
+    return text
+
+
+def shingles(alert_data: dict) -> Set[str]:
+    """
+    Token set of an alert payload: masked label pairs plus the words and
+    word bigrams of its description and summary
+    """
+    tokens = set()
+    for key, value in (alert_data.get('labels') or {}).items():
+        if key not in _IGNORED_LABELS:
+            tokens.add(f"{key}={normalize(value)}")
+
+    annotations = alert_data.get('annotations') or {}
+    for field in ('description', 'summary'):
+        words = _TOKEN.findall(normalize(annotations.get(field, '')))
+        tokens.update(f"{field}:{word}" for word in words)
+        tokens.update(f"{field}:{a} {b}" for a, b in zip(words, words[1:]))
+    return tokens
+
+
+class MinHasher:
+    """
+    MinHash signatures from universal hash permutations (deterministic for
+    a given seed, so every replica computes the same signature)
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+
+    def signature(self, tokens: Iterable[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(t.encode(), digest_size=8).digest(), 'little') for t in tokens),
+            dtype=np.uint64
+        )
+        if hashes.size == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        # uint64 wrap-around is part of the hash family
+        with np.errstate(over='ignore'):
+            permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class SimilarityIndex:
+    """
+    LSH index of recent analyses (memory + Redis) keyed by MinHash bands
+    """
+
+    def __init__(
+        self,
+        redis=None,
+        prefix: str = "dedup:lsh",
+        num_perm: int = 64,
+        bands: int = 16,
+        threshold: float = 0.8,
+        ttl_seconds: int = 3600,
+        max_entries: int = 10000,
+        max_candidates: int = 50
+    ):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.redis = redis
+        self.prefix = prefix
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+
+        # entry id -> (expires_at, signature, state); band key -> entry ids
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bands: Dict[str, Set[str]] = {}
+
+        self.lookups = 0
+        self.matches = 0
+
+    def signature(self, alert_data: dict) -> np.ndarray:
+        return self.hasher.signature(shingles(alert_data))
+
+    def _band_keys(self, signature: np.ndarray) -> List[str]:
+        return [
+            f"{i}:{hashlib.blake2b(signature[i * self.rows:(i + 1) * self.rows].tobytes(), digest_size=8).hexdigest()}"
+            for i in range(self.bands)
+        ]
+
+    def _remember(self, entry_id: str, signature: np.ndarray, state: dict, expires_at: float):
+        self._forget(entry_id)
+        self._entries[entry_id] = (expires_at, signature, state)
+        for key in self._band_keys(signature):
+            self._bands.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry[1]):
+            ids = self._bands.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._bands[key]
+
+    def _best(self, signature: np.ndarray, severity: str, candidates: Dict[str, tuple]) -> Optional[dict]:
+        best, best_score = None, self.threshold
+        for entry_signature, state in candidates.values():
+            if state.get('severity') != severity:
+                continue
+            score = similarity(signature, entry_signature)
+            if score >= best_score:
+                best, best_score = state, score
+        if best is None:
+            return None
+        return {**best, "similarity": best_score}
+
+    async def find(self, signature: np.ndarray, severity: str) -> Optional[dict]:
+        """
+        Most similar recent analysis with this severity, or None.
+
+        Returns:
+            The indexed state ({alert_id, analysis_id, severity}) plus the
+            estimated similarity
+        """
+        self.lookups += 1
+        band_keys = self._band_keys(signature)
+        now = time.monotonic()
+
+        candidates = {}
+        for key in band_keys:
+            for entry_id in self._bands.get(key, ()):
+                expires_at, entry_signature, state = self._entries[entry_id]
+                if expires_at > now:
+                    candidates[entry_id] = (entry_signature, state)
+        match = self._best(signature, severity, candidates)
+
+        if match is None and self.redis is not None:
+            try:
+                remote = await self._redis_candidates(band_keys, exclude=candidates)
+            except Exception as e:
+                logger.warning(f"Similarity index read failed: {e}")
+                remote = {}
+            match = self._best(signature, severity, remote)
+            for entry_id, (entry_signature, state) in remote.items():
+                self._remember(entry_id, entry_signature, state, now + self.ttl_seconds)
+
+        if match is not None:
+            self.matches += 1
+        return match
+
+    async def _redis_candidates(self, band_keys: List[str], exclude) -> Dict[str, tuple]:
+        pipe = self.redis.pipeline()
+        for key in band_keys:
+            pipe.smembers(f"{self.prefix}:band:{key}")
+        ids = set()
+        for members in await pipe.execute():
+            ids.update(members or ())
+        ids = [i for i in ids if i not in exclude][:self.max_candidates]
+        if not ids:
+            return {}
+
+        candidates = {}
+        for entry_id, raw in zip(ids, await self.redis.mget([f"{self.prefix}:entry:{i}" for i in ids])):
+            if raw:
+                entry = json.loads(raw)
+                candidates[entry_id] = (np.frombuffer(bytes.fromhex(entry['signature']), dtype=np.uint64), entry['state'])
+        return candidates
+
+    async def add(self, signature: np.ndarray, state: dict):
+        """Index an analysis ({alert_id, analysis_id, severity}) under its signature"""
+        state = {k: (str(v) if v is not None else None) for k, v in state.items()}
+        entry_id = state['analysis_id']
+        self._remember(entry_id, signature, state, time.monotonic() + self.ttl_seconds)
+
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(
+                f"{self.prefix}:entry:{entry_id}",
+                json.dumps({"signature": signature.tobytes().hex(), "state": state}),
+                ex=self.ttl_seconds
+            )
+            for key in self._band_keys(signature):
+                pipe.sadd(f"{self.prefix}:band:{key}", entry_id)
+                pipe.expire(f"{self.prefix}:band:{key}", self.ttl_seconds)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Similarity index write failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "match_rate": self.matches / self.lookups if self.lookups else 0.0
+        }
@@ -3,6 +3,7 @@ from app.routers import analysis, health, auth
 from app.database import Database
 from app.redis_client import RedisConsumer
 from app.scheduler import scheduler
+from app.model_manager import model_manager
 from app.middleware.rate_limit import RateLimitMiddleware, create_rate_limit_middleware
 from app.middleware.logging import LoggingMiddleware
 import asyncio
@@ -39,10 +40,14 @@ app.include_router(analysis.router, prefix="/api/v1/analysis", tags=["analysis"]
 app.include_router(health.router, tags=["health"])
 
 consumer = RedisConsumer()
+consumer_task = None
+# Time the consumer gets on shutdown to drain its lanes and write (and ACK)
+# its buffered results before the database pool is closed
+CONSUMER_STOP_TIMEOUT = 60
 
 @app.on_event("startup")
 async def startup_event():
-    global rate_limit_redis
+    global rate_limit_redis, consumer_task
 
     logger.info("Starting up AI Service...")
     await Database.connect()
@@ -53,8 +58,11 @@ async def startup_event():
     # if rate_limit_redis:
     #     app.add_middleware(RateLimitMiddleware, redis_client=rate_limit_redis)
 
+    # Load the active model version (shared by consumer, scheduler and API)
+    await model_manager.start()
+
     # Start Redis consumer in background
-    asyncio.create_task(consumer.start_consuming())
+    consumer_task = asyncio.create_task(consumer.start_consuming())
 
     # Start scheduler for model retraining
     await scheduler.start()
@@ -67,7 +75,15 @@ async def shutdown_event():
 
     logger.info("Shutting down AI Service...")
     await consumer.stop()
+    if consumer_task is not None:
+        try:
+            await asyncio.wait_for(consumer_task, timeout=CONSUMER_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Redis consumer did not stop within {CONSUMER_STOP_TIMEOUT}s")
+        except Exception as e:
+            logger.error(f"Redis consumer failed: {e}")
     await scheduler.stop()
+    await model_manager.stop()
     await Database.disconnect()
 
     # Close rate limiting Redis connection
@@ -18,7 +18,9 @@ def event_loop():
 @pytest.fixture
 def mock_db_pool():
     """Mock database pool"""
-    pool = AsyncMock()
+    # pool.acquire() is used as an async context manager, so it must not be
+    # a coroutine function itself
+    pool = MagicMock()
     conn = AsyncMock()
     pool.acquire.return_value.__aenter__.return_value = conn
     return pool
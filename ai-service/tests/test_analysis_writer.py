@@ -0,0 +1,223 @@
+"""
+Tests for the ai_analysis_results write-behind buffer
+"""
+import asyncio
+import json
+import uuid
+import asyncpg
+import pytest
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.services.analysis_writer import COLUMNS, AnalysisWriter, analysis_record
+from app.services.deduplication import ResourceAwareDeduplicator
+
+
+def record(i=0):
+    return analysis_record('anomaly_detection', 'if_v1', {"metric_value": i}, -0.61234)
+
+
+@pytest.fixture
+def conn(mock_db_pool):
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.copy_records_to_table = AsyncMock()
+    with patch('app.services.analysis_writer.get_db_pool', return_value=mock_db_pool):
+        yield conn
+
+
+@pytest.mark.unit
+def test_analysis_record_layout():
+    """Test rows follow COLUMNS with a fresh id and DECIMAL(5,4) confidence"""
+    # Act
+    row = analysis_record('llm_analysis', 'llama2', {"a": 1}, 0.85, alert_id="x", metadata={"analysis_reason": "escalation"})
+
+    # Assert
+    assert len(row) == len(COLUMNS)
+    fields = dict(zip(COLUMNS, row))
+    assert isinstance(fields["id"], uuid.UUID)
+    assert fields["alert_id"] == "x"
+    assert json.loads(fields["analysis_data"]) == {"a": 1}
+    assert fields["confidence_score"] == Decimal("0.85")
+    assert json.loads(fields["metadata"]) == {"analysis_reason": "escalation"}
+    assert record()[6] == Decimal("-0.6123")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_flush_on_size_then_ack(conn):
+    """Test a full buffer is copied in one call and its messages ACKed afterwards"""
+    # Arrange
+    calls = []
+    conn.copy_records_to_table.side_effect = lambda *a, **k: calls.append("copy")
+    ack = AsyncMock(side_effect=lambda *ids: calls.append(("ack",) + ids))
+    writer = AnalysisWriter(ack=ack, max_rows=3)
+
+    # Act
+    await writer.submit([record(0), record(1)], ["1-0"])
+    buffered = writer.stats()["buffered"]
+    await writer.submit([record(2)], ["1-1"])
+
+    # Assert
+    assert buffered == 2
+    assert calls == ["copy", ("ack", "1-0", "1-1")]
+    args, kwargs = conn.copy_records_to_table.call_args
+    assert args == ('ai_analysis_results',)
+    assert kwargs["columns"] == COLUMNS
+    assert len(kwargs["records"]) == 3
+    assert writer.stats()["written"] == 3
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_flush_on_interval_and_stop(conn):
+    """Test the flusher writes partial buffers on time and stop() drains the rest"""
+    # Arrange
+    ack = AsyncMock()
+    writer = AnalysisWriter(ack=ack, max_rows=1000, flush_interval_ms=20)
+    writer.start()
+
+    # Act
+    await writer.submit([record()], ["1-0"])
+    await asyncio.sleep(0.1)
+    timed = conn.copy_records_to_table.call_count
+    await writer.submit([record()], ["1-1"])
+    writer.flush_interval = 60
+    await writer.stop()
+
+    # Assert
+    assert timed == 1
+    assert conn.copy_records_to_table.call_count == 2
+    ack.assert_any_call("1-0")
+    ack.assert_called_with("1-1")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_ack_only_messages_wait_for_earlier_rows(conn):
+    """Test an ACK submitted without rows is not sent before earlier rows commit"""
+    # Arrange
+    ack = AsyncMock()
+    writer = AnalysisWriter(ack=ack, max_rows=10)
+
+    # Act
+    await writer.submit([record()])
+    await writer.submit(message_ids=["1-0"])
+    before = ack.called
+    await writer.flush()
+
+    # Assert
+    assert before is False
+    conn.copy_records_to_table.assert_called_once()
+    ack.assert_called_once_with("1-0")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_bad_row_falls_back_to_row_by_row(conn):
+    """Test a constraint violation only drops the offending row"""
+    # Arrange
+    bad = record(1)
+
+    async def copy(table, records, columns):
+        if bad in records:
+            raise asyncpg.ForeignKeyViolationError("alert_id not present")
+
+    conn.copy_records_to_table.side_effect = copy
+    writer = AnalysisWriter(max_rows=10)
+
+    # Act
+    await writer.submit([record(0), bad, record(2)])
+    await writer.flush()
+
+    # Assert
+    assert writer.stats()["written"] == 2
+    assert writer.stats()["dropped"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_transient_failure_is_retried(conn):
+    """Test a lost connection is retried before giving up"""
+    # Arrange
+    conn.copy_records_to_table.side_effect = [ConnectionError("reset"), None]
+    writer = AnalysisWriter(max_rows=10)
+
+    with patch('app.services.analysis_writer.asyncio.sleep', new=AsyncMock()):
+        # Act
+        await writer.submit([record()])
+        await writer.flush()
+
+    # Assert
+    assert conn.copy_records_to_table.call_count == 2
+    assert writer.stats()["written"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_failed_rows_stay_buffered_and_unacked(conn):
+    """Test rows that cannot be written are kept, and their messages ACKed only once they are"""
+    # Arrange
+    conn.copy_records_to_table.side_effect = ConnectionError("database down")
+    ack = AsyncMock()
+    writer = AnalysisWriter(ack=ack, max_rows=10, max_retries=2)
+
+    with patch('app.services.analysis_writer.asyncio.sleep', new=AsyncMock()):
+        # Act
+        await writer.submit([record(0)], ["1-0"])
+        await writer.flush()
+        await writer.submit([record(1)], ["1-1"])
+
+        # Assert
+        ack.assert_not_called()
+        assert writer.stats()["buffered"] == 2
+        assert writer._message_ids == ["1-0", "1-1"]
+        assert writer.stats()["dropped"] == 0
+
+        # Act: the database is back
+        conn.copy_records_to_table.side_effect = None
+        await writer.stop()
+
+    # Assert
+    ack.assert_called_once_with("1-0", "1-1")
+    assert writer.stats()["written"] == 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_full_buffer_applies_backpressure(conn):
+    """Test submit() waits while max_buffered rows are pending"""
+    # Arrange
+    writer = AnalysisWriter(max_rows=2, max_buffered=2)
+    writer._task = MagicMock()
+    await writer.submit([record(0), record(1)])
+
+    # Act
+    blocked = asyncio.create_task(writer.submit([record(2)]))
+    await asyncio.sleep(0.01)
+    waiting = not blocked.done()
+    await writer.flush()
+    await asyncio.wait_for(blocked, timeout=1)
+
+    # Assert
+    assert waiting
+    assert writer.stats()["buffered"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_mark_as_duplicate_buffers_reference(mock_db_pool):
+    """Test duplicate reference rows go through the writer"""
+    # Arrange
+    writer = AnalysisWriter(max_rows=10)
+    deduplicator = ResourceAwareDeduplicator(writer=writer)
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.execute = AsyncMock()
+
+    # Act
+    await deduplicator.mark_as_duplicate(mock_db_pool, "alert-2", "alert-1", "analysis-1")
+
+    # Assert
+    conn.execute.assert_called_once()
+    fields = dict(zip(COLUMNS, writer._rows[0]))
+    assert fields["analysis_type"] == "duplicate_reference"
+    assert fields["reference_analysis_id"] == "analysis-1"
+    assert json.loads(fields["metadata"]) == {"analysis_reason": "duplicate_same_severity"}
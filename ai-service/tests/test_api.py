@@ -39,6 +39,16 @@ def test_health_endpoint_database_error(client):
         assert "DB error" in data["detail"]
 
 
+@pytest.mark.unit
+def test_metrics_endpoint(client):
+    """Test Prometheus metrics are exported"""
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "enodai_llm_cache_saved_seconds_total" in response.text
+
+
 @pytest.mark.unit
 def test_get_latest_analysis_success(client):
     """Test get latest analysis endpoint"""
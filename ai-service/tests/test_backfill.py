@@ -0,0 +1,155 @@
+"""
+Tests for the metrics.model_anomaly backfill job
+"""
+import json
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.features import FEATURE_NAMES, compute_features
+from app.models.backfill import JOB_NAME, AnomalyBackfill
+from app.models.isolation_forest import IsolationForestWrapper
+
+
+def metric_rows(lower, upper, spikes=()):
+    """metrics rows with ids in (lower, upper]"""
+    rng = np.random.default_rng(lower)
+    return [
+        {"id": i, "value": 500.0 if i in spikes else float(rng.normal(50, 2)),
+         "series": "cpu{}", "ts": 1.7e9 + i * 15.0}
+        for i in range(lower + 1, upper + 1)
+    ]
+
+
+@pytest.fixture
+def model(tmp_path):
+    model = IsolationForestWrapper(str(tmp_path / "model.joblib"))
+    model.train(np.random.default_rng(0).normal(50, 2, size=2000))
+    return model
+
+
+@pytest.fixture
+def conn(mock_db_pool):
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.transaction = MagicMock()
+    conn.copy_records_to_table = AsyncMock()
+    conn.execute = AsyncMock(return_value="UPDATE 1")
+    # No rows left unscored below the checkpoint unless a test says so
+    conn.fetch = AsyncMock(side_effect=lambda query, lower, upper, timeout: (
+        [] if "model_anomaly IS NULL" in query else metric_rows(lower, upper, {42, 250})
+    ))
+    return conn
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_backfill_scores_ranges_and_checkpoints(model, conn, mock_db_pool):
+    """Test every range is copied into a temp table, applied and checkpointed"""
+    # Arrange
+    conn.fetchval = AsyncMock(side_effect=[None, 300])
+    backfill = AnomalyBackfill(batch_size=100)
+
+    with patch('app.models.backfill.get_db_pool', return_value=mock_db_pool):
+        # Act
+        stats = await backfill.run(model, "if_v1")
+
+    # Assert
+    assert stats["rows"] == 300
+    assert stats["position"] == 300
+    assert stats["anomalies"] >= 2
+    assert conn.copy_records_to_table.call_count == 3
+
+    copied = {}
+    for call in conn.copy_records_to_table.call_args_list:
+        assert call.args[0] == "backfill_verdicts"
+        copied.update(dict(call.kwargs["records"]))
+    assert sorted(copied) == list(range(1, 301))
+    assert copied[42] is True and copied[250] is True
+
+    statements = [call.args for call in conn.execute.call_args_list]
+    updates = [args for args in statements if "UPDATE metrics AS m" in args[0]]
+    assert len(updates) == 3
+    assert all("SET model_anomaly" in args[0] and "is_anomaly =" not in args[0] for args in updates)
+    assert all(args[1] == "if_v1" for args in updates)
+    checkpoints = [args for args in statements if "job_checkpoints" in args[0]]
+    assert [args[1:3] for args in checkpoints] == [(JOB_NAME, 100), (JOB_NAME, 200), (JOB_NAME, 300)]
+    assert json.loads(checkpoints[-1][3]) == {"model_version": "if_v1"}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_backfill_resumes_from_checkpoint(model, conn, mock_db_pool):
+    """Test a run starts after the committed id and is bounded by max_rows"""
+    # Arrange
+    conn.fetchval = AsyncMock(side_effect=[1000, 5000])
+    backfill = AnomalyBackfill(batch_size=400, max_rows=500)
+
+    with patch('app.models.backfill.get_db_pool', return_value=mock_db_pool):
+        # Act
+        stats = await backfill.run(model, "if_v1")
+
+    # Assert
+    ranges = [call.args[1:3] for call in conn.fetch.call_args_list]
+    assert ranges == [(600, 1000), (1000, 1400), (1400, 1500)]
+    assert "model_anomaly IS NULL" in conn.fetch.call_args_list[0].args[0]
+    assert stats["start"] == 1000
+    assert stats["position"] == 1500
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_backfill_nothing_new(model, conn, mock_db_pool):
+    """Test an up-to-date checkpoint writes nothing"""
+    # Arrange
+    conn.fetchval = AsyncMock(side_effect=[300, 300])
+
+    with patch('app.models.backfill.get_db_pool', return_value=mock_db_pool):
+        # Act
+        stats = await AnomalyBackfill().run(model, "if_v1")
+
+    # Assert
+    assert stats["rows"] == 0
+    assert conn.fetch.call_count == 1  # the catch-up scan only
+    conn.execute.assert_not_called()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_backfill_catches_up_rows_committed_late(model, conn, mock_db_pool):
+    """Test rows below the checkpoint that are still unscored get their verdicts"""
+    # Arrange: id 297 was uncommitted when the last run read max(id)
+    conn.fetchval = AsyncMock(side_effect=[300, 300])
+    conn.fetch = AsyncMock(side_effect=lambda query, lower, upper, timeout: (
+        metric_rows(296, 297) if "model_anomaly IS NULL" in query else []
+    ))
+
+    with patch('app.models.backfill.get_db_pool', return_value=mock_db_pool):
+        # Act
+        stats = await AnomalyBackfill(batch_size=100).run(model, "if_v1")
+
+    # Assert
+    assert conn.fetch.call_args.args[1:3] == (200, 300)
+    assert stats["caught_up"] == stats["rows"] == 1
+    assert dict(conn.copy_records_to_table.call_args.kwargs["records"]) == {297: False}
+    checkpoints = [call.args for call in conn.execute.call_args_list if "job_checkpoints" in call.args[0]]
+    assert [args[1:3] for args in checkpoints] == [(JOB_NAME, 300)]
+
+
+@pytest.mark.unit
+def test_feature_history_carries_across_ranges(tmp_path):
+    """Test feature vectors match a single pass over the whole series"""
+    # Arrange
+    model = MagicMock()
+    model.n_features = len(FEATURE_NAMES)
+    model.score_and_predict.side_effect = lambda X: (np.zeros(len(X)), np.ones(len(X)))
+    backfill = AnomalyBackfill(feature_window=20)
+    rows = metric_rows(0, 150)
+
+    # Act
+    for lower in range(0, 150, 50):
+        backfill.score(model, rows[lower:lower + 50])
+
+    # Assert
+    scored = np.vstack([call.args[0] for call in model.score_and_predict.call_args_list])
+    values = np.array([r["value"] for r in rows])
+    timestamps = np.array([r["ts"] for r in rows])
+    np.testing.assert_allclose(scored, compute_features(values, timestamps, 20), atol=1e-9)
@@ -0,0 +1,206 @@
+"""
+Tests for the compiled IsolationForest scorer
+"""
+import time
+import pytest
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+from app.models.compiled_forest import CompiledForest, average_path_length
+from app.models.isolation_forest import IsolationForestWrapper
+
+
+def fit_forest(n_features=1, max_features=1.0, seed=0):
+    data = np.random.default_rng(seed).normal(50, 10, size=(2000, n_features))
+    scaler = StandardScaler().fit(data)
+    model = IsolationForest(
+        contamination=0.1,
+        n_estimators=100,
+        random_state=42,
+        max_features=max_features
+    ).fit(scaler.transform(data))
+    return model, scaler
+
+
+@pytest.mark.unit
+def test_average_path_length_matches_definition():
+    """Test c(n) for the small-n special cases and the general formula"""
+    # Act
+    c = average_path_length([0, 1, 2, 256])
+
+    # Assert
+    assert c[0] == 0.0
+    assert c[1] == 0.0
+    assert c[2] == 1.0
+    assert c[3] == pytest.approx(2 * (np.log(255) + np.euler_gamma) - 2 * 255 / 256)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("n_features,max_features", [(1, 1.0), (3, 1.0), (3, 0.67)])
+def test_compiled_scores_match_sklearn(n_features, max_features):
+    """Test the compiled scorer reproduces sklearn on raw (unscaled) input"""
+    # Arrange
+    model, scaler = fit_forest(n_features, max_features)
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    X = np.random.default_rng(1).normal(50, 25, size=(5000, n_features))
+
+    # Act
+    scores, predictions = compiled.score_and_predict(X)
+
+    # Assert
+    expected = model.score_samples(scaler.transform(X))
+    # sklearn compares float32 inputs against the thresholds, so a value
+    # sitting right on a split can rarely take the other branch
+    close = np.isclose(scores, expected, atol=1e-9)
+    assert close.mean() > 0.999
+    assert np.abs(scores - expected).max() < 1e-2
+    assert (predictions == model.predict(scaler.transform(X))).mean() > 0.999
+
+
+@pytest.mark.unit
+def test_wrapper_uses_compiled_forest(tmp_path):
+    """Test the wrapper compiles on train and on load"""
+    # Arrange
+    model = IsolationForestWrapper(str(tmp_path / "model.joblib"))
+    model.train(np.random.default_rng(0).normal(50, 5, size=500))
+    restored = IsolationForestWrapper(str(tmp_path / "model.joblib"))
+
+    # Act
+    restored.load()
+
+    # Assert
+    assert model.compiled is not None
+    assert restored.compiled is not None
+    X = np.array([[50.0], [500.0]])
+    np.testing.assert_allclose(restored.score_samples(X), model.score_samples(X))
+    assert list(restored.predict(X)) == [1, -1]
+
+
+@pytest.mark.slow
+def test_compiled_single_row_latency():
+    """Benchmark: single-value scoring is much faster than sklearn + scaler"""
+    # Arrange
+    model, scaler = fit_forest()
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    x = np.array([[55.0]])
+    rounds = 200
+
+    # Act
+    start = time.perf_counter()
+    for _ in range(rounds):
+        model.score_samples(scaler.transform(x))
+    sklearn_latency = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        compiled.score_samples(x)
+    compiled_latency = (time.perf_counter() - start) / rounds
+
+    # Assert
+    assert compiled_latency * 5 < sklearn_latency
+
+
+@pytest.mark.unit
+def test_artifact_roundtrip_is_memory_mapped(tmp_path):
+    """Test the .npy artifact is mapped read-only and scores identically"""
+    # Arrange
+    model, scaler = fit_forest()
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    directory = str(tmp_path / "model.forest")
+    compiled.save(directory, extra={"note": "x"})
+
+    # Act
+    mapped, meta = CompiledForest.load(directory)
+
+    # Assert
+    assert isinstance(mapped.threshold, np.memmap)
+    assert not mapped.threshold.flags.writeable
+    assert meta["note"] == "x"
+    X = np.random.default_rng(2).normal(50, 25, size=(100, 1))
+    np.testing.assert_array_equal(mapped.score_samples(X), compiled.score_samples(X))
+
+
+@pytest.mark.unit
+def test_artifact_save_replaces_previous(tmp_path):
+    """Test re-saving swaps the artifact in place without leftovers"""
+    # Arrange
+    directory = str(tmp_path / "model.forest")
+    CompiledForest.from_sklearn(*fit_forest(seed=0)).save(directory)
+    newer = CompiledForest.from_sklearn(*fit_forest(seed=1))
+
+    # Act
+    newer.save(directory)
+
+    # Assert
+    mapped, _ = CompiledForest.load(directory)
+    np.testing.assert_array_equal(np.asarray(mapped.threshold), newer.threshold)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["model.forest"]
+
+
+@pytest.mark.unit
+def test_wrapper_load_maps_artifact_without_unpickling(tmp_path):
+    """Test load() maps the artifact and only falls back to joblib when disabled"""
+    # Arrange
+    path = str(tmp_path / "model.joblib")
+    trained = IsolationForestWrapper(path)
+    trained.train(np.random.default_rng(0).normal(50, 5, size=500))
+    mapped = IsolationForestWrapper(path)
+    unpickled = IsolationForestWrapper(path, mmap=False)
+
+    # Act
+    mapped.load()
+    unpickled.load()
+
+    # Assert
+    assert isinstance(mapped.compiled.left, np.memmap)
+    assert not hasattr(mapped.model, "estimators_")
+    assert hasattr(unpickled.model, "estimators_")
+    np.testing.assert_allclose(mapped.scaler.mean_, trained.scaler.mean_)
+    # Restored the way StandardScaler.partial_fit expects it
+    assert isinstance(mapped.scaler.n_samples_seen_, np.int64)
+    X = np.array([[50.0], [500.0]])
+    np.testing.assert_array_equal(mapped.score_samples(X), unpickled.score_samples(X))
+    assert mapped.estimate_nbytes() < unpickled.estimate_nbytes()
+
+
+@pytest.mark.unit
+def test_concat_and_tail_keep_per_tree_scores():
+    """Test joined ensembles average the per-tree path lengths of their parts"""
+    # Arrange
+    a = CompiledForest.from_sklearn(*fit_forest(seed=0))
+    b = CompiledForest.from_sklearn(*fit_forest(seed=1))
+    X = np.random.default_rng(3).normal(50, 25, size=(200, 1))
+
+    # Act
+    joined = CompiledForest.concat([a, b])
+    newest = joined.tail(b.n_trees)
+
+    # Assert: score = -2^-mean(normalized path length)
+    depth = lambda forest: -np.log2(-forest.score_samples(X))
+    assert joined.n_trees == a.n_trees + b.n_trees
+    np.testing.assert_allclose(depth(joined), (depth(a) + depth(b)) / 2)
+    np.testing.assert_allclose(newest.score_samples(X), b.score_samples(X))
+    assert joined.tail(0).n_trees == 0
+
+
+@pytest.mark.unit
+def test_partial_fit_keeps_bounded_ensemble_and_follows_drift(tmp_path):
+    """Test incremental updates add new trees, retire old ones and track drift"""
+    # Arrange
+    rng = np.random.default_rng(0)
+    model = IsolationForestWrapper(str(tmp_path / "model.joblib"))
+    model.train(rng.normal(50, 5, size=2000))
+    X = np.array([[50.0], [80.0], [110.0]])
+    assert model.predict(X).tolist() == [1, -1, -1]
+
+    # Act: the metric level moves from 50 to 80
+    for _ in range(10):
+        model.partial_fit(rng.normal(80, 5, size=500), n_trees=10, max_trees=100)
+
+    # Assert
+    assert model.compiled.n_trees == 100
+    assert model.predict(X).tolist() == [-1, 1, -1]
+    assert model.scaler.n_samples_seen_ == 2000 + 10 * 500
+    restored = IsolationForestWrapper(model.model_path, mmap=False)
+    restored.load()
+    np.testing.assert_allclose(restored.score_samples(X), model.score_samples(X))
@@ -0,0 +1,141 @@
+"""
+Tests for the deduplication state cache
+"""
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.dedup_cache import DedupStateCache
+from app.services.deduplication import ResourceAwareDeduplicator
+
+ALERT = {"labels": {"alertname": "HighCPU", "instance": "server-1", "severity": "warning"}}
+ROW = {"alert_id": "alert-1", "analysis_id": "analysis-1", "severity": "warning", "created_at": None}
+
+
+@pytest.fixture
+def redis():
+    store = {}
+    client = AsyncMock()
+    client.hget = AsyncMock(side_effect=lambda key, field: store.get((key, field)))
+    client.hset = AsyncMock(side_effect=lambda key, field, value: store.__setitem__((key, field), value))
+    client.store = store
+    return client
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_miss_then_memory_hit(mock_db_pool, redis):
+    """Test a miss falls back to SQL once and later lookups come from memory"""
+    # Arrange
+    cache = DedupStateCache(redis=redis)
+    deduplicator = ResourceAwareDeduplicator(cache=cache)
+
+    # Act
+    with patch.object(deduplicator, '_find_last_analysis', AsyncMock(return_value=ROW)) as find:
+        first = await deduplicator.should_analyze(mock_db_pool, ALERT)
+        second = await deduplicator.should_analyze(mock_db_pool, ALERT)
+
+    # Assert
+    assert first == second == (False, "duplicate_same_severity")
+    find.assert_called_once()
+    redis.hget.assert_called_once()
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    stored = json.loads(redis.store[("dedup:state", cache.field("HighCPU", "server-1"))])
+    assert stored == {"alert_id": "alert-1", "analysis_id": "analysis-1", "severity": "warning"}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_hit_is_shared_between_replicas(mock_db_pool, redis):
+    """Test state written by one process is served from Redis to another"""
+    # Arrange
+    await DedupStateCache(redis=redis).put("HighCPU", "server-1", {
+        "alert_id": "alert-1", "analysis_id": "analysis-1", "severity": "warning"
+    })
+    cache = DedupStateCache(redis=redis)
+    deduplicator = ResourceAwareDeduplicator(cache=cache)
+
+    # Act
+    with patch.object(deduplicator, '_find_last_analysis', AsyncMock()) as find:
+        decision = await deduplicator.should_analyze(
+            mock_db_pool, {"labels": {**ALERT["labels"], "severity": "critical"}}
+        )
+
+    # Assert
+    assert decision == (True, "escalation")
+    find.assert_not_called()
+    assert cache.stats()["redis_hits"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_record_analysis_writes_through(mock_db_pool, redis):
+    """Test a new analysis replaces the cached state in memory and Redis"""
+    # Arrange
+    cache = DedupStateCache(redis=redis)
+    deduplicator = ResourceAwareDeduplicator(cache=cache)
+    with patch.object(deduplicator, '_find_last_analysis', AsyncMock(return_value=ROW)):
+        await deduplicator.last_analysis(mock_db_pool, "HighCPU", "server-1")
+
+    # Act
+    await deduplicator.record_analysis(mock_db_pool, "HighCPU", "server-1", "alert-2", "analysis-2", "critical")
+    with patch.object(deduplicator, '_find_last_analysis', AsyncMock()) as find:
+        decision = await deduplicator.should_analyze(
+            mock_db_pool, {"labels": {**ALERT["labels"], "severity": "critical"}}
+        )
+
+    # Assert
+    assert decision == (False, "duplicate_same_severity")
+    find.assert_not_called()
+    other = DedupStateCache(redis=redis)
+    assert (await other.get("HighCPU", "server-1"))["analysis_id"] == "analysis-2"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_expired_memory_entry_rereads_redis(redis):
+    """Test memory entries are only trusted for local_ttl seconds"""
+    # Arrange
+    cache = DedupStateCache(redis=redis, local_ttl=0.0)
+    await cache.put("HighCPU", "server-1", {"alert_id": "a", "analysis_id": "b", "severity": "info"})
+
+    # Act
+    state = await cache.get("HighCPU", "server-1")
+
+    # Assert
+    assert state["severity"] == "info"
+    assert cache.stats()["redis_hits"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_errors_fall_back_to_database(mock_db_pool):
+    """Test a Redis outage degrades to the SQL lookup"""
+    # Arrange
+    redis = AsyncMock()
+    redis.hget = AsyncMock(side_effect=ConnectionError("down"))
+    redis.hset = AsyncMock(side_effect=ConnectionError("down"))
+    deduplicator = ResourceAwareDeduplicator(cache=DedupStateCache(redis=redis))
+
+    # Act
+    with patch.object(deduplicator, '_find_last_analysis', AsyncMock(return_value=None)) as find:
+        decision = await deduplicator.should_analyze(mock_db_pool, ALERT)
+
+    # Assert
+    assert decision == (True, "first_occurrence")
+    find.assert_called_once()
+
+
+@pytest.mark.unit
+def test_memory_is_bounded():
+    """Test the in-process tier evicts least recently used entries"""
+    # Arrange
+    cache = DedupStateCache(max_entries=2)
+
+    # Act
+    for i in range(3):
+        cache._remember(cache.field("HighCPU", f"server-{i}"), {"severity": "warning"})
+
+    # Assert
+    assert cache.stats()["entries"] == 2
+    assert cache.field("HighCPU", "server-0") not in cache._local
@@ -0,0 +1,206 @@
+"""
+Tests for alert_state maintenance in the deduplicator
+"""
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.services.analysis_writer import COLUMNS, AnalysisWriter
+from app.services.dedup_cache import DedupStateCache
+from app.services.deduplication import TRACK_FIRING_SQL, ResourceAwareDeduplicator
+
+
+def alert(name, instance, severity):
+    return {"labels": {"alertname": name, "instance": instance, "severity": severity}}
+
+
+@pytest.fixture
+def conn(mock_db_pool):
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.transaction = MagicMock()
+    return conn
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_last_analysis_reads_alert_state(mock_db_pool, conn):
+    """Test the lookup is a primary key read of alert_state, not a history scan"""
+    # Arrange
+    conn.fetchrow = AsyncMock(return_value={"alert_id": "a1", "analysis_id": "r1", "severity": "critical"})
+    deduplicator = ResourceAwareDeduplicator()
+
+    # Act
+    state = await deduplicator.last_analysis(mock_db_pool, "HighCPU", None)
+
+    # Assert
+    sql, alert_name, instance = conn.fetchrow.call_args.args
+    assert "FROM alert_state" in sql
+    assert "alerts a" not in sql
+    assert (alert_name, instance) == ("HighCPU", "")
+    assert state == {"alert_id": "a1", "analysis_id": "r1", "severity": "critical"}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_track_firing_and_record_analysis_upsert(mock_db_pool, conn):
+    """Test received alerts and new analyses are upserted into alert_state"""
+    # Arrange
+    conn.execute = AsyncMock()
+    deduplicator = ResourceAwareDeduplicator(max_firing=50)
+
+    # Act
+    await deduplicator.track_firing(mock_db_pool, "HighCPU", "server-1", "a2")
+    await deduplicator.record_analysis(mock_db_pool, "HighCPU", "server-1", "a2", "r2", "warning")
+
+    # Assert
+    track, record = conn.execute.call_args_list
+    assert "ON CONFLICT (alert_name, instance)" in track.args[0]
+    assert track.args[1:] == (["HighCPU"], ["server-1"], ["a2"], 50)
+    assert "last_analysis_id = EXCLUDED.last_analysis_id" in record.args[0]
+    assert record.args[1:] == ("HighCPU", "server-1", "warning", "a2", "r2")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_resolve_firing_only_touches_tracked_alerts(mock_db_pool, conn):
+    """Test recovery resolves the firing ids of the row and keeps the rest"""
+    # Arrange
+    old, newer, current = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    conn.fetchval = AsyncMock(return_value=[old, newer, current])
+    conn.fetch = AsyncMock(return_value=[{"id": old}])
+    conn.execute = AsyncMock()
+    deduplicator = ResourceAwareDeduplicator()
+
+    # Act
+    resolved = await deduplicator.resolve_firing(mock_db_pool, "HighCPU", "server-1", current)
+
+    # Assert
+    assert resolved == 1
+    sql, firing, alert_id = conn.fetch.call_args.args
+    assert "id = ANY($1::uuid[])" in sql
+    assert firing == [old, newer, current]
+    assert alert_id == current
+    assert conn.execute.call_args.args[1:] == ("HighCPU", "server-1", [newer, current])
+    conn.transaction.assert_called_once()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_resolve_firing_without_state(mock_db_pool, conn):
+    """Test recovery for an alert without state resolves nothing"""
+    # Arrange
+    conn.fetchval = AsyncMock(return_value=None)
+    conn.fetch = AsyncMock()
+    deduplicator = ResourceAwareDeduplicator()
+
+    # Act
+    resolved = await deduplicator.resolve_firing(mock_db_pool, "HighCPU", "server-1", uuid.uuid4())
+
+    # Assert
+    assert resolved == 0
+    conn.fetch.assert_not_called()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_should_analyze_batch_collapses_pairs(mock_db_pool, conn):
+    """Test a burst is decided with one lookup per distinct alert/instance pair"""
+    # Arrange
+    conn.fetch = AsyncMock(return_value=[
+        {"alert_name": "HighCPU", "instance": "server-1", "alert_id": "a1", "analysis_id": "r1", "severity": "warning"}
+    ])
+    deduplicator = ResourceAwareDeduplicator()
+    alerts = [
+        alert("HighCPU", "server-1", "warning"),
+        alert("DiskFull", "server-2", "warning"),
+        alert("HighCPU", "server-1", "warning"),
+        alert("DiskFull", "server-2", "warning"),
+        alert("DiskFull", "server-2", "critical"),
+        alert("DiskFull", "server-2", "critical"),
+    ]
+
+    # Act
+    decisions = await deduplicator.should_analyze_batch(mock_db_pool, alerts)
+
+    # Assert
+    conn.fetch.assert_called_once()
+    _, names, instances = conn.fetch.call_args.args
+    assert list(zip(names, instances)) == [("HighCPU", "server-1"), ("DiskFull", "server-2")]
+    state = {"alert_id": "a1", "analysis_id": "r1", "severity": "warning"}
+    assert decisions == [
+        (False, "duplicate_same_severity", state),
+        (True, "first_occurrence", None),
+        (False, "duplicate_same_severity", state),
+        (False, "duplicate_same_severity", 1),
+        (True, "escalation", None),
+        (False, "duplicate_same_severity", 4),
+    ]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_should_analyze_batch_pending_analysis_wins(mock_db_pool, conn):
+    """Test an analysis still in progress counts as the pair's latest, ahead of the stored one"""
+    # Arrange
+    conn.fetch = AsyncMock(return_value=[
+        {"alert_name": "HighCPU", "instance": "server-1", "alert_id": "a1", "analysis_id": "r1", "severity": "warning"}
+    ])
+    deduplicator = ResourceAwareDeduplicator()
+    token = []
+
+    # Act
+    decisions = await deduplicator.should_analyze_batch(
+        mock_db_pool,
+        [alert("HighCPU", "server-1", "critical"), alert("HighCPU", "server-1", "warning")],
+        pending={("HighCPU", "server-1"): ("critical", token)}
+    )
+
+    # Assert
+    assert decisions[0] == (False, "duplicate_same_severity", token)
+    assert decisions[0][2] is token
+    assert decisions[1] == (True, "recovery", None)
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_should_analyze_batch_served_from_cache(mock_db_pool, conn):
+    """Test cached pairs need no query at all"""
+    # Arrange
+    redis = AsyncMock()
+    redis.hmget = AsyncMock(return_value=[
+        '{"alert_id": "a1", "analysis_id": "r1", "severity": "critical"}'
+    ])
+    conn.fetch = AsyncMock()
+    deduplicator = ResourceAwareDeduplicator(cache=DedupStateCache(redis=redis))
+
+    # Act
+    decisions = await deduplicator.should_analyze_batch(
+        mock_db_pool, [alert("HighCPU", "server-1", "critical"), alert("HighCPU", "server-1", "warning")]
+    )
+
+    # Assert
+    conn.fetch.assert_not_called()
+    redis.hmget.assert_called_once()
+    assert [d[1] for d in decisions] == ["duplicate_same_severity", "recovery"]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_mark_duplicates_single_transaction(mock_db_pool, conn):
+    """Test firing ids and duplicate flags share a transaction and references one submit"""
+    # Arrange
+    conn.execute = AsyncMock()
+    writer = AnalysisWriter(max_rows=100)
+    deduplicator = ResourceAwareDeduplicator(writer=writer)
+    duplicates = [("a2", "a1", "r1", "duplicate_same_severity"), ("a3", "a1", "r1", "duplicate_same_severity")]
+    firing = [("HighCPU", "server-1", "a2"), ("HighCPU", None, "a3"), (None, None, "a4")]
+
+    # Act
+    await deduplicator.mark_duplicates(mock_db_pool, duplicates, firing=firing)
+
+    # Assert
+    conn.transaction.assert_called_once()
+    track, update = conn.execute.call_args_list
+    assert track.args == (TRACK_FIRING_SQL, ["HighCPU", "HighCPU"], ["server-1", ""], ["a2", "a3"], 1000)
+    assert "unnest($1::uuid[], $2::uuid[])" in update.args[0]
+    assert update.args[1:] == (["a2", "a3"], ["a1", "a1"])
+    rows = [dict(zip(COLUMNS, row)) for row in writer._rows]
+    assert [(r["alert_id"], r["reference_analysis_id"]) for r in rows] == [("a2", "r1"), ("a3", "r1")]
@@ -110,38 +110,67 @@ async def test_detect_infinite_value(detector):
 
 @pytest.mark.unit
 @pytest.mark.asyncio
-async def test_train_model_success(detector, mock_db_pool):
+async def test_train_model_success(detector):
     """Test model training with valid data"""
     # Arrange
-    with patch('app.detector.get_db_pool', return_value=mock_db_pool):
-        mock_conn = mock_db_pool.acquire.return_value.__aenter__.return_value
-        mock_conn.fetch = AsyncMock(return_value=[
-            {"metric_value": 50.0},
-            {"metric_value": 55.0},
-            {"metric_value": 60.0}
-        ])
+    detector.training_loader.load = AsyncMock(return_value=np.array([50.0, 55.0, 60.0]))
+    detector.training_loader.list_series = AsyncMock(return_value=[])
+    live_model = detector.model
+    trained = MagicMock()
+    detector.training_engine.train = AsyncMock(return_value=trained)
 
-        # Act
-        await detector.train_model()
+    # Act
+    new_model = await detector.train_model()
 
-        # Assert
-        detector.model.train.assert_called_once()
+    # Assert: a fresh model is trained and swapped in, the live one is untouched
+    detector.training_engine.train.assert_called_once()
+    data, model_path = detector.training_engine.train.call_args[0]
+    assert data.shape == (3, 1)
+    assert model_path == detector.settings.model_path
+    live_model.train.assert_not_called()
+    assert new_model is trained
+    assert detector.model is trained
 
 
 @pytest.mark.unit
 @pytest.mark.asyncio
-async def test_train_model_no_data(detector, mock_db_pool):
+async def test_train_model_no_data(detector):
     """Test model training with no data"""
     # Arrange
-    with patch('app.detector.get_db_pool', return_value=mock_db_pool):
-        mock_conn = mock_db_pool.acquire.return_value.__aenter__.return_value
-        mock_conn.fetch = AsyncMock(return_value=[])
+    detector.training_loader.load = AsyncMock(return_value=np.empty(0))
+    detector.training_engine.train = AsyncMock()
+
+    # Act
+    await detector.train_model()
+
+    # Assert
+    detector.model.train.assert_not_called()
+    detector.training_engine.train.assert_not_called()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_train_series_models_in_waves(detector, tmp_path):
+    """Test series with enough history get their own model"""
+    # Arrange
+    detector.registry.model_dir = str(tmp_path)
+    detector.settings.min_series_points = 3
+    detector.training_loader.list_series = AsyncMock(return_value=[("cpu_usage", {}), ("rare", {})])
+    detector.training_loader.load_series = AsyncMock(return_value=[
+        ("cpu_usage", {}, np.array([1.0, 2.0, 3.0])),
+        ("rare", {}, np.array([1.0])),
+    ])
+    series_model = MagicMock()
+    series_model.estimate_nbytes.return_value = 1
+    detector.training_engine.train_many = AsyncMock(return_value={"cpu_usage": series_model})
 
-        # Act
-        await detector.train_model()
+    # Act
+    await detector.train_series_models()
 
-        # Assert
-        detector.model.train.assert_not_called()
+    # Assert
+    datasets = detector.training_engine.train_many.call_args[0][0]
+    assert list(datasets) == ["cpu_usage"]
+    assert detector.registry.get("cpu_usage") is series_model
 
 
 @pytest.mark.unit
@@ -159,3 +188,199 @@ async def test_detect_invalid_value_type(detector):
     # Assert
     assert result["is_anomaly"] is False
     assert "error" in result
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_detect_batch_mixed_values(detector):
+    """Test batch detection scores valid values in one pass and keeps order"""
+    # Arrange
+    detector.model.score_and_predict.return_value = (
+        np.array([-0.1, -0.8]),
+        np.array([1, -1])
+    )
+
+    metrics = [
+        {"metric_value": 50.0},
+        {},
+        {"metric_value": float('nan')},
+        {"metric_value": "not_a_number"},
+        {"metric_value": 95.0},
+    ]
+
+    # Act
+    results = await detector.detect_batch(metrics)
+
+    # Assert
+    detector.model.score_and_predict.assert_called_once()
+    features = detector.model.score_and_predict.call_args[0][0]
+    assert features.shape == (2, 1)
+    assert len(results) == 5
+    assert results[0]["is_anomaly"] is False
+    assert results[1]["error"] == "Missing metric_value"
+    assert results[2]["error"] == "Non-finite value"
+    assert results[3]["error"] == "Invalid value"
+    assert results[4]["is_anomaly"] is True
+    assert results[4]["anomaly_score"] == -0.8
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_detect_batch_all_invalid(detector):
+    """Test batch detection skips the model when nothing is scorable"""
+    # Act
+    results = await detector.detect_batch([{}, {"metric_value": float('inf')}])
+
+    # Assert
+    detector.model.score_and_predict.assert_not_called()
+    assert all(r["is_anomaly"] is False for r in results)
+
+
+@pytest.mark.unit
+def test_score_and_predict_matches_sklearn(tmp_path):
+    """Test score_and_predict agrees with separate predict/score_samples calls"""
+    from app.models.isolation_forest import IsolationForestWrapper
+
+    # Arrange
+    model = IsolationForestWrapper(str(tmp_path / "model.joblib"))
+    rng = np.random.default_rng(0)
+    model.train(rng.normal(50, 10, size=500).tolist())
+    X = np.array([[10.0], [50.0], [55.0], [120.0]])
+
+    # Act
+    scores, predictions = model.score_and_predict(X)
+
+    # Assert
+    np.testing.assert_allclose(scores, model.score_samples(X))
+    np.testing.assert_array_equal(predictions, model.predict(X))
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_detect_batch_uses_series_models(detector):
+    """Test batch detection groups points by series and uses their models"""
+    # Arrange
+    series_model = MagicMock()
+    series_model.score_and_predict.return_value = (np.array([-0.9]), np.array([-1]))
+    detector.registry.get = MagicMock(side_effect=lambda key: series_model if key == "cpu_usage" else None)
+    detector.model.score_and_predict.return_value = (np.array([-0.1, -0.2]), np.array([1, 1]))
+
+    metrics = [
+        {"metric_name": "memory_usage", "metric_value": 1e9},
+        {"metric_name": "cpu_usage", "metric_value": 99.0},
+        {"metric_value": 10.0},
+    ]
+
+    # Act
+    results = await detector.detect_batch(metrics)
+
+    # Assert
+    series_model.score_and_predict.assert_called_once()
+    assert results[1]["is_anomaly"] is True
+    assert results[0]["is_anomaly"] is False
+    assert results[2]["anomaly_score"] == -0.2
+    assert results[1]["model_version"] == detector.registry.version_for("cpu_usage")
+    assert results[0]["model_version"] == results[2]["model_version"] == "if_v1"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_update_model_uses_newest_window(detector):
+    """Test incremental updates extend the live model with the newest window"""
+    # Arrange
+    detector.training_loader.load = AsyncMock(return_value=np.full(100, 50.0))
+    updated = MagicMock()
+    detector.training_engine.update = AsyncMock(return_value=updated)
+
+    # Act
+    result = await detector.update_model("/models/next.joblib")
+
+    # Assert
+    assert result is updated
+    assert detector.training_loader.load.call_args.kwargs["window_hours"] == \
+        detector.settings.incremental_window_minutes / 60
+    data, base_path, model_path, n_trees, max_trees = detector.training_engine.update.call_args[0]
+    assert data.shape == (100, 1)
+    assert base_path == detector.model.model_path
+    assert model_path == "/models/next.joblib"
+    # Not swapped in until published
+    assert detector.model is not updated
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_update_model_skips_small_window(detector):
+    """Test too few new points leave the model as is"""
+    # Arrange
+    detector.training_loader.load = AsyncMock(return_value=np.full(3, 50.0))
+    detector.training_engine.update = AsyncMock()
+
+    # Act
+    result = await detector.update_model("/models/next.joblib")
+
+    # Assert
+    assert result is None
+    detector.training_engine.update.assert_not_called()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_detect_batch_scores_feature_vectors(detector, tmp_path):
+    """Test a feature model flags a spike that is normal in absolute terms"""
+    # Arrange: two series, cpu hovering around 20, api around 80
+    from app.features import compute_features
+    from app.models.isolation_forest import IsolationForestWrapper
+    rng = np.random.default_rng(0)
+    ts = np.arange(2000) * 15.0
+    training = np.vstack([
+        compute_features(rng.normal(20, 1, size=2000), ts, 60),
+        compute_features(rng.normal(80, 1, size=2000), ts, 60),
+    ])
+    model = IsolationForestWrapper(str(tmp_path / "features.joblib"))
+    model.train(training)
+    detector.model = model
+    detector.registry.get = MagicMock(return_value=None)
+
+    def point(name, value, i):
+        return {"metric_name": name, "metric_value": value, "timestamp": 1.7e9 + i * 15}
+
+    for i in range(60):
+        await detector.detect_batch([point("cpu", 20.0 + (i % 3 - 1) * 0.5, i), point("api", 80.0, i)])
+
+    # Act: cpu jumps to 80, a value that is perfectly normal for api
+    results = await detector.detect_batch([point("cpu", 80.0, 60), point("api", 80.0, 60)])
+
+    # Assert
+    assert model.n_features == 4
+    assert results[0]["is_anomaly"] is True
+    assert results[1]["is_anomaly"] is False
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_detect_batch_routes_metrics_to_streaming_backends(detector):
+    """Test metrics with a configured backend bypass the forest"""
+    # Arrange
+    from app.models.streaming import build_backends
+    detector.backends = build_backends({"cpu_usage": "ewma"})
+    detector.model.n_features = 1
+    detector.model.score_and_predict.return_value = (np.array([-0.4]), np.array([1]))
+    detector.registry.get = MagicMock(return_value=None)
+    history = [{"metric_name": "cpu_usage", "metric_value": 50.0 + i % 2} for i in range(30)]
+    await detector.detect_batch(history)
+
+    # Act
+    results = await detector.detect_batch([
+        {"metric_name": "cpu_usage", "metric_value": 500.0},
+        {"metric_name": "memory_usage", "metric_value": 500.0},
+    ])
+    single = await detector.detect({"metric_name": "cpu_usage", "metric_value": 50.0})
+
+    # Assert
+    assert results[0]["is_anomaly"] is True
+    assert results[0]["model_version"] == "ewma"
+    assert -1 < results[0]["anomaly_score"] < -0.5
+    assert results[1]["model_version"] == "if_v1"
+    features = detector.model.score_and_predict.call_args[0][0]
+    assert features.tolist() == [[500.0]]
+    assert single["model_version"] == "ewma"
@@ -0,0 +1,160 @@
+"""
+Tests for the model evaluation harness
+"""
+import json
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, patch
+from app.features import FEATURE_NAMES
+from app.models.evaluation import (
+    EvaluationWindow,
+    ModelEvaluator,
+    benchmark_scoring,
+    classification_metrics,
+)
+from app.models.isolation_forest import IsolationForestWrapper
+
+
+def window_rows(n=400):
+    """Metric rows as returned by the window query (newest first)"""
+    rng = np.random.default_rng(0)
+    values = rng.normal(50, 2, size=n)
+    labels = np.zeros(n, dtype=bool)
+    values[::50] = 150.0
+    labels[::50] = True
+    rows = [
+        {"series": "cpu{}", "ts": 1.7e9 + i * 15, "value": float(v), "is_anomaly": bool(l)}
+        for i, (v, l) in enumerate(zip(values, labels))
+    ]
+    return rows[::-1]
+
+
+def trained(tmp_path, name, data):
+    model = IsolationForestWrapper(str(tmp_path / f"{name}.joblib"))
+    model.train(data)
+    return model
+
+
+@pytest.mark.unit
+def test_classification_metrics():
+    """Test precision/recall/F1 against boolean labels"""
+    # Arrange
+    labels = np.array([True, True, False, False, True])
+    predictions = np.array([-1, 1, -1, 1, -1])
+
+    # Act
+    metrics = classification_metrics(labels, predictions)
+
+    # Assert
+    assert metrics["true_positives"] == 2
+    assert metrics["precision"] == pytest.approx(2 / 3)
+    assert metrics["recall"] == pytest.approx(2 / 3)
+    assert metrics["f1"] == pytest.approx(2 / 3)
+    assert metrics["anomaly_rate"] == pytest.approx(0.6)
+
+
+@pytest.mark.unit
+def test_classification_metrics_without_labels():
+    """Test quality is undefined, not zero, when nothing is labeled"""
+    # Act
+    metrics = classification_metrics(np.zeros(4, dtype=bool), np.ones(4))
+
+    # Assert
+    assert metrics["precision"] is None
+    assert metrics["recall"] is None
+    assert metrics["f1"] is None
+
+
+@pytest.mark.unit
+def test_benchmark_scoring_times_batches(tmp_path):
+    """Test batched predictions match one pass and latency stats are reported"""
+    # Arrange
+    model = trained(tmp_path, "m", np.random.default_rng(0).normal(50, 2, size=500))
+    X = np.random.default_rng(1).normal(50, 10, size=(1234, 1))
+
+    # Act
+    predictions, latency = benchmark_scoring(model, X, batch_size=100)
+
+    # Assert
+    np.testing.assert_array_equal(predictions, model.predict(X))
+    assert latency["batch_p99_ms"] >= latency["batch_p50_ms"] > 0
+    assert latency["point_p99_us"] >= latency["point_p50_us"] > 0
+    assert latency["throughput"] > 0
+
+
+@pytest.mark.unit
+def test_window_inputs_for_feature_models(tmp_path):
+    """Test feature models get per-series feature vectors in row order"""
+    # Arrange
+    window = EvaluationWindow(
+        series=np.array(["a", "b", "a", "b"], dtype=object),
+        timestamps=np.array([0.0, 0.0, 10.0, 10.0]),
+        values=np.array([1.0, 100.0, 3.0, 90.0]),
+        labels=np.zeros(4, dtype=bool)
+    )
+    features_model = trained(tmp_path, "f", np.random.default_rng(0).normal(size=(200, len(FEATURE_NAMES))))
+    raw_model = trained(tmp_path, "r", np.random.default_rng(0).normal(size=200))
+
+    # Act
+    X = window.inputs_for(features_model, 60)
+
+    # Assert
+    assert X[:, 0].tolist() == [1.0, 100.0, 3.0, 90.0]
+    assert X[:, 1].tolist() == [0.0, 0.0, 2.0, -10.0]
+    assert window.inputs_for(raw_model, 60).shape == (4, 1)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_run_evaluates_active_and_candidates(tmp_path, mock_db_pool):
+    """Test every version is scored on the window and recorded in model_versions"""
+    # Arrange
+    rng = np.random.default_rng(0)
+    active = trained(tmp_path, "active", rng.normal(50, 2, size=1000))
+    candidate = trained(tmp_path, "candidate", rng.normal(50, 2, size=1000))
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.fetch = AsyncMock(side_effect=[
+        window_rows(),
+        [
+            {"version": "if_new", "file_path": candidate.model_path},
+            {"version": "if_gone", "file_path": str(tmp_path / "missing.joblib")},
+        ],
+    ])
+    conn.execute = AsyncMock()
+    evaluator = ModelEvaluator(batch_size=64)
+
+    with patch('app.models.evaluation.get_db_pool', return_value=mock_db_pool):
+        # Act
+        results = await evaluator.run(active, "if_active")
+
+    # Assert
+    assert set(results) == {"if_active", "if_new"}
+    assert results["if_active"]["rows"] == 400
+    assert results["if_active"]["labeled_anomalies"] == 8
+    assert results["if_active"]["recall"] == 1.0
+    assert results["if_new"]["baseline_version"] == "if_active"
+    assert "p99_ratio" in results["if_new"]
+    assert "f1_delta" in results["if_new"]
+
+    recorded = {call.args[2]: json.loads(call.args[3]) for call in conn.execute.call_args_list}
+    assert set(recorded) == {"if_active", "if_new"}
+    assert recorded["if_new"]["throughput"] > 0
+    assert "jsonb_build_object('evaluation'" in conn.execute.call_args_list[0].args[0]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_run_with_empty_window(tmp_path, mock_db_pool):
+    """Test nothing is recorded when there is no data to replay"""
+    # Arrange
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.fetch = AsyncMock(return_value=[])
+    conn.execute = AsyncMock()
+
+    with patch('app.models.evaluation.get_db_pool', return_value=mock_db_pool):
+        # Act
+        results = await ModelEvaluator().run(IsolationForestWrapper(str(tmp_path / "x.joblib")), "if_v1")
+
+    # Assert
+    assert results == {}
+    conn.execute.assert_not_called()
@@ -0,0 +1,105 @@
+"""
+Tests for the streaming feature engine
+"""
+import pytest
+import numpy as np
+from app.features import FEATURE_NAMES, FeatureEngine, compute_features
+
+
+@pytest.mark.unit
+def test_first_point_has_no_history():
+    """Test a new series starts with zero delta, rate and z-score"""
+    # Arrange
+    engine = FeatureEngine(window=10)
+
+    # Act
+    features = engine.update("cpu", 42.0, 1000.0)
+
+    # Assert
+    assert features.tolist() == [42.0, 0.0, 0.0, 0.0]
+
+
+@pytest.mark.unit
+def test_delta_rate_and_zscore():
+    """Test features are relative to the series' own recent history"""
+    # Arrange
+    engine = FeatureEngine(window=4)
+    for i, value in enumerate([10.0, 12.0, 10.0, 12.0, 10.0, 12.0]):
+        engine.update("cpu", value, i * 15.0)
+
+    # Act: window now holds 10, 12, 10, 12 (mean 11, std 1)
+    value, delta, rate, zscore = engine.update("cpu", 20.0, 6 * 15.0)
+
+    # Assert
+    assert value == 20.0
+    assert delta == 8.0
+    assert rate == pytest.approx(8.0 / 15.0)
+    assert zscore == pytest.approx(9.0)
+
+
+@pytest.mark.unit
+def test_flat_series_has_zero_zscore():
+    """Test a constant series never produces a z-score from float noise"""
+    # Arrange
+    engine = FeatureEngine(window=8)
+    for i in range(50):
+        engine.update("up", 1e9 + 0.1, float(i))
+
+    # Act
+    features = engine.update("up", 1e9 + 0.1, 50.0)
+
+    # Assert
+    assert features[3] == 0.0
+
+
+@pytest.mark.unit
+def test_streaming_matches_vectorized():
+    """Test point-by-point features equal the batch computation used for training"""
+    # Arrange
+    rng = np.random.default_rng(0)
+    values = rng.normal(1e6, 1e3, size=500)
+    values[200:210] = 1.1e6
+    timestamps = 1.7e9 + np.cumsum(rng.uniform(5, 20, size=500))
+    engine = FeatureEngine(window=30)
+
+    # Act
+    streamed = np.array([engine.update("disk", v, t) for v, t in zip(values, timestamps)])
+    batch = compute_features(values, timestamps, 30)
+    split = np.vstack([
+        compute_features(values[:123], timestamps[:123], 30),
+        compute_features(values[123:], timestamps[123:], 30, values[:123], timestamps[122])
+    ])
+
+    # Assert
+    assert batch.shape == (500, len(FEATURE_NAMES))
+    np.testing.assert_allclose(streamed, batch, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(split, batch, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.unit
+def test_memory_is_bounded():
+    """Test ring buffers are preallocated and the series count is capped"""
+    # Arrange
+    engine = FeatureEngine(window=16, max_series=3)
+
+    # Act
+    for i in range(1000):
+        engine.update(f"series-{i % 5}", float(i), float(i))
+
+    # Assert
+    stats = engine.stats()
+    assert stats["series"] == 3
+    assert stats["resident_bytes"] == 3 * 16 * 8
+    assert "series-0" not in engine._series
+
+
+@pytest.mark.unit
+def test_series_key_and_timestamp_parsing():
+    """Test series identity uses all labels and timestamps accept common formats"""
+    # Act & Assert
+    assert FeatureEngine.series_key({"metric_name": "cpu", "labels": {"b": "2", "a": "1"}}) == \
+        FeatureEngine.series_key({"metric_name": "cpu", "labels": {"a": "1", "b": "2"}})
+    assert FeatureEngine.timestamp_of({"timestamp": 1700000000}) == 1700000000.0
+    assert FeatureEngine.timestamp_of({"timestamp": "1700000000"}) == 1700000000.0
+    assert FeatureEngine.timestamp_of({"timestamp": "2023-11-14T22:13:20Z"}) == 1700000000.0
+    assert FeatureEngine.timestamp_of({}) > 1700000000.0
@@ -0,0 +1,205 @@
+"""
+Tests for LLM analyzer
+"""
+import pytest
+import json
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from app.services.hybrid_analyzer import JSONObjectExtractor, LLMAnalyzer, extract_json
+
+
+def make_session(body: dict, delay: float = 0.0):
+    """Build a fake aiohttp session whose post() returns the given Ollama body"""
+    async def json_body(content_type=None):
+        await asyncio.sleep(delay)
+        return body
+
+    response = MagicMock()
+    response.raise_for_status = MagicMock()
+    response.json = json_body
+
+    session = MagicMock()
+    session.closed = False
+    session.post.return_value.__aenter__.return_value = response
+    session.close = AsyncMock()
+    return session
+
+
+@pytest.fixture
+def analyzer():
+    """Create analyzer pointing at a fake Ollama (whole-body responses)"""
+    return LLMAnalyzer("http://ollama:11434", stream=False)
+
+
+def make_stream_session(tokens, done=True):
+    """Build a fake aiohttp session streaming Ollama NDJSON lines"""
+    lines = [json.dumps({"response": t, "done": False}).encode() + b"\n" for t in tokens]
+    if done:
+        lines.append(json.dumps({"response": "", "done": True}).encode() + b"\n")
+    read = []
+
+    async def content():
+        for line in lines:
+            read.append(line)
+            yield line
+
+    response = MagicMock()
+    response.raise_for_status = MagicMock()
+    response.content = content()
+
+    session = MagicMock()
+    session.closed = False
+    session.post.return_value.__aenter__.return_value = response
+    session.read = read
+    return session
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyze_parses_json_response(analyzer, sample_alert_data, sample_llm_response):
+    """Test analyze returns the parsed JSON analysis"""
+    # Arrange
+    analyzer._session = make_session({"response": json.dumps(sample_llm_response)})
+
+    # Act
+    result = await analyzer.analyze(sample_alert_data["payload"])
+
+    # Assert
+    assert result == sample_llm_response
+    url = analyzer._session.post.call_args[0][0]
+    assert url == "http://ollama:11434/api/generate"
+    assert analyzer.queue_depth == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyze_invalid_json(analyzer, sample_alert_data):
+    """Test analyze keeps raw text when the model does not return JSON"""
+    # Arrange
+    analyzer._session = make_session({"response": "not json"})
+
+    # Act
+    result = await analyzer.analyze(sample_alert_data["payload"])
+
+    # Assert
+    assert result["raw_analysis"] == "not json"
+    assert "error" in result
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyze_http_error(analyzer, sample_alert_data):
+    """Test analyze reports HTTP errors instead of raising"""
+    # Arrange
+    analyzer._session = make_session({})
+    response = analyzer._session.post.return_value.__aenter__.return_value
+    response.raise_for_status.side_effect = Exception("503 Service Unavailable")
+
+    # Act
+    result = await analyzer.analyze(sample_alert_data["payload"])
+
+    # Assert
+    assert result == {"error": "503 Service Unavailable"}
+    assert analyzer.queue_depth == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyze_calls_run_concurrently(analyzer, sample_alert_data):
+    """Test two calls overlap instead of blocking the event loop"""
+    # Arrange
+    analyzer._session = make_session({"response": "{}"}, delay=0.2)
+    loop = asyncio.get_running_loop()
+
+    # Act
+    started = loop.time()
+    await asyncio.gather(
+        analyzer.analyze(sample_alert_data["payload"]),
+        analyzer.analyze(sample_alert_data["payload"])
+    )
+    elapsed = loop.time() - started
+
+    # Assert
+    assert elapsed < 0.35
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_session_is_pooled_and_closed(analyzer):
+    """Test the HTTP session is reused and closed on shutdown"""
+    # Act
+    session = analyzer._get_session()
+
+    # Assert
+    assert analyzer._get_session() is session
+    assert session.connector.limit == analyzer.settings.ollama_pool_size
+
+    await analyzer.close()
+    assert session.closed
+    assert analyzer._session is None
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyze_invalid_json_salvaged(analyzer, sample_alert_data, sample_llm_response):
+    """Test JSON wrapped in prose is recovered instead of failing the analysis"""
+    # Arrange
+    text = f"Sure! Here is the analysis:\n```json\n{json.dumps(sample_llm_response)}\n```\nHope it helps."
+    analyzer._session = make_session({"response": text})
+
+    # Act
+    result = await analyzer.analyze(sample_alert_data["payload"])
+
+    # Assert
+    assert result == sample_llm_response
+
+
+@pytest.mark.unit
+def test_extractor_incremental():
+    """Test the extractor completes on the closing brace, across token boundaries"""
+    # Arrange
+    extractor = JSONObjectExtractor()
+    tokens = ['Note {not json} ', '{"a": "x}', '{", "b": [1, {"c": 2}', ',]', '}', ' trailing prose']
+
+    # Act
+    results = [extractor.feed(token) for token in tokens]
+
+    # Assert
+    assert results[:4] == [None] * 4
+    assert results[4] == {"a": "x}{", "b": [1, {"c": 2}]}
+    assert extract_json("no object here") is None
+    assert extract_json('{"escaped \\" brace }": 1}') == {'escaped " brace }': 1}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyze_stream_stops_at_complete_object(sample_alert_data):
+    """Test streaming closes the request once the JSON object is complete"""
+    # Arrange
+    analyzer = LLMAnalyzer("http://ollama:11434", stream=True)
+    tokens = ['Analysis: ', '{"root_cause": ', '{"problem": "cpu"}', '}', ' Extra', ' words']
+    analyzer._session = make_stream_session(tokens)
+
+    # Act
+    result = await analyzer.analyze(sample_alert_data["payload"])
+
+    # Assert
+    assert result == {"root_cause": {"problem": "cpu"}}
+    assert len(analyzer._session.read) == 4
+    analyzer._session.post.return_value.__aenter__.return_value.close.assert_called_once()
+    assert analyzer._session.post.call_args.kwargs["json"]["stream"] is True
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyze_stream_without_json(sample_alert_data):
+    """Test a stream that never produces an object reports the raw text"""
+    # Arrange
+    analyzer = LLMAnalyzer("http://ollama:11434", stream=True)
+    analyzer._session = make_stream_session(["I cannot ", "help with that"])
+
+    # Act
+    result = await analyzer.analyze(sample_alert_data["payload"])
+
+    # Assert
+    assert result == {"raw_analysis": "I cannot help with that", "error": "Failed to parse JSON"}
@@ -0,0 +1,219 @@
+"""
+Tests for the adaptive LLM concurrency limiter
+"""
+import asyncio
+import time
+import pytest
+from app.limiter import AdaptiveLimiter, LimiterRejected
+
+
+@pytest.mark.unit
+def test_limit_grows_when_saturated_and_fast():
+    """Test fast calls made at the limit raise it additively"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=2, max_limit=4)
+
+    # Act
+    for _ in range(4):
+        limiter._update(10.0, failed=False, saturated=True)
+
+    # Assert
+    assert limiter.current_limit == 3
+
+
+@pytest.mark.unit
+def test_limit_unchanged_when_not_saturated():
+    """Test calls below the limit say nothing about more parallelism"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=2)
+
+    # Act
+    for _ in range(10):
+        limiter._update(10.0, failed=False, saturated=False)
+
+    # Assert
+    assert limiter.current_limit == 2
+
+
+@pytest.mark.unit
+def test_limit_cut_on_errors_and_latency():
+    """Test errors and latency above tolerance cut the limit multiplicatively"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=4, max_limit=4, backoff=0.5, latency_tolerance=2.0, smoothing=1.0)
+    limiter._update(10.0, failed=False, saturated=True)
+
+    # Act
+    limiter._update(10.0, failed=True, saturated=True)
+    after_error = limiter.current_limit
+    limiter._update(30.0, failed=False, saturated=True)
+
+    # Assert
+    assert after_error == 2
+    assert limiter.current_limit == 1
+    assert limiter.stats()["errors"] == 1
+
+
+@pytest.mark.unit
+def test_limit_stays_within_bounds():
+    """Test the limit never leaves [min_limit, max_limit]"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=10, min_limit=2, max_limit=3)
+
+    # Act
+    initial = limiter.current_limit
+    for _ in range(20):
+        limiter._update(1.0, failed=True, saturated=True)
+    lowest = limiter.current_limit
+    for _ in range(100):
+        limiter._update(1.0, failed=False, saturated=True)
+
+    # Assert
+    assert (initial, lowest, limiter.current_limit) == (3, 2, 3)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_waiters_admitted_when_slot_frees():
+    """Test calls beyond the limit wait, and cancelled calls do not move it"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    release = asyncio.Event()
+    order = []
+
+    async def call(name):
+        async with limiter.acquire():
+            order.append(name)
+            await release.wait()
+
+    # Act
+    first = asyncio.create_task(call("first"))
+    second = asyncio.create_task(call("second"))
+    await asyncio.sleep(0.01)
+    waiting = list(order)
+    release.set()
+    await asyncio.gather(first, second)
+
+    cancelled = asyncio.create_task(call("cancelled"))
+    release.clear()
+    await asyncio.sleep(0.01)
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+    # Assert
+    assert waiting == ["first"]
+    assert order[:2] == ["first", "second"]
+    assert limiter.in_flight == 0
+    assert limiter.stats()["calls"] == 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_waiters_admitted_by_priority():
+    """Test a freed slot goes to the best priority, then the oldest waiter"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    release = asyncio.Event()
+    order = []
+
+    async def call(name, priority):
+        async with limiter.acquire(priority):
+            order.append(name)
+            await release.wait()
+
+    # Act
+    tasks = [asyncio.create_task(call("running", 0))]
+    await asyncio.sleep(0)
+    for name, priority in [("low", 5), ("high-old", 1), ("high-new", 1)]:
+        tasks.append(asyncio.create_task(call(name, priority)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*tasks)
+
+    # Assert
+    assert order == ["running", "high-old", "high-new", "low"]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_waiter_rejected_at_deadline():
+    """Test a waiter not admitted by its deadline is rejected and leaves the queue"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    held = limiter.acquire()
+    await held.__aenter__()
+
+    # Act
+    with pytest.raises(LimiterRejected) as rejected:
+        async with limiter.acquire(deadline=time.monotonic() + 0.01):
+            pass
+
+    # Assert
+    assert rejected.value.reason == "deadline"
+    assert limiter.waiting == 0
+    await held.__aexit__(None, None, None)
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_deadline_that_cannot_be_met_rejected_at_once():
+    """Test the expected wait behind slow calls rejects without queueing"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    limiter._update(60.0, failed=False, saturated=False)
+    held = limiter.acquire()
+    await held.__aenter__()
+
+    # Act
+    with pytest.raises(LimiterRejected):
+        await limiter.acquire(deadline=time.monotonic() + 30).__aenter__()
+
+    # Assert
+    assert limiter.expected_wait() == 60.0
+    assert limiter.waiting == 0
+    assert limiter.stats()["rejected"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_full_queue_sheds_worst_priority():
+    """Test an overflowing queue rejects its lowest priority waiter, not the newest"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=1, max_limit=1, max_waiting=2)
+    held = limiter.acquire()
+    await held.__aenter__()
+    low = asyncio.create_task(limiter.acquire(5).__aenter__())
+    mid = asyncio.create_task(limiter.acquire(3).__aenter__())
+    await asyncio.sleep(0)
+
+    # Act
+    high = asyncio.create_task(limiter.acquire(1).__aenter__())
+    await asyncio.sleep(0)
+
+    # Assert
+    with pytest.raises(LimiterRejected) as rejected:
+        await low
+    assert rejected.value.reason == "backlog"
+    assert not mid.done() and not high.done()
+    assert limiter.waiting == 2
+    await held.__aexit__(None, None, None)
+    await high
+    assert not mid.done()
+    mid.cancel()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_passed_deadline_rejected_with_free_slot():
+    """Test a job whose deadline passed before it asked is shed even when a slot is free"""
+    # Arrange
+    limiter = AdaptiveLimiter(initial=2, max_limit=2)
+
+    # Act
+    with pytest.raises(LimiterRejected) as rejected:
+        await limiter.acquire(deadline=time.monotonic() - 1).__aenter__()
+
+    # Assert
+    assert rejected.value.reason == "deadline"
+    assert limiter.in_flight == 0
@@ -0,0 +1,167 @@
+"""
+Tests for the LLM analysis cache
+"""
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.services.hybrid_analyzer import LLMAnalyzer
+from app.services.llm_cache import LLMResultCache, prompt_fingerprint
+
+
+def disk_alert(host, usage, severity="warning"):
+    return {
+        "labels": {"alertname": "DiskSpaceWarning", "instance": host, "severity": severity},
+        "annotations": {"description": f"Disk usage on {host}.prod.example.com is {usage}%"}
+    }
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+@pytest.mark.unit
+def test_fingerprint_masks_volatile_inputs():
+    """Test hosts and numbers do not change the fingerprint, reason and severity do"""
+    # Arrange
+    hint = "Focus on DISK/FILESYSTEM operations."
+
+    # Act
+    first = prompt_fingerprint(disk_alert("db-1", 91.5), "first_occurrence", hint)
+
+    # Assert
+    assert prompt_fingerprint(disk_alert("db-2", 88), "first_occurrence", hint) == first
+    assert prompt_fingerprint(disk_alert("db-1", 91.5), "escalation", hint) != first
+    assert prompt_fingerprint(disk_alert("db-1", 91.5, "critical"), "first_occurrence", hint) != first
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_memory_hit_counts_saved_seconds():
+    """Test a repeated request is served from memory with the seconds it saved"""
+    # Arrange
+    cache = LLMResultCache()
+
+    async def generate():
+        await asyncio.sleep(0.05)
+        return {"root_cause": {"problem": "disk full"}}
+
+    # Act
+    first = await cache.get_or_generate("k", generate)
+    first["root_cause"]["problem"] = "changed by caller"
+    second = await cache.get_or_generate("k", AsyncMock())
+
+    # Assert
+    assert second == {"root_cause": {"problem": "disk full"}}
+    stats = cache.stats()
+    assert (stats["miss"], stats["memory"]) == (1, 1)
+    assert stats["hit_rate"] == 0.5
+    assert stats["saved_seconds"] >= 0.05
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_tier_is_shared():
+    """Test an analysis generated by one replica is served to another"""
+    # Arrange
+    redis = FakeRedis()
+    await LLMResultCache(redis=redis).get_or_generate("k", AsyncMock(return_value={"a": 1}))
+    cache = LLMResultCache(redis=redis)
+    generate = AsyncMock()
+
+    # Act
+    result = await cache.get_or_generate("k", generate)
+
+    # Assert
+    assert result == {"a": 1}
+    generate.assert_not_called()
+    assert cache.stats()["redis"] == 1
+    assert json.loads(redis.data["llm:cache:k"])["result"] == {"a": 1}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_generation():
+    """Test single flight: identical concurrent requests wait for one call"""
+    # Arrange
+    cache = LLMResultCache()
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"a": 1}
+
+    # Act
+    results = await asyncio.gather(*(cache.get_or_generate("k", generate) for _ in range(5)))
+
+    # Assert
+    assert calls == 1
+    assert results == [{"a": 1}] * 5
+    assert cache.stats()["coalesced"] == 4
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_errors_are_not_cached():
+    """Test failed generations are retried on the next request"""
+    # Arrange
+    cache = LLMResultCache()
+    generate = AsyncMock(side_effect=[{"error": "timeout"}, {"a": 1}])
+
+    # Act
+    first = await cache.get_or_generate("k", generate)
+    second = await cache.get_or_generate("k", generate)
+
+    # Assert
+    assert first == {"error": "timeout"}
+    assert second == {"a": 1}
+    assert generate.call_count == 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_cancelled_generation_lets_waiter_generate():
+    """Test a waiter carries on when the request it waited for is cancelled"""
+    # Arrange
+    cache = LLMResultCache()
+    leader = asyncio.create_task(cache.get_or_generate("k", lambda: asyncio.sleep(10)))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_generate("k", AsyncMock(return_value={"a": 1})))
+    await asyncio.sleep(0)
+
+    # Act
+    leader.cancel()
+    result = await waiter
+
+    # Assert
+    assert result == {"a": 1}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyzer_uses_cache(sample_alert_data, sample_llm_response):
+    """Test the analyzer calls Ollama once for a repeated prompt"""
+    # Arrange
+    analyzer = LLMAnalyzer("http://ollama:11434", cache=LLMResultCache(), stream=False)
+    response = MagicMock()
+    response.raise_for_status = MagicMock()
+    response.json = AsyncMock(return_value={"response": json.dumps(sample_llm_response)})
+    analyzer._session = MagicMock(closed=False)
+    analyzer._session.post.return_value.__aenter__.return_value = response
+
+    # Act
+    first = await analyzer.analyze(sample_alert_data["payload"])
+    second = await analyzer.analyze(sample_alert_data["payload"])
+
+    # Assert
+    assert first == second == sample_llm_response
+    analyzer._session.post.assert_called_once()
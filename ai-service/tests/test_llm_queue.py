@@ -0,0 +1,108 @@
+"""
+Tests for LLM job priorities and load shedding
+"""
+import time
+import pytest
+from unittest.mock import AsyncMock
+from app.services.hybrid_analyzer import LLMAnalyzer
+from app.services.llm_cache import LLMResultCache
+from app.services.llm_queue import job_deadline, job_priority, templated_analysis
+
+
+def alert(severity, instance="db-1"):
+    return {
+        "labels": {"alertname": "DiskSpaceWarning", "instance": instance, "severity": severity},
+        "annotations": {"description": f"Disk usage on {instance} is 97%"}
+    }
+
+
+@pytest.mark.unit
+def test_priority_orders_severity_then_reason():
+    """Test critical escalations come first and warning recoveries last"""
+    # Arrange
+    jobs = [
+        ("warning recovery", alert("warning"), "recovery"),
+        ("critical first", alert("critical"), "first_occurrence"),
+        ("info first", alert("info"), "first_occurrence"),
+        ("critical escalation", alert("critical"), "escalation"),
+        ("warning first", alert("warning"), "first_occurrence"),
+    ]
+
+    # Act
+    ordered = sorted(jobs, key=lambda job: job_priority(job[1], job[2]))
+
+    # Assert
+    assert [name for name, _, _ in ordered] == [
+        "critical escalation", "critical first", "warning first", "warning recovery", "info first"
+    ]
+
+
+@pytest.mark.unit
+def test_deadline_per_severity():
+    """Test deadlines follow severity, unknown severities use the warning budget"""
+    # Arrange
+    deadlines = {"critical": 600, "warning": 300, "info": 120}
+
+    # Act / Assert
+    assert job_deadline(alert("critical"), deadlines) == 600
+    assert job_deadline(alert("info"), deadlines) == 120
+    assert job_deadline(alert("page"), deadlines) == 300
+
+
+@pytest.mark.unit
+def test_templated_analysis_uses_llm_format():
+    """Test shed jobs get an analysis shaped like the LLM's, built from the alert"""
+    # Act
+    result = templated_analysis(alert("critical"), "first_occurrence", "backlog")
+    recovery = templated_analysis(alert("warning"), "recovery", "deadline")
+
+    # Assert
+    assert result["templated"] is True
+    assert result["shed_reason"] == "backlog"
+    assert "97%" in result["root_cause"]["problem"]
+    assert result["root_cause"]["servers"] == "db-1"
+    assert result["immediate_actions"][0]["critical"] is True
+    assert "recovery_status" in recovery["root_cause"]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyzer_sheds_stale_job_without_caching():
+    """Test a job that cannot get a slot in time is templated and not cached"""
+    # Arrange
+    cache = LLMResultCache()
+    analyzer = LLMAnalyzer("http://ollama:11434", cache=cache, stream=False)
+    analyzer.deadlines = {"critical": 600, "warning": 0.01, "info": 0.01}
+    analyzer._session = AsyncMock()
+    for _ in range(analyzer.limiter.current_limit):
+        await analyzer.limiter._acquire(0, None)
+
+    # Act
+    started = time.monotonic()
+    result = await analyzer.analyze(alert("warning"))
+
+    # Assert
+    assert result["templated"] is True
+    assert result["shed_reason"] == "deadline"
+    assert time.monotonic() - started < 1
+    assert cache.stats()["entries"] == 0
+    analyzer._session.post.assert_not_called()
+    assert analyzer.queue_depth == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_analyzer_deadline_counts_from_queue_time():
+    """Test the deadline runs from when the job was queued, not from analyze()"""
+    # Arrange
+    analyzer = LLMAnalyzer("http://ollama:11434", stream=False)
+    analyzer._session = AsyncMock()
+    queued_at = time.monotonic() - analyzer.deadlines["warning"] - 1
+
+    # Act
+    result = await analyzer.analyze(alert("warning"), queued_at=queued_at)
+
+    # Assert
+    assert result["templated"] is True
+    assert result["shed_reason"] == "deadline"
+    analyzer._session.post.assert_not_called()
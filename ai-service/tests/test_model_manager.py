@@ -0,0 +1,236 @@
+"""
+Tests for the shared model manager
+"""
+import os
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.model_manager import ModelManager
+from app.models.isolation_forest import IsolationForestWrapper
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """Manager with a mocked shared detector"""
+    manager = ModelManager()
+    manager.settings.model_dir = str(tmp_path)
+    manager._detector = MagicMock()
+    manager._detector.model_version = "if_v1"
+    manager._redis = AsyncMock()
+    return manager
+
+
+@pytest.fixture
+def trained_model(tmp_path):
+    model = IsolationForestWrapper(str(tmp_path / "isolation_forest-if_new.joblib"))
+    model.train(np.random.default_rng(0).normal(50, 5, size=200))
+    return model
+
+
+@pytest.fixture
+def db_conn(mock_db_pool):
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.transaction = MagicMock()
+    return conn
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_publish_activates_and_swaps(manager, trained_model, mock_db_pool, db_conn):
+    """Test publishing records the version, flips is_active and swaps the model"""
+    # Arrange
+    with patch('app.model_manager.get_db_pool', return_value=mock_db_pool):
+        # Act
+        await manager.publish(trained_model, "if_new")
+
+    # Assert
+    assert db_conn.execute.call_count == 2
+    insert_args = db_conn.execute.call_args_list[0][0]
+    assert insert_args[2] == "if_new"
+    assert insert_args[3] == trained_model.model_path
+    manager._detector.swap_model.assert_called_once_with(trained_model, "if_new")
+    manager._redis.publish.assert_called_once_with(manager.settings.model_updates_channel, "if_new")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_publish_candidate_does_not_swap(manager, trained_model, mock_db_pool, db_conn):
+    """Test a candidate is recorded without touching the active model"""
+    # Arrange
+    with patch('app.model_manager.get_db_pool', return_value=mock_db_pool):
+        # Act
+        await manager.publish(trained_model, "if_new", activate=False)
+
+    # Assert
+    db_conn.execute.assert_called_once()
+    manager._detector.swap_model.assert_not_called()
+    manager._redis.publish.assert_not_called()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_load_active_swaps_new_version(manager, trained_model, mock_db_pool, db_conn):
+    """Test another replica's version is loaded and swapped in"""
+    # Arrange
+    db_conn.fetchrow = AsyncMock(return_value={"version": "if_new", "file_path": trained_model.model_path})
+
+    with patch('app.model_manager.get_db_pool', return_value=mock_db_pool):
+        # Act
+        loaded = await manager.load_active()
+
+    # Assert
+    assert loaded is True
+    model, version = manager._detector.swap_model.call_args[0]
+    assert version == "if_new"
+    assert model.is_fitted
+    manager._detector.registry.invalidate.assert_called_once()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_load_active_same_version_is_noop(manager, mock_db_pool, db_conn):
+    """Test nothing is reloaded when the active version is already loaded"""
+    # Arrange
+    db_conn.fetchrow = AsyncMock(return_value={"version": "if_v1", "file_path": "/nonexistent"})
+
+    with patch('app.model_manager.get_db_pool', return_value=mock_db_pool):
+        # Act
+        loaded = await manager.load_active()
+
+    # Assert
+    assert loaded is False
+    manager._detector.swap_model.assert_not_called()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_load_version_missing_file(manager):
+    """Test a missing model file keeps the current model"""
+    # Act
+    loaded = await manager.load_version("if_new", "/nonexistent/model.joblib")
+
+    # Assert
+    assert loaded is False
+    manager._detector.swap_model.assert_not_called()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_retrain_publishes_new_version(manager, trained_model):
+    """Test retrain trains into a versioned file and publishes it"""
+    # Arrange
+    manager._detector.train_model = AsyncMock(return_value=trained_model)
+    manager.publish = AsyncMock()
+
+    # Act
+    version = await manager.retrain()
+
+    # Assert
+    path = manager._detector.train_model.call_args[0][0]
+    assert path == manager.path_for(version)
+    manager.publish.assert_called_once_with(trained_model, version, activate=True)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_update_publishes_and_prunes(manager, trained_model):
+    """Test an incremental update is published as a new version"""
+    # Arrange
+    manager.settings.shadow_enabled = False
+    manager._detector.update_model = AsyncMock(return_value=trained_model)
+    manager.publish = AsyncMock()
+    manager.prune_versions = AsyncMock(return_value=0)
+
+    # Act
+    version = await manager.update()
+
+    # Assert
+    assert manager._detector.update_model.call_args[0][0] == manager.path_for(version)
+    manager.publish.assert_called_once_with(trained_model, version, activate=True)
+    manager.prune_versions.assert_called_once_with(manager.settings.model_keep_versions)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_update_in_shadow_mode_is_a_candidate(manager, trained_model):
+    """Test incremental updates pass the shadow gate, one candidate at a time"""
+    # Arrange
+    manager.settings.shadow_enabled = True
+    manager._detector.shadow = MagicMock(active=False)
+    manager._detector.update_model = AsyncMock(return_value=trained_model)
+    manager.publish = AsyncMock()
+    manager.prune_versions = AsyncMock(return_value=0)
+
+    # Act
+    version = await manager.update()
+
+    # Assert
+    manager.publish.assert_called_once_with(trained_model, version, activate=False)
+    manager._detector.shadow.start.assert_called_once_with(trained_model, version)
+
+    # Act: the candidate is still being shadowed
+    manager._detector.shadow.active = True
+    skipped = await manager.update()
+
+    # Assert
+    assert skipped is None
+    assert manager._detector.update_model.call_count == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_prune_versions_removes_files(manager, trained_model, mock_db_pool, db_conn):
+    """Test pruned versions lose both the joblib file and the .npy artifact"""
+    # Arrange
+    manager._detector.shadow.version = "if_candidate"
+    db_conn.fetch = AsyncMock(return_value=[{"file_path": trained_model.model_path}])
+
+    with patch('app.model_manager.get_db_pool', return_value=mock_db_pool):
+        # Act
+        removed = await manager.prune_versions(24)
+
+    # Assert
+    assert removed == 1
+    # The shadowed candidate is never pruned
+    assert db_conn.fetch.call_args[0][1:] == (manager.MODEL_TYPE, 24, "if_candidate")
+    assert not os.path.exists(trained_model.model_path)
+    assert not os.path.exists(trained_model.artifact_path)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_listener_resubscribes_after_connection_loss(manager):
+    """Test a dropped subscription is re-established and missed versions are caught up"""
+    # Arrange
+    import asyncio
+    manager.LISTEN_RETRY_MIN = 0
+    manager.load_active = AsyncMock(return_value=True)
+    announced = asyncio.Event()
+
+    async def dropped():
+        raise ConnectionError("Connection closed by server")
+        yield
+
+    async def reconnected():
+        yield {"type": "subscribe", "data": 1}
+        yield {"type": "message", "data": "if_v2"}
+        announced.set()
+        await asyncio.Event().wait()
+
+    first = MagicMock(subscribe=AsyncMock(), aclose=AsyncMock(), listen=dropped)
+    second = MagicMock(subscribe=AsyncMock(), aclose=AsyncMock(), listen=reconnected)
+    manager._redis = MagicMock(pubsub=MagicMock(side_effect=[first, second]))
+
+    # Act
+    task = asyncio.create_task(manager._listen())
+    await asyncio.wait_for(announced.wait(), timeout=1)
+    running = not task.done()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    # Assert
+    assert running
+    first.aclose.assert_called_once()
+    second.subscribe.assert_called_once_with(manager.settings.model_updates_channel)
+    # Once to catch up after resubscribing, once for the announcement
+    assert manager.load_active.call_count == 2
@@ -0,0 +1,133 @@
+"""
+Tests for consumer worker lanes
+"""
+import pytest
+import asyncio
+from app.pipeline import WorkerLane
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_lane_processes_items():
+    """Test lane runs the handler for every submitted item"""
+    # Arrange
+    seen = []
+
+    async def handler(item):
+        seen.append(item)
+
+    lane = WorkerLane("test", handler, workers=2, max_in_flight=4)
+    lane.start()
+
+    # Act
+    for i in range(10):
+        await lane.submit(i)
+    await lane.stop(drain=True)
+
+    # Assert
+    assert sorted(seen) == list(range(10))
+    assert lane.stats()["processed"] == 10
+    assert lane.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_lane_submit_applies_backpressure():
+    """Test submit waits once the in-flight cap is reached"""
+    # Arrange
+    release = asyncio.Event()
+
+    async def handler(item):
+        await release.wait()
+
+    lane = WorkerLane("slow", handler, workers=1, max_in_flight=2)
+    lane.start()
+    await lane.submit(1)
+    await lane.submit(2)
+
+    # Act
+    blocked = asyncio.create_task(lane.submit(3))
+    await asyncio.sleep(0.05)
+
+    # Assert
+    assert not blocked.done()
+    assert lane.in_flight == 2
+
+    release.set()
+    await asyncio.wait_for(blocked, timeout=1)
+    await lane.stop(drain=True)
+    assert lane.processed == 3
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_fast_lane_not_blocked_by_slow_lane():
+    """Test a busy slow lane does not delay the fast lane"""
+    # Arrange
+    fast_done = asyncio.Event()
+
+    async def slow_handler(item):
+        await asyncio.sleep(10)
+
+    async def fast_handler(item):
+        fast_done.set()
+
+    slow = WorkerLane("alerts", slow_handler, workers=1, max_in_flight=5)
+    fast = WorkerLane("metrics", fast_handler, workers=1, max_in_flight=5)
+    slow.start()
+    fast.start()
+
+    # Act
+    await slow.submit("alert")
+    await fast.submit("metric")
+
+    # Assert
+    await asyncio.wait_for(fast_done.wait(), timeout=1)
+    await fast.stop(drain=True)
+    await slow.stop(drain=False)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_lane_counts_handler_errors():
+    """Test handler exceptions are counted and do not kill workers"""
+    # Arrange
+    async def handler(item):
+        if item == "bad":
+            raise ValueError("bad item")
+
+    lane = WorkerLane("test", handler, workers=1, max_in_flight=2)
+    lane.start()
+
+    # Act
+    await lane.submit("bad")
+    await lane.submit("good")
+    await lane.stop(drain=True)
+
+    # Assert
+    assert lane.failed == 1
+    assert lane.processed == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_prioritized_lane_handles_lowest_priority_first():
+    """Test a prioritized lane drains its queue by priority, then submission order"""
+    # Arrange
+    seen = []
+
+    async def handler(item):
+        seen.append(item)
+
+    lane = WorkerLane("alerts", handler, workers=1, max_in_flight=10, prioritized=True)
+    for item, priority in [("info", (0, 1)), ("warning", (-1, 1)), ("critical", (-2, 2)),
+                           ("escalation", (-2, 0)), ("warning-2", (-1, 1))]:
+        await lane.submit(item, priority=priority)
+
+    # Act
+    lane.start()
+    await lane.stop(drain=True)
+
+    # Assert
+    assert seen == ["escalation", "critical", "warning", "warning-2", "info"]
+    assert lane.stats()["in_flight"] == 0
@@ -143,7 +143,73 @@ async def test_redis_consumer_process_metric(sample_metric_data, mock_db_pool):
 
         # Assert
         mock_detector.detect.assert_called_once()
-        mock_conn.execute.assert_called_once()
+        mock_conn.execute.assert_not_called()
+        assert consumer.writer.stats()["buffered"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_consumer_process_metric_batch(mock_db_pool, mock_redis_client):
+    """Test consumer scores a metric batch once and ACKs after its anomalies are copied"""
+    # Arrange
+    consumer = RedisConsumer()
+    consumer.client.redis = mock_redis_client
+
+    mock_detector = MagicMock()
+    mock_detector.detect_batch = AsyncMock(return_value=[
+        {"is_anomaly": False, "anomaly_score": -0.1, "model_version": "if_v1"},
+        {"is_anomaly": True, "anomaly_score": -0.8, "model_version": "if_v1"},
+        {"is_anomaly": True, "anomaly_score": -0.7, "model_version": "if_v1"},
+    ])
+
+    entries = [
+        (f"1234-{i}", {"type": "metric", "data": json.dumps({"metric_name": "cpu_usage", "metric_value": v})})
+        for i, v in enumerate([50.0, 95.0, 99.0])
+    ]
+
+    with patch('app.services.analysis_writer.get_db_pool', return_value=mock_db_pool):
+        mock_conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+        mock_conn.copy_records_to_table = AsyncMock()
+
+        # Act
+        await consumer._process_metric_batch(entries, mock_detector)
+        acked_before_flush = mock_redis_client.xack.called
+        await consumer.writer.flush()
+
+        # Assert
+        mock_detector.detect_batch.assert_called_once()
+        assert len(mock_detector.detect_batch.call_args[0][0]) == 3
+        assert acked_before_flush is False
+        mock_conn.copy_records_to_table.assert_called_once()
+        records = mock_conn.copy_records_to_table.call_args.kwargs["records"]
+        assert len(records) == 2
+        assert [float(r[6]) for r in records] == [0.8, 0.7]
+        mock_redis_client.xack.assert_called_once_with(
+            consumer.settings.redis_stream,
+            consumer.settings.redis_group,
+            "1234-0", "1234-1", "1234-2"
+        )
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_consumer_process_metric_batch_acks_on_error(mock_redis_client):
+    """Test consumer acknowledges the whole batch even if detection fails"""
+    # Arrange
+    consumer = RedisConsumer()
+    consumer.client.redis = mock_redis_client
+
+    mock_detector = MagicMock()
+    mock_detector.detect_batch = AsyncMock(side_effect=Exception("boom"))
+
+    # Act
+    await consumer._process_metric_batch(
+        [("1234-0", {"type": "metric", "data": "{}"})],
+        mock_detector
+    )
+
+    # Assert
+    mock_redis_client.xack.assert_called_once()
 
 
 @pytest.mark.unit
@@ -175,7 +241,240 @@ async def test_redis_consumer_process_alert(sample_alert_data, sample_llm_respon
 
         # Assert
         mock_llm.analyze.assert_called_once()
-        mock_conn.execute.assert_called_once()
+        # Only alert_state is written inline; the analysis row is buffered
+        statements = [c.args[0] for c in mock_conn.execute.call_args_list]
+        assert len(statements) == 2
+        assert all("alert_state" in sql for sql in statements)
+        assert consumer.writer.stats()["buffered"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_consumer_dispatch_alert_batch(sample_llm_response, mock_db_pool):
+    """Test a burst of alerts is deduplicated together before the alert lane"""
+    # Arrange
+    consumer = RedisConsumer()
+    consumer.alert_lane = MagicMock(submit=AsyncMock())
+    consumer.deduplicator.mark_duplicates = AsyncMock()
+
+    def entry(message_id, alert_id, severity):
+        payload = {"labels": {"alertname": "HighCPU", "instance": "server-1", "severity": severity}}
+        return (message_id, {"type": "alert", "data": json.dumps({"alert_id": alert_id, "payload": payload})})
+
+    entries = [entry("1-0", "a1", "warning"), entry("2-0", "a2", "warning"), entry("3-0", "a3", "critical")]
+    state = {"alert_id": "a0", "analysis_id": "r0", "severity": "critical"}
+    consumer.deduplicator.should_analyze_batch = AsyncMock(return_value=[
+        (True, "recovery", None),
+        (False, "duplicate_same_severity", 0),
+        (False, "duplicate_same_severity", state),
+    ])
+
+    # Act
+    with patch('app.redis_client.get_db_pool', return_value=mock_db_pool):
+        await consumer._dispatch_alerts(entries)
+
+    # Assert
+    consumer.deduplicator.should_analyze_batch.assert_called_once()
+    duplicates = consumer.deduplicator.mark_duplicates.call_args.args[1]
+    assert duplicates == [("a3", "a0", "r0", "duplicate_same_severity")]
+    firing = consumer.deduplicator.mark_duplicates.call_args.kwargs["firing"]
+    assert [f[2] for f in firing] == ["a1", "a2", "a3"]
+    assert consumer.writer.stats()["pending_acks"] == 1
+    consumer.alert_lane.submit.assert_called_once()
+    message_id, _, _, (reason, followers) = consumer.alert_lane.submit.call_args.args[0]
+    assert (message_id, reason) == ("1-0", "recovery")
+    assert consumer.alert_lane.submit.call_args.kwargs["priority"] == (-2, 2)
+    assert [f[:3] for f in followers] == [("2-0", "a2", "duplicate_same_severity")]
+
+    # Act: the analyzed alert marks its follower and ACKs both messages
+    mock_llm = MagicMock(analyze=AsyncMock(return_value=sample_llm_response))
+    consumer.deduplicator.record_analysis = AsyncMock()
+    consumer.deduplicator.resolve_firing = AsyncMock(return_value=0)
+    with patch('app.redis_client.get_db_pool', return_value=mock_db_pool):
+        await consumer._handle_entry(consumer.alert_lane.submit.call_args.args[0], MagicMock(), mock_llm)
+
+    # Assert
+    analysis_id = consumer.writer._rows[0][0]
+    consumer.deduplicator.mark_duplicates.assert_called_with(
+        mock_db_pool, [("a2", "a1", analysis_id, "duplicate_same_severity")], adopted=[]
+    )
+    assert consumer.writer._message_ids == ["3-0", "1-0", "2-0"]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_consumer_repeat_alert_follows_analysis_in_progress(sample_llm_response, mock_db_pool):
+    """Test a repeat firing read while its pair is still being analyzed is not analyzed again"""
+    # Arrange
+    consumer = RedisConsumer()
+    consumer.alert_lane = MagicMock(submit=AsyncMock())
+    consumer.deduplicator.similarity = None
+    consumer.deduplicator.last_analyses = AsyncMock(return_value={})
+    consumer.deduplicator.mark_duplicates = AsyncMock()
+    consumer.deduplicator.record_analysis = AsyncMock()
+
+    def entry(message_id, alert_id, severity="warning"):
+        payload = {"labels": {"alertname": "HighCPU", "instance": "server-1", "severity": severity}}
+        return (message_id, {"type": "alert", "data": json.dumps({"alert_id": alert_id, "payload": payload})})
+
+    with patch('app.redis_client.get_db_pool', return_value=mock_db_pool):
+        await consumer._dispatch_alerts([entry("1-0", "a1")])
+        queued = consumer.alert_lane.submit.call_args.args[0]
+
+        # Act: the same alert fires again in a later read
+        await consumer._dispatch_alerts([entry("2-0", "a2")])
+
+        # Assert
+        consumer.alert_lane.submit.assert_called_once()
+        assert [f[:3] for f in queued[3][1]] == [("2-0", "a2", "duplicate_same_severity")]
+
+        # Act: the analysis completes
+        mock_llm = MagicMock(analyze=AsyncMock(return_value=sample_llm_response))
+        await consumer._handle_entry(queued, MagicMock(), mock_llm)
+
+    # Assert
+    mock_llm.analyze.assert_called_once()
+    analysis_id = consumer.writer._rows[0][0]
+    consumer.deduplicator.mark_duplicates.assert_called_with(
+        mock_db_pool, [("a2", "a1", analysis_id, "duplicate_same_severity")], adopted=[]
+    )
+    assert consumer.writer._message_ids == ["1-0", "2-0"]
+    assert consumer.pending_analyses == {}
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_consumer_defers_alerts_when_lane_full(mock_redis_client):
+    """Test overflow alerts stay pending instead of blocking the reader, and are claimed back later"""
+    # Arrange
+    consumer = RedisConsumer()
+    consumer.client.redis = mock_redis_client
+    consumer.alert_lane = MagicMock(submit=AsyncMock(), free_slots=MagicMock(return_value=1))
+    consumer._dispatch_alerts = AsyncMock()
+
+    def entry(message_id):
+        return (message_id, {"type": "alert", "data": json.dumps({"alert_id": message_id, "payload": {}})})
+
+    # Act: one free slot for three alerts
+    await consumer._submit_alerts([entry("1-0"), entry("2-0"), entry("3-0")])
+
+    # Assert
+    assert [e[0] for e in consumer._dispatch_alerts.call_args.args[0]] == ["1-0"]
+    assert list(consumer.deferred_alerts) == ["2-0", "3-0"]
+    mock_redis_client.xack.assert_not_called()
+
+    # Act: the lane has room again, deferred alerts go first
+    consumer.alert_lane.free_slots.return_value = 2
+    mock_redis_client.xclaim = AsyncMock(return_value=[entry("2-0"), entry("3-0")])
+    await consumer._submit_alerts([entry("4-0")])
+
+    # Assert
+    assert mock_redis_client.xclaim.call_args.kwargs["message_ids"] == ["2-0", "3-0"]
+    assert [e[0] for e in consumer._dispatch_alerts.call_args.args[0]] == ["2-0", "3-0"]
+    assert list(consumer.deferred_alerts) == ["4-0"]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_stuck_message_cleanup_skips_held_messages(mock_redis_client):
+    """Test messages the consumer still holds are never ACKed as stuck, however long they take"""
+    # Arrange
+    consumer = RedisConsumer()
+    consumer.client.redis = mock_redis_client
+    consumer.held_messages.update({"1-0", "2-0"})
+    mock_redis_client.xpending = AsyncMock(return_value=[3])
+    mock_redis_client.xpending_range = AsyncMock(return_value=[
+        {"message_id": message_id, "time_since_delivered": 900000} for message_id in ("1-0", "2-0", "3-0")
+    ])
+
+    # Act
+    await consumer._ack("1-0")
+    cleaned = await consumer.client.cleanup_old_pending(keep=consumer.held_messages)
+
+    # Assert
+    assert consumer.held_messages == {"2-0"}
+    assert cleaned == 2
+    acked = [call.args[2:] for call in mock_redis_client.xack.call_args_list]
+    assert acked == [("1-0",), ("1-0",), ("3-0",)]
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_consumer_templated_analysis_not_recorded(sample_alert_data, mock_db_pool):
+    """Test a shed (templated) analysis is stored but never becomes the alert's last analysis"""
+    # Arrange
+    consumer = RedisConsumer()
+    consumer.deduplicator.record_analysis = AsyncMock()
+    consumer.deduplicator.remember_analysis = AsyncMock()
+    consumer.deduplicator.mark_duplicates = AsyncMock()
+    templated = {"root_cause": {}, "templated": True, "shed_reason": "deadline"}
+    mock_llm = MagicMock(analyze=AsyncMock(return_value=templated))
+    follower = ("2-0", "a2", "near_duplicate", sample_alert_data["payload"])
+
+    # Act
+    await consumer._process_alert(
+        sample_alert_data, mock_llm, mock_db_pool, ("first_occurrence", [follower]), queued_at=1.0
+    )
+
+    # Assert
+    assert mock_llm.analyze.call_args.kwargs["queued_at"] == 1.0
+    assert consumer.writer.stats()["buffered"] == 1
+    consumer.deduplicator.record_analysis.assert_not_called()
+    consumer.deduplicator.remember_analysis.assert_not_called()
+    assert consumer.deduplicator.mark_duplicates.call_args.kwargs["adopted"] == []
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_alert_lane_lets_limiter_reach_max_concurrency(sample_llm_response, mock_db_pool):
+    """Test the real alert lane feeds enough alerts for the LLM limiter to reach its max"""
+    # Arrange
+    import asyncio
+    import time
+    from app.services.hybrid_analyzer import LLMAnalyzer
+    consumer = RedisConsumer()
+    consumer.deduplicator.record_analysis = AsyncMock()
+    max_limit = consumer.settings.llm_concurrency_max
+    analyzer = LLMAnalyzer("http://ollama:11434", max_concurrent=max_limit, stream=False)
+    release = asyncio.Event()
+
+    class Response:
+        async def __aenter__(self):
+            await release.wait()
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            pass
+
+        async def json(self, content_type=None):
+            return {"response": json.dumps(sample_llm_response)}
+
+    analyzer._session = MagicMock(closed=False, post=MagicMock(side_effect=lambda *a, **k: Response()))
+
+    def entry(i):
+        payload = {"labels": {"alertname": f"Alert{i}", "instance": "server-1", "severity": "warning"}}
+        data = {"type": "alert", "data": json.dumps({"alert_id": f"a{i}", "payload": payload})}
+        return (f"{i}-0", data, time.monotonic(), ("first_occurrence", []))
+
+    # Act
+    with patch('app.redis_client.get_db_pool', return_value=mock_db_pool):
+        consumer._start_lanes(MagicMock(), analyzer)
+        for i in range(max_limit + 2):
+            await consumer.alert_lane.submit(entry(i))
+        for _ in range(100):
+            if analyzer.limiter.in_flight == max_limit:
+                break
+            await asyncio.sleep(0.01)
+        peak = analyzer.limiter.in_flight
+        release.set()
+        await consumer.alert_lane.stop(timeout=5)
+        await consumer.metric_lane.stop(timeout=5)
+
+    # Assert
+    assert consumer.alert_lane.workers >= max_limit + consumer.settings.llm_queue_max_waiting
+    assert peak == max_limit > consumer.settings.alert_lane_workers
+    assert consumer.writer.stats()["buffered"] == max_limit + 2
 
 
 @pytest.mark.unit
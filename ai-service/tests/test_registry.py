@@ -0,0 +1,106 @@
+"""
+Tests for the per-series model registry
+"""
+import os
+import pytest
+import numpy as np
+from app.models.isolation_forest import IsolationForestWrapper
+from app.models.registry import ModelRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    """Registry with room for roughly two models"""
+    return ModelRegistry(str(tmp_path / "series"), max_bytes=10 * 1024 * 1024)
+
+
+def train(registry, key, loc=50.0):
+    data = np.random.default_rng(0).normal(loc, 5, size=200)
+    os.makedirs(registry.model_dir, exist_ok=True)
+    model = IsolationForestWrapper(registry.path_for(key))
+    model.train(data)
+    registry.put(key, model)
+    return model
+
+
+@pytest.mark.unit
+def test_series_key_with_label_subset(tmp_path):
+    """Test series keys include only the configured labels, sorted"""
+    # Arrange
+    registry = ModelRegistry(str(tmp_path), 1024, ["instance", "", "job"])
+
+    # Act & Assert
+    assert registry.series_key("cpu", {"job": "node", "instance": "a", "env": "x"}) == "cpu{instance=a,job=node}"
+    assert registry.series_key("cpu", {}) == "cpu"
+    assert registry.series_key(None, {"job": "node"}) is None
+
+
+@pytest.mark.unit
+def test_get_unknown_series_returns_none(registry):
+    """Test series without a trained model fall through (and are remembered)"""
+    # Act
+    assert registry.get("unknown_metric") is None
+    assert registry.get("unknown_metric") is None
+
+    # Assert
+    stats = registry.stats()
+    assert stats["misses"] == 2
+    assert stats["loads"] == 0
+
+
+@pytest.mark.unit
+def test_lazy_load_from_disk(registry, tmp_path):
+    """Test a model trained by one registry is loaded lazily by another"""
+    # Arrange
+    train(registry, "cpu_usage")
+    other = ModelRegistry(registry.model_dir, max_bytes=registry.max_bytes)
+
+    # Act
+    model = other.get("cpu_usage")
+    again = other.get("cpu_usage")
+
+    # Assert
+    assert model is not None and model.is_fitted
+    assert again is model
+    stats = other.stats()
+    assert stats["loads"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+@pytest.mark.unit
+def test_lru_eviction_by_memory(tmp_path):
+    """Test least recently used series are evicted past the memory budget"""
+    # Arrange
+    registry = ModelRegistry(str(tmp_path / "series"), max_bytes=1)
+    first = train(registry, "cpu_usage")
+    registry.max_bytes = int(first.estimate_nbytes() * 2.5)
+
+    # Act
+    train(registry, "memory_usage", loc=1e9)
+    registry.get("cpu_usage")  # touch, so memory_usage becomes LRU
+    train(registry, "disk_usage", loc=80)
+
+    # Assert
+    stats = registry.stats()
+    assert stats["resident_models"] == 2
+    assert stats["evictions"] >= 1
+    assert stats["resident_bytes"] <= registry.max_bytes
+    assert "memory_usage" not in registry._cache
+
+    # Evicted series reload lazily from disk
+    assert registry.get("memory_usage") is not None
+    assert registry.stats()["loads"] == 1
+
+
+@pytest.mark.unit
+def test_put_clears_missing_marker(registry):
+    """Test a series trained after a miss becomes visible immediately"""
+    # Arrange
+    assert registry.get("cpu_usage") is None
+
+    # Act
+    model = train(registry, "cpu_usage")
+
+    # Assert
+    assert registry.get("cpu_usage") is model
@@ -0,0 +1,142 @@
+"""
+Tests for the offline replay engine
+"""
+import json
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.models.isolation_forest import IsolationForestWrapper
+from app.replay import ReplayEngine, _file_chunks, _metric_row, file_chunks, main
+
+
+@pytest.fixture
+def export(tmp_path):
+    """CSV export of two metrics with one spike each"""
+    rng = np.random.default_rng(0)
+    lines = ["id,metric_name,metric_value,labels,timestamp"]
+    for i in range(500):
+        cpu = 500.0 if i == 300 else rng.normal(50, 2)
+        mem = 900.0 if i == 400 else rng.normal(60, 2)
+        lines.append(f'{2 * i + 1},cpu_usage,{cpu},"{{""host"": ""a""}}",{1.7e9 + i * 15}')
+        lines.append(f"{2 * i + 2},memory_usage,{mem},,2023-11-14T22:13:20Z")
+    path = tmp_path / "export.csv"
+    path.write_text("\n".join(lines))
+    return str(path)
+
+
+@pytest.fixture
+def detector(tmp_path):
+    from app.detector import AnomalyDetector
+    with patch('app.detector.IsolationForestWrapper'):
+        detector = AnomalyDetector()
+    detector.model = IsolationForestWrapper(str(tmp_path / "model.joblib"))
+    detector.model.train(np.random.default_rng(1).normal(55, 5, size=2000))
+    detector.registry.get = MagicMock(return_value=None)
+    return detector
+
+
+@pytest.mark.unit
+def test_metric_row_normalizes_sources():
+    """Test labels and timestamps from DB rows and exports become detector input"""
+    # Act
+    from_csv = _metric_row({"metric_name": "cpu", "metric_value": 1.0, "labels": '{"host": "a"}', "timestamp": 5.0})
+    missing = _metric_row({"metric_name": "cpu", "metric_value": 1.0, "labels": float('nan')})
+
+    # Assert
+    assert from_csv["labels"] == {"host": "a"}
+    assert from_csv["timestamp"] == 5.0
+    assert missing["labels"] == {}
+
+
+@pytest.mark.unit
+def test_file_chunks_reads_csv_in_chunks(export):
+    """Test a CSV export is read in chunks with its ids"""
+    # Act
+    chunks = list(file_chunks(export, 300))
+
+    # Assert
+    assert [len(metrics) for _, metrics in chunks] == [300, 300, 300, 100]
+    ids, metrics = chunks[0]
+    assert ids[:2] == [1, 2]
+    assert metrics[0]["labels"] == {"host": "a"}
+    assert metrics[1]["labels"] == {}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_replay_reports_per_metric(export, detector):
+    """Test every row is scored and counted under its metric_name"""
+    # Arrange
+    engine = ReplayEngine(detector)
+
+    # Act
+    report = (await engine.run(_file_chunks(export, 128))).as_dict()
+
+    # Assert
+    assert report["rows"] == 1000
+    assert report["chunks"] == 8
+    assert report["throughput"] > 0
+    assert report["metrics"]["cpu_usage"]["points"] == 500
+    assert report["metrics"]["memory_usage"]["anomalies"] >= 1
+    assert report["anomalies"] == sum(m["anomalies"] for m in report["metrics"].values())
+    assert report["written"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_replay_writes_verdicts_in_bulk(export, detector, mock_db_pool):
+    """Test write-back issues one UPDATE per chunk with arrays of ids and verdicts"""
+    # Arrange
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.execute = AsyncMock(return_value="UPDATE 3")
+    engine = ReplayEngine(detector, write_back=True)
+
+    with patch('app.replay.get_db_pool', return_value=mock_db_pool):
+        # Act
+        report = await engine.run(_file_chunks(export, 250))
+
+    # Assert
+    assert conn.execute.call_count == 4
+    query, ids, verdicts, versions = conn.execute.call_args_list[0][0]
+    assert "unnest($1::int[], $2::boolean[], $3::varchar[])" in query
+    assert "SET model_anomaly" in query and "is_anomaly =" not in query
+    assert ids == list(range(1, 251))
+    assert all(isinstance(v, bool) for v in verdicts)
+    assert set(versions) == {detector.model_version}
+    assert report.written == 12
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_replay_surfaces_source_errors(detector):
+    """Test a failing source fails the replay instead of truncating it"""
+    # Arrange
+    async def broken():
+        yield None, [{"metric_name": "cpu", "metric_value": 1.0}]
+        raise ConnectionError("lost connection")
+
+    # Act / Assert
+    with pytest.raises(ConnectionError):
+        await ReplayEngine(detector).run(broken())
+
+
+@pytest.mark.unit
+def test_cli_prints_json_report(export, detector, tmp_path, capsys):
+    """Test the CLI replays an export with a given model file"""
+    # Arrange
+    model = IsolationForestWrapper(str(tmp_path / "cli.joblib"))
+    model.train(np.random.default_rng(1).normal(55, 5, size=2000))
+    manager = MagicMock(detector=detector)
+
+    with patch('app.model_manager.model_manager', manager):
+        # Act
+        code = main([export, "--model", model.model_path, "--chunk-size", "200", "--json"])
+
+    # Assert
+    out = capsys.readouterr().out
+    report = json.loads(out[out.index("{"):])
+    assert code == 0
+    assert report["rows"] == 1000
+    assert report["chunks"] == 5
+    assert detector.model_version == model.model_path
+    manager.load_active.assert_not_called()
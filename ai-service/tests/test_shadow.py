@@ -0,0 +1,223 @@
+"""
+Tests for shadow scoring of candidate models
+"""
+import time
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.model_manager import ModelManager
+from app.models.isolation_forest import IsolationForestWrapper
+from app.models.shadow import PENDING, PROMOTE, REJECT, ShadowScorer
+
+
+def trained(tmp_path, name, data):
+    model = IsolationForestWrapper(str(tmp_path / f"{name}.joblib"))
+    model.train(data)
+    return model
+
+
+def drain(shadow: ShadowScorer):
+    """Wait for queued shadow batches to be scored"""
+    shadow._executor.submit(lambda: None).result(timeout=10)
+
+
+def feed(shadow: ShadowScorer, active: IsolationForestWrapper, batches: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    for _ in range(batches):
+        X = rng.normal(50, 5, size=(200, 1))
+        start = time.perf_counter()
+        scores, predictions = active.score_and_predict(X)
+        shadow.observe(X, scores, predictions, time.perf_counter() - start)
+        drain(shadow)
+
+
+@pytest.mark.unit
+def test_similar_candidate_is_promoted(tmp_path):
+    """Test a candidate trained on the same distribution passes both bounds"""
+    # Arrange
+    rng = np.random.default_rng(0)
+    active = trained(tmp_path, "active", rng.normal(50, 5, size=2000))
+    candidate = trained(tmp_path, "candidate", rng.normal(50, 5, size=2000))
+    shadow = ShadowScorer(sample_rate=1.0, min_points=2000, min_agreement=0.9, max_latency_ratio=10.0)
+    shadow.start(candidate, "if_new")
+
+    # Act
+    feed(shadow, active, 5)
+    pending = shadow.verdict()
+    feed(shadow, active, 10)
+
+    # Assert
+    assert pending == PENDING
+    assert shadow.verdict() == PROMOTE
+    stats = shadow.stop()
+    assert stats["points"] == 3000
+    assert stats["agreement"] >= 0.9
+    assert stats["latency_ratio"] > 0
+
+
+@pytest.mark.unit
+def test_disagreeing_candidate_is_rejected(tmp_path):
+    """Test a candidate that flags normal traffic is not promoted"""
+    # Arrange
+    rng = np.random.default_rng(0)
+    active = trained(tmp_path, "active", rng.normal(50, 5, size=2000))
+    candidate = trained(tmp_path, "candidate", rng.normal(80, 5, size=2000))
+    shadow = ShadowScorer(sample_rate=1.0, min_points=1000, max_latency_ratio=10.0)
+    shadow.start(candidate, "if_new")
+
+    # Act
+    feed(shadow, active, 5)
+
+    # Assert
+    assert shadow.verdict() == REJECT
+    assert shadow.stats.as_dict()["agreement"] < 0.5
+
+
+@pytest.mark.unit
+def test_slow_candidate_is_rejected(tmp_path):
+    """Test the latency bound applies even when predictions agree"""
+    # Arrange
+    rng = np.random.default_rng(0)
+    active = trained(tmp_path, "active", rng.normal(50, 5, size=2000))
+    shadow = ShadowScorer(sample_rate=1.0, min_points=200, min_agreement=0.0, max_latency_ratio=1.2)
+    shadow.start(active, "if_new")
+    X = rng.normal(50, 5, size=(200, 1))
+    scores, predictions = active.score_and_predict(X)
+
+    # Act: the active model reports being 100x faster than anything real
+    shadow.observe(X, scores, predictions, 1e-9)
+    drain(shadow)
+
+    # Assert
+    assert shadow.verdict() == REJECT
+
+
+@pytest.mark.unit
+def test_sampling_and_backpressure(tmp_path):
+    """Test unsampled batches are skipped and a full queue drops batches"""
+    # Arrange
+    model = MagicMock()
+    shadow = ShadowScorer(sample_rate=0.0)
+    shadow.start(model, "if_new")
+    X = np.zeros((10, 1))
+
+    # Act
+    shadow.observe(X, np.zeros(10), np.ones(10), 0.001)
+    shadow.sample_rate = 1.0
+    shadow._pending = shadow.max_pending
+    shadow.observe(X, np.zeros(10), np.ones(10), 0.001)
+
+    # Assert
+    model.score_and_predict.assert_not_called()
+    assert shadow.stats.dropped == 1
+
+
+@pytest.mark.unit
+def test_incompatible_candidate_is_rejected(tmp_path):
+    """Test a candidate that cannot score the live inputs is rejected"""
+    # Arrange
+    candidate = trained(tmp_path, "candidate", np.random.default_rng(0).normal(size=(500, 4)))
+    shadow = ShadowScorer(sample_rate=1.0)
+    shadow.start(candidate, "if_new")
+
+    # Act
+    shadow.observe(np.zeros((10, 2)), np.zeros(10), np.ones(10), 0.001)
+    drain(shadow)
+
+    # Assert
+    assert shadow.stats.errors == 1
+    assert shadow.verdict() == REJECT
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_detect_batch_feeds_shadow(tmp_path):
+    """Test global-model batches are offered to the shadowed candidate"""
+    # Arrange
+    from app.detector import AnomalyDetector
+    with patch('app.detector.IsolationForestWrapper'):
+        detector = AnomalyDetector()
+    rng = np.random.default_rng(0)
+    detector.model = trained(tmp_path, "active", rng.normal(50, 5, size=1000))
+    detector.registry.get = MagicMock(return_value=None)
+    detector.shadow = ShadowScorer(sample_rate=1.0)
+    detector.shadow.start(trained(tmp_path, "candidate", rng.normal(50, 5, size=1000)), "if_new")
+
+    # Act
+    await detector.detect_batch([{"metric_name": "cpu", "metric_value": v} for v in (49.0, 51.0, 500.0)])
+    drain(detector.shadow)
+
+    # Assert
+    assert detector.shadow.stats.points == 3
+    assert detector.shadow.stats.active_seconds > 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_retrain_in_shadow_mode_publishes_candidate(tmp_path):
+    """Test shadow retrains are published inactive and shadowed"""
+    # Arrange
+    manager = ModelManager()
+    manager.settings.model_dir = str(tmp_path)
+    manager._detector = MagicMock()
+    model = MagicMock()
+    manager._detector.train_model = AsyncMock(return_value=model)
+    manager.publish = AsyncMock()
+
+    # Act
+    version = await manager.retrain(shadow=True)
+
+    # Assert
+    manager.publish.assert_called_once_with(model, version, activate=False)
+    manager._detector.shadow.start.assert_called_once_with(model, version)
+    # Series models would go live at once, so a candidate is trained without them
+    assert manager._detector.train_model.call_args.kwargs["series"] is False
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.parametrize("verdict", [PROMOTE, REJECT])
+async def test_review_shadow_records_and_acts(verdict, mock_db_pool):
+    """Test the verdict is recorded and only a promotion activates the candidate"""
+    # Arrange
+    manager = ModelManager()
+    manager._detector = MagicMock()
+    manager._detector.model_version = "if_v1"
+    shadow = manager._detector.shadow
+    shadow.version = "if_new"
+    shadow.verdict.return_value = verdict
+    shadow.stop.return_value = {"points": 20000, "agreement": 0.99, "latency_ratio": 1.01}
+    manager.activate = AsyncMock(return_value=True)
+    manager._detector.train_series_models = AsyncMock()
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+
+    with patch('app.model_manager.get_db_pool', return_value=mock_db_pool):
+        # Act
+        result = await manager.review_shadow()
+
+    # Assert
+    assert result == verdict
+    args = conn.execute.call_args[0]
+    assert args[1:4] == (manager.MODEL_TYPE, "if_new", "shadow")
+    assert f'"verdict": "{verdict}"' in args[4]
+    assert (manager.activate.await_count == 1) == (verdict == PROMOTE)
+    # Series models are retrained only with a promoted candidate
+    assert (manager._detector.train_series_models.await_count == 1) == (verdict == PROMOTE)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_review_shadow_waits_for_verdict():
+    """Test nothing happens while the candidate is still pending"""
+    # Arrange
+    manager = ModelManager()
+    manager._detector = MagicMock()
+    manager._detector.shadow.version = "if_new"
+    manager._detector.shadow.verdict.return_value = PENDING
+
+    # Act
+    result = await manager.review_shadow()
+
+    # Assert
+    assert result is None
+    manager._detector.shadow.stop.assert_not_called()
@@ -0,0 +1,188 @@
+"""
+Tests for near-duplicate alert detection
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.deduplication import ResourceAwareDeduplicator
+from app.services.similarity import SimilarityIndex, normalize, shingles, similarity
+
+
+def disk_alert(host, usage, severity="warning"):
+    return {
+        "labels": {
+            "alertname": "DiskSpaceWarning",
+            "instance": f"{host}:9100",
+            "severity": severity,
+            "mountpoint": "/var/lib/postgresql"
+        },
+        "annotations": {
+            "description": f"Disk usage on {host} /var/lib/postgresql is {usage}% (threshold 85%)",
+            "summary": f"Disk space low on {host}"
+        }
+    }
+
+
+def cpu_alert(host):
+    return {
+        "labels": {"alertname": "HighCPU", "instance": host, "severity": "warning"},
+        "annotations": {"description": f"CPU usage on {host} above 90% for 5 minutes", "summary": "High CPU"}
+    }
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio for the shared index"""
+
+    def __init__(self):
+        self.strings = {}
+        self.sets = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    async def mget(self, keys):
+        return [self.strings.get(k) for k in keys]
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def smembers(self, key):
+        self.ops.append(lambda: set(self.redis.sets.get(key, ())))
+
+    def set(self, key, value, ex=None):
+        self.ops.append(lambda: self.redis.strings.__setitem__(key, value))
+
+    def sadd(self, key, member):
+        self.ops.append(lambda: self.redis.sets.setdefault(key, set()).add(member))
+
+    def expire(self, key, seconds):
+        self.ops.append(lambda: True)
+
+    async def execute(self):
+        return [op() for op in self.ops]
+
+
+@pytest.mark.unit
+def test_normalize_masks_volatile_parts():
+    """Test numbers, IPs, hostnames and ids are masked"""
+    # Act
+    text = normalize("Disk 91.5% on 10.0.3.17:9100 (db-7.prod.example.com), id 3f2a9c8e1b7d4e6f")
+
+    # Assert
+    assert text == "disk <num>% on <ip> (<host>), id <hex>"
+
+
+@pytest.mark.unit
+def test_storm_alerts_have_near_identical_signatures():
+    """Test the same alert on different hosts is similar, a different alert is not"""
+    # Arrange
+    index = SimilarityIndex()
+
+    # Act
+    first = index.signature(disk_alert("db-server-1", 91.2))
+    other_host = index.signature(disk_alert("db-server-37", 88))
+    other_alert = index.signature(cpu_alert("db-server-1"))
+
+    # Assert
+    assert "instance" not in " ".join(shingles(disk_alert("db-server-1", 91.2)))
+    assert similarity(first, other_host) >= 0.8
+    assert similarity(first, other_alert) < 0.5
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_index_find_requires_same_severity():
+    """Test lookups match similar analyses of the same severity only"""
+    # Arrange
+    index = SimilarityIndex()
+    await index.add(index.signature(disk_alert("db-server-1", 91)), {
+        "alert_id": "a1", "analysis_id": "r1", "severity": "warning"
+    })
+
+    # Act
+    match = await index.find(index.signature(disk_alert("db-server-2", 93)), "warning")
+    critical = await index.find(index.signature(disk_alert("db-server-2", 99, "critical")), "critical")
+    unrelated = await index.find(index.signature(cpu_alert("db-server-2")), "warning")
+
+    # Assert
+    assert match["analysis_id"] == "r1"
+    assert match["similarity"] >= 0.8
+    assert critical is None
+    assert unrelated is None
+    assert index.stats()["matches"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_index_shared_through_redis():
+    """Test an analysis indexed by one replica is found by another"""
+    # Arrange
+    redis = FakeRedis()
+    await SimilarityIndex(redis=redis).add(SimilarityIndex().signature(disk_alert("db-server-1", 91)), {
+        "alert_id": "a1", "analysis_id": "r1", "severity": "warning"
+    })
+    index = SimilarityIndex(redis=redis)
+
+    # Act
+    match = await index.find(index.signature(disk_alert("db-server-9", 87)), "warning")
+
+    # Assert
+    assert match["analysis_id"] == "r1"
+    assert index.stats()["entries"] == 1
+
+
+@pytest.mark.unit
+def test_index_memory_is_bounded():
+    """Test the in-process tier evicts the oldest entries and their bands"""
+    # Arrange
+    index = SimilarityIndex(max_entries=2)
+
+    # Act
+    for i in range(3):
+        index._remember(f"r{i}", index.signature(cpu_alert(f"web-{i}.example.com")), {"severity": "warning"}, 1e12)
+
+    # Assert
+    assert list(index._entries) == ["r1", "r2"]
+    assert all("r0" not in ids for ids in index._bands.values())
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_should_analyze_reuses_near_duplicate(mock_db_pool):
+    """Test a first occurrence similar to a recent analysis is not sent to the LLM"""
+    # Arrange
+    index = SimilarityIndex()
+    deduplicator = ResourceAwareDeduplicator(similarity=index)
+    await deduplicator.remember_analysis(disk_alert("db-server-1", 91), "a1", "r1")
+    deduplicator.record_analysis = AsyncMock()
+
+    # Act
+    with patch.object(deduplicator, '_find_last_analysis', AsyncMock(return_value=None)):
+        decision = await deduplicator.should_analyze(mock_db_pool, disk_alert("db-server-2", 89))
+
+    # Assert
+    assert decision == (False, "near_duplicate")
+    deduplicator.record_analysis.assert_called_once_with(
+        mock_db_pool, "DiskSpaceWarning", "db-server-2:9100", "a1", "r1", "warning"
+    )
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_batch_storm_is_analyzed_once(mock_db_pool):
+    """Test a storm across hosts sends one alert to the LLM and links the rest to it"""
+    # Arrange
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.fetch = AsyncMock(return_value=[])
+    deduplicator = ResourceAwareDeduplicator(similarity=SimilarityIndex())
+    alerts = [disk_alert(f"db-server-{i}", 85 + i) for i in range(1, 6)] + [cpu_alert("db-server-1")]
+
+    # Act
+    decisions = await deduplicator.should_analyze_batch(mock_db_pool, alerts)
+
+    # Assert
+    assert decisions[0] == (True, "first_occurrence", None)
+    assert decisions[1:5] == [(False, "near_duplicate", 0)] * 4
+    assert decisions[5] == (True, "first_occurrence", None)
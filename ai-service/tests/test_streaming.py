@@ -0,0 +1,169 @@
+"""
+Tests for the streaming statistical detector backends
+"""
+import sys
+import time
+import pytest
+import numpy as np
+from app.models.isolation_forest import IsolationForestWrapper
+from app.models.streaming import (
+    CusumDetector,
+    EwmaDetector,
+    HoltDetector,
+    MadDetector,
+    build_backends,
+)
+
+
+def run(detector, values, key="cpu"):
+    return detector.score_batch([(key, float(v)) for v in values])
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("detector", [EwmaDetector(), HoltDetector(), MadDetector(), CusumDetector()],
+                         ids=lambda d: d.name)
+def test_flags_spike_after_quiet_history(detector):
+    """Test every backend flags a large spike and stays quiet on noise"""
+    # Arrange
+    values = np.random.default_rng(0).normal(50, 1, size=300)
+    values[250] = 80.0
+
+    # Act
+    scores, predictions = run(detector, values)
+
+    # Assert
+    assert predictions[250] == -1
+    assert (predictions[:250] == -1).mean() < 0.02
+    assert np.all((scores <= 0) & (scores > -1))
+    assert scores[250] < -0.5
+
+
+@pytest.mark.unit
+def test_warmup_suppresses_alarms():
+    """Test no alarm is raised before a series has enough history"""
+    # Arrange
+    detector = EwmaDetector(warmup=10)
+
+    # Act
+    _, predictions = run(detector, [1.0, 1000.0, 1.0, 1000.0])
+
+    # Assert
+    assert (predictions == 1).all()
+
+
+@pytest.mark.unit
+def test_holt_follows_a_trend():
+    """Test a steady ramp is not anomalous for the trend-aware backend"""
+    # Arrange
+    rng = np.random.default_rng(1)
+    ramp = np.arange(500) * 2.0 + rng.normal(0, 0.5, size=500)
+
+    # Act
+    _, predictions = run(HoltDetector(), ramp)
+
+    # Assert
+    assert (predictions[20:] == -1).mean() < 0.02
+
+
+@pytest.mark.unit
+def test_cusum_detects_small_sustained_shift():
+    """Test CUSUM catches a 1-sigma level shift that 3-sigma bands miss"""
+    # Arrange
+    rng = np.random.default_rng(2)
+    values = np.concatenate([rng.normal(100, 1, size=300), rng.normal(101, 1, size=100)])
+
+    # Act
+    _, cusum = run(CusumDetector(), values)
+    _, ewma = run(EwmaDetector(), values)
+
+    # Assert
+    assert (cusum[:300] == -1).sum() <= 1
+    assert (cusum[300:350] == -1).any()
+    assert not (ewma[300:] == -1).any()
+
+
+@pytest.mark.unit
+def test_mad_ignores_outliers_in_its_window():
+    """Test earlier outliers do not mask the next one"""
+    # Arrange
+    values = np.random.default_rng(3).normal(10, 0.5, size=200)
+    values[[150, 160, 170]] = 30.0
+
+    # Act
+    _, predictions = run(MadDetector(), values)
+
+    # Assert
+    assert list(predictions[[150, 160, 170]]) == [-1, -1, -1]
+
+
+@pytest.mark.unit
+def test_series_are_independent_and_bounded():
+    """Test state is kept per series, for at most max_series series"""
+    # Arrange
+    detector = EwmaDetector(max_series=2)
+    run(detector, np.full(50, 10.0), key="a")
+    run(detector, np.full(50, 1000.0), key="b")
+
+    # Act
+    _, is_anomaly = detector.update("b", 1000.0)
+    run(detector, [5.0], key="c")
+
+    # Assert
+    assert is_anomaly is False
+    assert detector.stats()["series"] == 2
+    assert "a" not in detector._states
+
+
+@pytest.mark.unit
+def test_build_backends_per_metric():
+    """Test metrics sharing a backend share one instance; unknown names fall back"""
+    # Act
+    backends = build_backends({
+        "cpu_usage": "ewma",
+        "load": "ewma",
+        "errors": "cusum",
+        "disk": "isolation_forest",
+        "net": "prophet",
+    })
+
+    # Assert
+    assert set(backends) == {"cpu_usage", "load", "errors"}
+    assert backends["cpu_usage"] is backends["load"]
+    assert isinstance(backends["errors"], CusumDetector)
+
+
+@pytest.mark.slow
+def test_streaming_vs_isolation_forest_benchmark(tmp_path):
+    """Benchmark: points/sec and memory per series against the forest path"""
+    # Arrange
+    rng = np.random.default_rng(0)
+    n_points = 20000
+    values = rng.normal(50, 5, size=n_points)
+    forest = IsolationForestWrapper(str(tmp_path / "series.joblib"))
+    forest.train(values[:2000])
+
+    # Act: one point at a time, as a series sees them
+    results = {}
+    for detector in (EwmaDetector(), HoltDetector(), MadDetector(), CusumDetector()):
+        items = [("series", float(v)) for v in values]
+        start = time.perf_counter()
+        detector.score_batch(items)
+        elapsed = time.perf_counter() - start
+        state = detector._states["series"]
+        memory = sys.getsizeof(state) + sum(
+            getattr(state, slot).nbytes for slot in state.__slots__ if isinstance(getattr(state, slot), np.ndarray)
+        )
+        results[detector.name] = (n_points / elapsed, memory)
+
+    rounds = 2000
+    start = time.perf_counter()
+    for v in values[:rounds]:
+        forest.score_and_predict(np.array([[v]]))
+    results["isolation_forest"] = (rounds / (time.perf_counter() - start), forest.estimate_nbytes())
+
+    # Assert
+    forest_rate, forest_memory = results["isolation_forest"]
+    for name in ("ewma", "holt", "cusum"):
+        assert results[name][0] > forest_rate * 5
+        assert results[name][1] * 100 < forest_memory
+    assert results["mad"][1] * 10 < forest_memory
@@ -0,0 +1,80 @@
+"""
+Tests for the process-pool training engine
+"""
+import os
+import pytest
+import numpy as np
+from app.models.isolation_forest import IsolationForestWrapper
+from app.models.training import TrainingEngine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = TrainingEngine(max_workers=2, tmp_dir=str(tmp_path))
+    yield engine
+    engine.shutdown()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_train_in_worker_process(engine, tmp_path):
+    """Test a model fitted in a worker process is saved and returned loaded"""
+    # Arrange
+    data = np.random.default_rng(0).normal(50, 5, size=(500, 1))
+    model_path = str(tmp_path / "model.joblib")
+
+    # Act
+    model = await engine.train(data, model_path)
+
+    # Assert
+    assert model.is_fitted
+    assert os.path.exists(model_path)
+    scores, predictions = model.score_and_predict(np.array([[50.0], [500.0]]))
+    assert predictions.tolist() == [1, -1]
+    # Temporary training data is cleaned up
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".npy")]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_train_many_in_parallel(engine, tmp_path):
+    """Test several series are fitted and failures are isolated"""
+    # Arrange
+    rng = np.random.default_rng(1)
+    datasets = {
+        "cpu_usage": (rng.normal(50, 5, size=300), str(tmp_path / "cpu.joblib")),
+        "memory_usage": (rng.normal(1e9, 1e7, size=300), str(tmp_path / "mem.joblib")),
+        "broken": (rng.normal(0, 1, size=300), str(tmp_path / "missing-dir" / "x.joblib")),
+    }
+
+    # Act
+    models = await engine.train_many(datasets)
+
+    # Assert
+    assert set(models) == {"cpu_usage", "memory_usage"}
+    _, predictions = models["memory_usage"].score_and_predict(np.array([[1e9], [50.0]]))
+    assert predictions.tolist() == [1, -1]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_update_extends_base_model(engine, tmp_path):
+    """Test an incremental update is fitted from the base model into a new file"""
+    # Arrange
+    rng = np.random.default_rng(2)
+    base = await engine.train(rng.normal(50, 5, size=500), str(tmp_path / "base.joblib"))
+    model_path = str(tmp_path / "next.joblib")
+
+    # Act
+    model = await engine.update(rng.normal(80, 5, size=500), base.model_path, model_path, 10, 100)
+
+    # Assert
+    assert model.model_path == model_path
+    assert model.compiled.n_trees == 100
+    # The base model file is left untouched
+    reloaded = IsolationForestWrapper(base.model_path)
+    reloaded.load()
+    X = np.array([[50.0], [80.0]])
+    np.testing.assert_array_equal(reloaded.score_samples(X), base.score_samples(X))
+    _, predictions = model.score_and_predict(np.array([[80.0]]))
+    assert predictions.tolist() == [1]
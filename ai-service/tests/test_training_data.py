@@ -0,0 +1,169 @@
+"""
+Tests for the streaming training data loader
+"""
+import struct
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.features import FEATURE_NAMES, compute_features
+from app.models.training_data import (
+    BinaryCopyDecoder,
+    ReservoirSampler,
+    TrainingDataLoader,
+    COPY_SIGNATURE,
+)
+
+
+def binary_copy(values) -> bytes:
+    """Encode values the way COPY ... TO STDOUT (FORMAT binary) does"""
+    out = COPY_SIGNATURE + struct.pack('>ii', 0, 0)
+    for v in values:
+        out += struct.pack('>hid', 1, 8, v)
+    return out + struct.pack('>h', -1)
+
+
+@pytest.mark.unit
+def test_reservoir_keeps_everything_under_budget():
+    """Test all values are kept while the budget is not exceeded"""
+    # Arrange
+    sampler = ReservoirSampler(10)
+
+    # Act
+    sampler.add(np.arange(4.0))
+    sampler.add(np.arange(4.0, 7.0))
+
+    # Assert
+    np.testing.assert_array_equal(sampler.result(), np.arange(7.0))
+
+
+@pytest.mark.unit
+def test_reservoir_sample_is_bounded_and_uniform():
+    """Test the reservoir stays at capacity and samples the stream uniformly"""
+    # Arrange
+    sampler = ReservoirSampler(2000, np.random.default_rng(0))
+
+    # Act
+    for start in range(0, 100000, 7000):
+        sampler.add(np.arange(start, min(start + 7000, 100000), dtype=np.float64))
+
+    # Assert
+    result = sampler.result()
+    assert len(result) == 2000
+    assert sampler.seen == 100000
+    assert len(np.unique(result)) == 2000
+    # Each half of the stream is equally represented
+    assert abs((result < 50000).mean() - 0.5) < 0.05
+
+
+@pytest.mark.unit
+def test_binary_copy_decoder_handles_split_chunks():
+    """Test values split across arbitrary chunk boundaries are decoded"""
+    # Arrange
+    values = np.random.default_rng(0).normal(size=1000)
+    payload = binary_copy(values)
+    decoder = BinaryCopyDecoder()
+
+    # Act
+    decoded = [decoder.feed(payload[i:i + 37]) for i in range(0, len(payload), 37)]
+
+    # Assert
+    np.testing.assert_array_equal(np.concatenate(decoded), values)
+    assert decoder.finished
+
+
+@pytest.mark.unit
+def test_binary_copy_decoder_rejects_bad_signature():
+    """Test non-COPY input is rejected"""
+    with pytest.raises(ValueError):
+        BinaryCopyDecoder().feed(b'x' * 40)
+
+
+@pytest.mark.unit
+def test_build_query_filters():
+    """Test metric, labels, window and sampling are all pushed to SQL"""
+    # Act
+    query, args = TrainingDataLoader()._build_query("cpu_usage", '{"host": "a"}', 24, 10)
+
+    # Assert
+    assert "TABLESAMPLE SYSTEM (10.0)" in query
+    assert "metric_name = $1" in query
+    assert "labels @> $2::jsonb" in query
+    assert "make_interval(secs => $3)" in query
+    assert args == ["cpu_usage", '{"host": "a"}', 24 * 3600.0]
+
+
+@pytest.mark.unit
+def test_build_query_holdout():
+    """Test the evaluation holdout excludes the most recent rows"""
+    # Act
+    query, args = TrainingDataLoader()._build_query(None, None, 168, None, holdout_hours=6)
+
+    # Assert
+    assert "timestamp >= NOW() - make_interval(secs => $1)" in query
+    assert "timestamp < NOW() - make_interval(secs => $2)" in query
+    assert args == [168 * 3600.0, 6 * 3600.0]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_load_copy_streams_into_budget(mock_db_pool):
+    """Test COPY output is decoded chunk by chunk into a bounded array"""
+    # Arrange
+    values = np.arange(5000, dtype=np.float64)
+    payload = binary_copy(values)
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+
+    async def copy_from_query(query, *args, output, format, timeout):
+        for i in range(0, len(payload), 4096):
+            await output(payload[i:i + 4096])
+
+    conn.copy_from_query = copy_from_query
+    loader = TrainingDataLoader(method="copy", seed=0)
+
+    with patch('app.models.training_data.get_db_pool', return_value=mock_db_pool):
+        # Act
+        data = await loader.load(metric_name="cpu_usage", row_budget=1000)
+
+    # Assert
+    assert data.dtype == np.float64
+    assert len(data) == 1000
+    assert set(data).issubset(set(values))
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_load_features_per_series_across_chunks(mock_db_pool):
+    """Test feature rows are computed per series, with history carried across chunks"""
+    # Arrange
+    ts = np.arange(30, dtype=np.float64) * 10
+    cpu = np.linspace(10, 40, 30)
+    mem = np.full(30, 500.0)
+    records = [("cpu{}", t, v) for t, v in zip(ts, cpu)] + [("mem{}", t, v) for t, v in zip(ts, mem)]
+
+    class Cursor:
+        def __init__(self):
+            self.position = 0
+
+        async def fetch(self, n, timeout=None):
+            chunk = records[self.position:self.position + n]
+            self.position += n
+            return chunk
+
+    conn = mock_db_pool.acquire.return_value.__aenter__.return_value
+    conn.transaction = MagicMock()
+    conn.cursor = AsyncMock(return_value=Cursor())
+    loader = TrainingDataLoader(chunk_size=7, method="copy", seed=0)
+
+    with patch('app.models.training_data.get_db_pool', return_value=mock_db_pool):
+        # Act
+        data = await loader.load(row_budget=1000, sample_percent=5.0, feature_window=5)
+
+    # Assert
+    assert data.shape == (60, len(FEATURE_NAMES))
+    query = conn.cursor.call_args[0][0]
+    assert "ORDER BY series, timestamp" in query
+    assert "TABLESAMPLE" not in query
+    expected = np.vstack([compute_features(cpu, ts, 5), compute_features(mem, ts, 5)])
+    np.testing.assert_allclose(np.sort(data, axis=0), np.sort(expected, axis=0))
+    # The memory series starts fresh: no delta against the last cpu point
+    assert not np.any(np.isclose(data[:, 1], 500.0 - 40.0))
@@ -138,3 +138,76 @@ CREATE INDEX IF NOT EXISTS idx_ai_analysis_reference
 ON ai_analysis_results(reference_analysis_id);
 
 COMMENT ON COLUMN ai_analysis_results.reference_analysis_id IS 'References another analysis (for duplicate alerts)';
+
+-- Migration: Add checkpoints for resumable background jobs
+-- Jobs that walk a table in key ranges (e.g. the metrics.is_anomaly backfill)
+-- store the last key they fully processed, in the same transaction as their writes
+
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+    job_name VARCHAR(100) PRIMARY KEY,
+    position BIGINT NOT NULL DEFAULT 0,
+    state JSONB DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE job_checkpoints IS 'Resume positions of background jobs (last processed key per job)';
+COMMENT ON COLUMN job_checkpoints.position IS 'Last key fully processed, e.g. metrics.id for the is_anomaly backfill';
+
+-- Migration: Add alert_state (current state per alert_name + instance)
+-- Deduplication and recovery auto-resolution read and update this one row
+-- instead of searching the alerts history, so both cost O(1) per alert
+
+CREATE TABLE IF NOT EXISTS alert_state (
+    alert_name VARCHAR(255) NOT NULL,
+    instance VARCHAR(255) NOT NULL DEFAULT '',
+    severity VARCHAR(50),
+    last_alert_id UUID REFERENCES alerts(id) ON DELETE SET NULL,
+    last_analysis_id UUID,
+    firing_alert_ids UUID[] NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (alert_name, instance)
+);
+
+-- Seed from the existing history: last analyzed alert per key...
+INSERT INTO alert_state (alert_name, instance, severity, last_alert_id, last_analysis_id)
+SELECT DISTINCT ON (a.alert_name, COALESCE(a.labels->>'instance', ''))
+    a.alert_name,
+    COALESCE(a.labels->>'instance', ''),
+    a.severity,
+    a.id,
+    r.id
+FROM alerts a
+INNER JOIN ai_analysis_results r
+    ON a.id = r.alert_id
+    AND r.analysis_type = 'llm_analysis'
+WHERE a.is_duplicate = FALSE
+ORDER BY a.alert_name, COALESCE(a.labels->>'instance', ''), a.created_at DESC
+ON CONFLICT (alert_name, instance) DO NOTHING;
+
+-- ...and the alerts still firing
+INSERT INTO alert_state (alert_name, instance, firing_alert_ids)
+SELECT alert_name, COALESCE(labels->>'instance', ''), array_agg(id ORDER BY created_at)
+FROM alerts
+WHERE status = 'firing'
+GROUP BY alert_name, COALESCE(labels->>'instance', '')
+ON CONFLICT (alert_name, instance) DO UPDATE
+SET firing_alert_ids = EXCLUDED.firing_alert_ids;
+
+COMMENT ON TABLE alert_state IS 'Current state per alert_name + instance, maintained by the AI service consumer';
+COMMENT ON COLUMN alert_state.severity IS 'Severity of the last analyzed (non-duplicate) alert';
+COMMENT ON COLUMN alert_state.last_analysis_id IS 'llm_analysis row of last_alert_id (written behind, may lag briefly)';
+COMMENT ON COLUMN alert_state.firing_alert_ids IS 'Alerts still firing, resolved together on recovery';
+
+-- Migration: Add model verdicts to metrics
+-- The backfill and replay write-back store what a model thinks of a row in
+-- model_anomaly / model_version; is_anomaly stays the ground-truth label
+-- the model evaluation scores against
+
+ALTER TABLE metrics ADD COLUMN IF NOT EXISTS model_anomaly BOOLEAN;
+ALTER TABLE metrics ADD COLUMN IF NOT EXISTS model_version VARCHAR(50);
+
+CREATE INDEX IF NOT EXISTS idx_metrics_model_anomaly ON metrics(model_anomaly) WHERE model_anomaly = TRUE;
+
+COMMENT ON COLUMN metrics.is_anomaly IS 'Ground-truth anomaly label (never written by models)';
+COMMENT ON COLUMN metrics.model_anomaly IS 'Anomaly verdict of model_version (backfill / replay write-back)';
+COMMENT ON COLUMN metrics.model_version IS 'Model version that produced model_anomaly';
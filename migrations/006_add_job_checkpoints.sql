@@ -0,0 +1,13 @@
+-- Migration: Add checkpoints for resumable background jobs
+-- Jobs that walk a table in key ranges (e.g. the metrics.is_anomaly backfill)
+-- store the last key they fully processed, in the same transaction as their writes
+
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+    job_name VARCHAR(100) PRIMARY KEY,
+    position BIGINT NOT NULL DEFAULT 0,
+    state JSONB DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE job_checkpoints IS 'Resume positions of background jobs (last processed key per job)';
+COMMENT ON COLUMN job_checkpoints.position IS 'Last key fully processed, e.g. metrics.id for the is_anomaly backfill';
@@ -0,0 +1,44 @@
+-- Migration: Add alert_state (current state per alert_name + instance)
+-- Deduplication and recovery auto-resolution read and update this one row
+-- instead of searching the alerts history, so both cost O(1) per alert
+
+CREATE TABLE IF NOT EXISTS alert_state (
+    alert_name VARCHAR(255) NOT NULL,
+    instance VARCHAR(255) NOT NULL DEFAULT '',
+    severity VARCHAR(50),
+    last_alert_id UUID REFERENCES alerts(id) ON DELETE SET NULL,
+    last_analysis_id UUID,
+    firing_alert_ids UUID[] NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (alert_name, instance)
+);
+
+-- Seed from the existing history: last analyzed alert per key...
+INSERT INTO alert_state (alert_name, instance, severity, last_alert_id, last_analysis_id)
+SELECT DISTINCT ON (a.alert_name, COALESCE(a.labels->>'instance', ''))
+    a.alert_name,
+    COALESCE(a.labels->>'instance', ''),
+    a.severity,
+    a.id,
+    r.id
+FROM alerts a
+INNER JOIN ai_analysis_results r
+    ON a.id = r.alert_id
+    AND r.analysis_type = 'llm_analysis'
+WHERE a.is_duplicate = FALSE
+ORDER BY a.alert_name, COALESCE(a.labels->>'instance', ''), a.created_at DESC
+ON CONFLICT (alert_name, instance) DO NOTHING;
+
+-- ...and the alerts still firing
+INSERT INTO alert_state (alert_name, instance, firing_alert_ids)
+SELECT alert_name, COALESCE(labels->>'instance', ''), array_agg(id ORDER BY created_at)
+FROM alerts
+WHERE status = 'firing'
+GROUP BY alert_name, COALESCE(labels->>'instance', '')
+ON CONFLICT (alert_name, instance) DO UPDATE
+SET firing_alert_ids = EXCLUDED.firing_alert_ids;
+
+COMMENT ON TABLE alert_state IS 'Current state per alert_name + instance, maintained by the AI service consumer';
+COMMENT ON COLUMN alert_state.severity IS 'Severity of the last analyzed (non-duplicate) alert';
+COMMENT ON COLUMN alert_state.last_analysis_id IS 'llm_analysis row of last_alert_id (written behind, may lag briefly)';
+COMMENT ON COLUMN alert_state.firing_alert_ids IS 'Alerts still firing, resolved together on recovery';
@@ -0,0 +1,13 @@
+-- Migration: Add model verdicts to metrics
+-- The backfill and replay write-back store what a model thinks of a row in
+-- model_anomaly / model_version; is_anomaly stays the ground-truth label
+-- the model evaluation scores against
+
+ALTER TABLE metrics ADD COLUMN IF NOT EXISTS model_anomaly BOOLEAN;
+ALTER TABLE metrics ADD COLUMN IF NOT EXISTS model_version VARCHAR(50);
+
+CREATE INDEX IF NOT EXISTS idx_metrics_model_anomaly ON metrics(model_anomaly) WHERE model_anomaly = TRUE;
+
+COMMENT ON COLUMN metrics.is_anomaly IS 'Ground-truth anomaly label (never written by models)';
+COMMENT ON COLUMN metrics.model_anomaly IS 'Anomaly verdict of model_version (backfill / replay write-back)';
+COMMENT ON COLUMN metrics.model_version IS 'Model version that produced model_anomaly';